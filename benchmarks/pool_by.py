@@ -0,0 +1,114 @@
+'''
+Benchmarks ``pooling.pool_by`` against the original per-group ``apply``
+implementation and checks that both produce identical output.
+
+Usage: python benchmarks/pool_by.py [replicates] [clones per replicate] [jobs]
+'''
+import sys
+import time
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from hicutils.core import pooling
+from hicutils.core.io import _cols_without
+
+
+def _legacy_aggregate_pool(pool_df, pool_by):
+    name = pool_df.name
+    # Stable so ties keep their row order as in ``pooling._sort_pools``
+    pool_df = pool_df.sort_values('copies', ascending=False, kind='stable')
+    pool_df['avg_v_identity'] = (
+        pool_df['avg_v_identity'] * pool_df['copies']
+    )
+    funcs = {c: 'first' for c in pool_df.columns if 'METADATA_' not in c}
+    funcs.update({
+        'instances': np.sum,
+        'copies': np.sum,
+        'top_copy_seq': lambda s: s.iloc[0],
+        'avg_v_identity': np.sum
+    })
+    pool_df = pool_df.groupby('clone_id', as_index=False).agg(funcs)
+    total_copies_by_clone = pool_df.groupby('clone_id').copies.sum()
+    pool_df['total_copies'] = pool_df['clone_id'].apply(
+        lambda c: total_copies_by_clone.loc[c]
+    )
+    pool_df['avg_v_identity'] /= pool_df['total_copies']
+    pool_df = pool_df.drop('total_copies', axis=1)
+
+    pool_df['shm'] = (100 * (1 - pool_df['avg_v_identity'])).round(4)
+    pool_df['copies_fraction'] = pool_df['copies'] / pool_df['copies'].sum()
+    pool_df['copies_percent'] = 100 * pool_df['copies_fraction']
+    pool_df[[p.replace('METADATA_', '') for p in pool_by]] = name
+    return pool_df.reset_index(drop=True)
+
+
+def legacy_pool_by(df, pool_by):
+    pool_by = pooling._pool_columns(pool_by)
+    df = df.groupby(pool_by, dropna=False).apply(
+        _legacy_aggregate_pool, pool_by
+    )
+    return (
+        df[_cols_without(df, 'METADATA_')]
+        .reset_index(drop=True)
+        .drop('replicate_name', axis=1)
+    )
+
+
+def make_data(replicates, clones, seed=0):
+    rng = np.random.default_rng(seed)
+    subjects = max(1, replicates // 4)
+    dfs = []
+    for r in range(replicates):
+        subject = r % subjects
+        n = int(clones * rng.uniform(.5, 1))
+        clone_ids = rng.choice(clones, n, replace=False) + subject * clones
+        copies = rng.zipf(1.8, n).clip(max=10000)
+        dfs.append(pd.DataFrame({
+            'clone_id': clone_ids,
+            'subject': f'S{subject}',
+            'v_gene': rng.choice(['IGHV1-2', 'IGHV3-23', 'IGHV4-34'], n),
+            'cdr3_aa': [f'CAR{c % 997}W' for c in clone_ids],
+            'instances': np.minimum(copies, rng.integers(1, 10, n)),
+            'copies': copies,
+            'avg_v_identity': rng.uniform(.8, 1, n).round(4),
+            'top_copy_seq': [f'SEQ{c}_{r}' for c in clone_ids],
+            'replicate_name': f'rep{r}',
+            'clones': 1,
+            'METADATA_tissue': ['SPL', 'PLN', None][r % 3],
+        }))
+    return pd.concat(dfs)
+
+
+def main(replicates=40, clones=5000, n_jobs=4):
+    df = make_data(replicates, clones)
+    print(f'{len(df)} rows, {replicates} replicates')
+    for pool in ('subject', ['subject', 'tissue']):
+        start = time.perf_counter()
+        expected = legacy_pool_by(df, pool)
+        legacy = time.perf_counter() - start
+
+        start = time.perf_counter()
+        pooled = pooling.pool_by(df, pool)
+        vectorized = time.perf_counter() - start
+
+        start = time.perf_counter()
+        parallel = pooling.pool_by(df, pool, n_jobs=n_jobs)
+        multicore = time.perf_counter() - start
+
+        # pandas only warns about mismatched null-like values such as None
+        # and NaN so warnings are raised as errors
+        with warnings.catch_warnings():
+            warnings.simplefilter('error')
+            pd.testing.assert_frame_equal(pooled, expected)
+            pd.testing.assert_frame_equal(parallel, expected)
+        print(
+            f'pool_by({pool!r}): legacy {legacy:.2f}s, '
+            f'vectorized {vectorized:.2f}s ({legacy / vectorized:.1f}x), '
+            f'{n_jobs} jobs {multicore:.2f}s ({legacy / multicore:.1f}x)'
+        )
+
+
+if __name__ == '__main__':
+    main(*[int(a) for a in sys.argv[1:]])
@@ -1,2 +1,6 @@
-from hicutils.core import filters, io, metadata, pooling  # noqa: F401
+__version__ = '0.0.1'
+
+from hicutils.core import (  # noqa: F401
+    bootstrap, diversity, filters, io, matrix, metadata, pooling, sampling
+)
 import hicutils.plots as plots  # noqa: F401
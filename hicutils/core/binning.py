@@ -0,0 +1,47 @@
+import numpy as np
+import pandas as pd
+
+
+def bucketize(values, edges, label):
+    '''
+    Assigns each of ``values`` to a bucket with ``np.digitize``.  Buckets are
+    left-closed, ``[edges[i], edges[i + 1])``, followed by a final
+    open-ended bucket for values of at least ``edges[-1]``.
+
+    Parameters
+    ----------
+    values : array-like
+        The values to bucket.
+    edges : list
+        The ascending lower bound of each bucket.
+    label : function
+        Called as ``label(start, end)`` once per bucket to create its label,
+        where ``end`` is ``None`` for the final bucket.
+
+    Returns
+    -------
+    An ordered ``pd.Categorical`` of bucket labels.  Null values and those
+    less than ``edges[0]`` are null.
+
+    Examples
+    --------
+    .. code-block:: python
+
+        >>> bucketize([0.5, 3, 30], [0, 1, 10],
+                      lambda s, e: f'[{s}-{e})' if e is not None
+                      else f'{s}+')
+        ['[0-1)', '[1-10)', '10+']
+        Categories (3, object): ['[0-1)' < '[1-10)' < '10+']
+
+    '''
+    values = np.asarray(values, dtype=float)
+    codes = np.digitize(values, edges) - 1
+    codes[np.isnan(values)] = -1
+    return pd.Categorical.from_codes(
+        codes,
+        categories=[
+            label(start, end)
+            for start, end in zip(edges, [*edges[1:], None])
+        ],
+        ordered=True
+    )
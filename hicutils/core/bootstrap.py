@@ -0,0 +1,204 @@
+import numpy as np
+import pandas as pd
+from scipy.special import xlogy
+
+from .keys import clone_keys
+from .parallel import get_n_jobs, map_jobs
+
+# The maximum number of values in each batch of replicates, bounding memory
+_BATCH_VALUES = 10 ** 7
+
+
+def _richness(counts, shm):
+    return (counts > 0).sum(axis=1).astype(float)
+
+
+def _shannon(counts, shm):
+    freqs = counts / counts.sum(axis=1, keepdims=True)
+    return -xlogy(freqs, freqs).sum(axis=1)
+
+
+def _simpson(counts, shm):
+    freqs = counts / counts.sum(axis=1, keepdims=True)
+    return (freqs ** 2).sum(axis=1)
+
+
+def _gini_simpson(counts, shm):
+    return 1 - _simpson(counts, shm)
+
+
+def _clonality(counts, shm):
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return 1 - _shannon(counts, shm) / np.log(_richness(counts, shm))
+
+
+def _shm(counts, shm):
+    return counts @ shm / counts.sum(axis=1)
+
+
+def _top(n):
+    def top(counts, shm):
+        n_top = min(n, counts.shape[1])
+        largest = -np.partition(-counts, n_top - 1, axis=1)[:, :n_top]
+        return largest.sum(axis=1) / counts.sum(axis=1)
+    return top
+
+
+BOOTSTRAP_METRICS = {
+    'richness': _richness,
+    'shannon': _shannon,
+    'simpson': _simpson,
+    'gini_simpson': _gini_simpson,
+    'clonality': _clonality,
+    'shm': _shm,
+}
+
+
+def _kernel(metric):
+    if metric.startswith('top_'):
+        return _top(int(metric[len('top_'):]))
+    assert metric in BOOTSTRAP_METRICS, f'Unknown metric {metric}'
+    return BOOTSTRAP_METRICS[metric]
+
+
+def _bootstrap_pools(pools, metrics, replicates):
+    # ``pools`` are ``(sizes, shm, seed)`` tuples.  Returns an array of shape
+    # (metrics, replicates) for each pool
+    kernels = [_kernel(m) for m in metrics]
+    results = []
+    for sizes, shm, seed in pools:
+        rng = np.random.default_rng(seed)
+        total = int(sizes.sum())
+        batch = max(1, _BATCH_VALUES // len(sizes))
+        values = np.empty((len(metrics), replicates))
+        for start in range(0, replicates, batch):
+            counts = rng.multinomial(
+                total, sizes / total, size=min(batch, replicates - start)
+            )
+            for i, kernel in enumerate(kernels):
+                values[i, start:start + len(counts)] = kernel(counts, shm)
+        results.append(values)
+    return results
+
+
+def bootstrap_metrics(df, pool, metrics=('clonality', 'top_10', 'shm'),
+                      replicates=1000, ci=95, seed=None, n_jobs=1,
+                      clone_features=('clone_id',), return_replicates=False):
+    '''
+    Calculates bootstrap confidence intervals of per-pool metrics.  Each
+    replicate resamples the copies of a pool's clones with a multinomial
+    draw and replicates are drawn in batches as ``(replicates, clones)``
+    matrices so each metric is evaluated on all replicates of a batch at
+    once.
+
+    Each pool is drawn from its own random stream spawned from ``seed`` so
+    results are reproducible and identical for any ``n_jobs``.
+
+    Parameters
+    ----------
+    df : pd.DataFrame
+        The DataFrame of clones.
+    pool : str
+        The pooling column.
+    metrics : list(str)
+        The metrics to calculate, any of ``richness``, ``shannon``,
+        ``simpson``, ``gini_simpson``, ``clonality``, ``shm`` (the
+        copy-weighted mean SHM) or ``top_<n>`` (the fraction of copies in the
+        ``n`` largest clones, e.g. ``top_10``).
+    replicates : int
+        The number of bootstrap replicates.
+    ci : float
+        The width of the confidence interval as a percentage.
+    seed : int or np.random.SeedSequence, optional
+        The random seed.
+    n_jobs : int, optional
+        The number of processes to use.  If greater than ``1`` (or ``-1`` for
+        all cores), pools are spread across processes.
+    clone_features : str or list(str)
+        The feature(s) defining a clone, ``clone_id`` by default.  Rows of
+        the same clone in a pool are summed.
+    return_replicates : bool
+        If ``True``, the value of each metric in every replicate is returned
+        instead of the confidence intervals.
+
+    Returns
+    -------
+    A ``pd.DataFrame`` indexed by pool with the observed value of each
+    metric along with ``<metric>_low`` and ``<metric>_high`` bounds of its
+    confidence interval.  If ``return_replicates`` is ``True``, a
+    ``pd.DataFrame`` indexed by pool and ``replicate`` with one column per
+    metric.
+
+    '''
+    metrics = list(metrics)
+    for metric in metrics:
+        _kernel(metric)
+
+    pools, names = clone_keys(df, pool)
+    clones, uniques = clone_keys(df, clone_features, sort=False)
+    copies = df['copies'].to_numpy().astype(float)
+    shm = df['shm'].to_numpy().astype(float) if 'shm' in metrics else (
+        np.zeros(len(df))
+    )
+    valid = (pools >= 0) & (clones >= 0) & (copies > 0)
+
+    # The copies and copy-weighted mean SHM of each (pool, clone) pair
+    pairs, pair_rows = np.unique(
+        pools[valid].astype(np.int64) * max(1, len(uniques)) + clones[valid],
+        return_inverse=True
+    )
+    sizes = np.bincount(pair_rows, weights=copies[valid])
+    pair_shm = np.bincount(
+        pair_rows, weights=copies[valid] * shm[valid]
+    ) / sizes
+    pair_pools = pairs // max(1, len(uniques))
+    bounds = np.flatnonzero(np.diff(pair_pools)) + 1
+    present = pair_pools[np.r_[0, bounds]] if len(pairs) else pair_pools
+
+    if not isinstance(seed, np.random.SeedSequence):
+        seed = np.random.SeedSequence(seed)
+    seeds = seed.spawn(len(names))
+    items = [
+        (s, v, seeds[p]) for s, v, p in zip(
+            np.split(sizes, bounds), np.split(pair_shm, bounds), present
+        )
+    ]
+    n_jobs = get_n_jobs(n_jobs)
+    step = max(1, -(-len(items) // (4 * n_jobs)))
+    values = [
+        v
+        for chunk in map_jobs(
+            _bootstrap_pools,
+            [items[i:i + step] for i in range(0, len(items), step)],
+            n_jobs, metrics, replicates
+        )
+        for v in chunk
+    ]
+
+    index = names[present]
+    values = (
+        np.stack(values) if values
+        else np.empty((0, len(metrics), replicates))
+    )
+    if return_replicates:
+        return pd.DataFrame(
+            values.transpose(0, 2, 1).reshape(-1, len(metrics)),
+            index=pd.MultiIndex.from_product(
+                [index, range(replicates)], names=[pool, 'replicate']
+            ),
+            columns=metrics
+        )
+
+    pdf = pd.DataFrame(
+        [[_kernel(m)(s[None, :], v)[0] for m in metrics]
+         for s, v, _ in items],
+        index=index,
+        columns=metrics
+    )
+    tail = (100 - ci) / 2
+    with np.errstate(invalid='ignore'):
+        low, high = np.nanpercentile(values, [tail, 100 - tail], axis=2)
+    for i, metric in enumerate(metrics):
+        pdf[f'{metric}_low'] = low[:, i]
+        pdf[f'{metric}_high'] = high[:, i]
+    return pdf
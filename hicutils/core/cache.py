@@ -0,0 +1,201 @@
+import functools
+import hashlib
+import inspect
+import os
+import pickle
+import tempfile
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from hicutils import __version__
+
+_LOCK = threading.Lock()
+_CACHE = OrderedDict()
+# Memoization is disabled until ``configure_cache`` is called as
+# fingerprinting a large DataFrame can cost as much as the computation
+_CONFIG = {'enabled': False, 'maxsize': 32, 'path': None}
+
+
+class _Uncacheable(Exception):
+    pass
+
+
+def _update(h, obj):
+    # Feeds a type-tagged representation of ``obj`` to the hash ``h``
+    h.update(type(obj).__name__.encode())
+    if obj is None or isinstance(obj, (bool, int, float, complex, str, bytes,
+                                       np.generic)):
+        h.update(repr(obj).encode())
+    elif isinstance(obj, (list, tuple)):
+        h.update(str(len(obj)).encode())
+        for item in obj:
+            _update(h, item)
+    elif isinstance(obj, (set, frozenset, dict)):
+        # Unordered items are hashed in an order independent of insertion
+        items = obj.items() if isinstance(obj, dict) else obj
+        for digest in sorted(fingerprint(item) for item in items):
+            h.update(digest.encode())
+    elif isinstance(obj, np.ndarray):
+        if obj.dtype == object:
+            _update(h, obj.tolist())
+        else:
+            h.update(f'{obj.dtype.str}{obj.shape}'.encode())
+            h.update(np.ascontiguousarray(obj).tobytes())
+    elif isinstance(obj, (pd.DataFrame, pd.Series, pd.Index)):
+        # The repr of categorical dtypes includes their categories
+        if isinstance(obj, pd.DataFrame):
+            labels = [list(obj.dtypes), list(obj.columns), obj.index.names]
+        elif isinstance(obj, pd.Series):
+            labels = [obj.dtype, obj.name, obj.index.names]
+        else:
+            labels = [obj.dtype, obj.names]
+        h.update(repr(labels).encode())
+        try:
+            hashes = pd.util.hash_pandas_object(
+                obj, index=not isinstance(obj, pd.Index)
+            )
+        except TypeError:
+            # e.g. columns of lists
+            h.update(pickle.dumps(obj))
+        else:
+            h.update(np.asarray(hashes).tobytes())
+    else:
+        # Functions, iterators etc. have no stable content to hash
+        raise _Uncacheable(type(obj).__name__)
+
+
+def fingerprint(obj):
+    '''
+    Returns a hex digest of the contents of ``obj`` which may be a DataFrame,
+    Series, numpy array or (nested) builtin value.  DataFrames are hashed one
+    column at a time with ``pd.util.hash_pandas_object`` which takes roughly a
+    second per million rows.
+
+    '''
+    h = hashlib.blake2b(digest_size=16)
+    _update(h, obj)
+    return h.hexdigest()
+
+
+def configure_cache(maxsize=32, path=None, enabled=True):
+    '''
+    Enables and configures the cache used by memoized functions such as the
+    ``compute_*`` plot data functions.  The cache is disabled by default as
+    every call to a memoized function fingerprints all of its arguments,
+    which for DataFrames with millions of rows can take as long as the
+    computation itself.  It is most useful when repeatedly restyling plots of
+    the same data, e.g. in a notebook.
+
+    Parameters
+    ----------
+    maxsize : int
+        The number of results kept in memory, with the least recently used
+        evicted first.  ``0`` disables the in-memory cache.
+    path : str, optional
+        A directory in which results are also pickled so they persist across
+        sessions.  By default results are only cached in memory.
+    enabled : bool
+        Set to ``False`` to disable the cache again.
+
+    '''
+    with _LOCK:
+        _CONFIG.update(enabled=enabled, maxsize=maxsize, path=path)
+        while len(_CACHE) > maxsize:
+            _CACHE.popitem(last=False)
+    if path:
+        os.makedirs(path, exist_ok=True)
+
+
+def clear_cache():
+    '''
+    Removes all results from the in-memory cache.  Results pickled to disk are
+    left in place.
+
+    '''
+    with _LOCK:
+        _CACHE.clear()
+
+
+def _get(key):
+    with _LOCK:
+        if key in _CACHE:
+            _CACHE.move_to_end(key)
+            return True, _CACHE[key]
+        path = _CONFIG['path']
+    if path:
+        try:
+            with open(os.path.join(path, f'{key}.pkl'), 'rb') as fh:
+                result = pickle.load(fh)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            return False, None
+        _put_memory(key, result)
+        return True, result
+    return False, None
+
+
+def _put_memory(key, result):
+    with _LOCK:
+        if _CONFIG['maxsize'] > 0:
+            _CACHE[key] = result
+            _CACHE.move_to_end(key)
+            while len(_CACHE) > _CONFIG['maxsize']:
+                _CACHE.popitem(last=False)
+
+
+def _put(key, result):
+    _put_memory(key, result)
+    path = _CONFIG['path']
+    if path:
+        # Written to a temporary file first so readers never see a partial
+        # result
+        fd, tmp = tempfile.mkstemp(dir=path, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as fh:
+            pickle.dump(result, fh, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, os.path.join(path, f'{key}.pkl'))
+
+
+def _copy(result):
+    # Callers receive copies so modifying a result never alters the cache
+    if isinstance(result, (pd.DataFrame, pd.Series)):
+        return result.copy()
+    if isinstance(result, tuple):
+        return tuple(_copy(r) for r in result)
+    return result
+
+
+def memoize(func):
+    '''
+    Decorates ``func`` so, when the cache is enabled with
+    ``configure_cache``, its results are cached by a fingerprint of its
+    arguments (see ``fingerprint``) and the ``hicutils`` version.  Calls with
+    arguments which cannot be fingerprinted, such as functions or iterators
+    of DataFrames, are never cached.
+
+    '''
+    signature = inspect.signature(func)
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if not _CONFIG['enabled']:
+            return func(*args, **kwargs)
+        bound = signature.bind(*args, **kwargs)
+        bound.apply_defaults()
+        try:
+            # The version is part of the key so results pickled to disk are
+            # not reused after an upgrade
+            key = fingerprint(
+                (__version__, func.__module__, func.__qualname__,
+                 list(bound.arguments.items()))
+            )
+        except _Uncacheable:
+            return func(*args, **kwargs)
+
+        found, result = _get(key)
+        if not found:
+            result = func(*args, **kwargs)
+            _put(key, result)
+        return _copy(result)
+    return wrapper
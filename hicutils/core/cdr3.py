@@ -0,0 +1,174 @@
+import numpy as np
+import pandas as pd
+
+
+def _encode(seqs):
+    # Returns the characters of all ``seqs`` as one ``uint8`` buffer along
+    # with the index of the sequence each character came from
+    lengths = seqs.str.len().to_numpy()
+    chars = np.frombuffer(''.join(seqs).encode('ascii'), dtype=np.uint8)
+    return chars, np.repeat(np.arange(len(seqs)), lengths)
+
+
+def _weights(df, pool, size_metric):
+    # Counts each clone once per pool when sizing by clones
+    if size_metric == 'clones':
+        df = df.drop_duplicates([pool, 'clone_id'])
+    return df, df[size_metric].to_numpy()
+
+
+def aa_composition(df, pool, size_metric='clones', field='cdr3_aa'):
+    '''
+    Counts the characters of the CDR3s in each pool, weighting each CDR3 by
+    ``size_metric``.  All CDR3s are encoded into one byte buffer and counted
+    with a single ``np.bincount`` over (pool, character) codes.
+
+    Parameters
+    ----------
+    df : pd.DataFrame
+        The DataFrame of clones.
+    pool : str
+        The pooling column to use for each row of the result.
+    size_metric : str
+        The weight of each CDR3, one of ``clones``, ``copies``, or
+        ``uniques``.  When ``clones``, each clone (``clone_id``) is counted
+        once per pool.
+    field : str
+        The column of sequences, ``cdr3_aa`` by default.
+
+    Returns
+    -------
+    A ``pd.DataFrame`` with one row per pool and one column per character.
+
+    '''
+    assert size_metric in ('clones', 'copies', 'uniques')
+    df = df[df[pool].notna() & df[field].notna()]
+    df, weights = _weights(df, pool, size_metric)
+
+    pools, names = pd.factorize(df[pool], sort=True)
+    # Plain values so categorical pools do not give a categorical index
+    names = np.asarray(names)
+    chars, rows = _encode(df[field])
+    counts = np.bincount(
+        pools[rows] * 256 + chars,
+        weights=weights[rows].astype(float),
+        minlength=len(names) * 256
+    ).reshape(len(names), 256)
+
+    used = np.flatnonzero(np.bincount(chars, minlength=256))
+    return pd.DataFrame(
+        counts[:, used],
+        index=pd.Index(names),
+        columns=[chr(c) for c in used]
+    )
+
+
+def position_counts(df, by='cdr3_aa', pool=None, size_metric=None):
+    '''
+    Counts the characters at each position of the CDR3s of every length (and
+    optionally every pool) in a single pass.  Sequences are grouped by
+    (pool, length) and every character is counted at its offset within the
+    group's block of positions with one ``np.bincount``.
+
+    Parameters
+    ----------
+    df : pd.DataFrame
+        The DataFrame of clones.
+    by : str
+        The column of sequences, e.g. ``cdr3_aa`` or ``cdr3_nt``.
+    pool : str, optional
+        If specified, counts are calculated separately for each pool.
+    size_metric : str, optional
+        If specified, the weight of each CDR3, one of ``clones``, ``copies``,
+        or ``uniques``.  When ``clones``, each clone is counted once (per
+        pool).  By default each row has a weight of one.
+
+    Returns
+    -------
+    A ``pd.DataFrame`` indexed by ``pool`` (if specified), ``length`` and
+    ``pos`` with one column per character, which is empty if ``df`` has no
+    CDR3s.  The position frequency matrix for one length can be retrieved
+    with ``position_matrix``.
+
+    '''
+    assert size_metric in (None, 'clones', 'copies', 'uniques')
+    keys = [pool] if pool else []
+    df = df[df[[by, *keys]].notna().all(axis=1)]
+    if size_metric == 'clones':
+        df = df.drop_duplicates([*keys, 'clone_id'])
+    weights = (
+        df[size_metric].to_numpy() if size_metric else np.ones(len(df))
+    )
+
+    lengths = df[by].str.len().to_numpy()
+    width = lengths.max(initial=0) + 1
+    if pool:
+        pools, names = pd.factorize(df[pool], sort=True)
+        names = np.asarray(names)
+    else:
+        pools, names = np.zeros(len(df), dtype=np.int64), None
+    # One group of positions per (pool, length)
+    groups, group_rows = np.unique(
+        pools.astype(np.int64) * width + lengths,
+        return_inverse=True
+    )
+    group_lengths = groups % width
+    starts = np.cumsum(group_lengths) - group_lengths
+
+    chars, rows = _encode(df[by])
+    positions = np.arange(len(chars)) - np.repeat(
+        np.cumsum(lengths) - lengths, lengths
+    )
+    alphabet = np.flatnonzero(np.bincount(chars, minlength=256))
+    codes = np.zeros(256, dtype=np.int64)
+    codes[alphabet] = np.arange(len(alphabet))
+    chars = codes[chars]
+    counts = np.bincount(
+        (starts[group_rows[rows]] + positions) * len(alphabet) + chars,
+        weights=weights[rows].astype(float),
+        minlength=group_lengths.sum() * len(alphabet)
+    ).reshape(group_lengths.sum(), len(alphabet))
+
+    index = [
+        np.repeat(group_lengths, group_lengths),
+        np.arange(group_lengths.sum()) - np.repeat(starts, group_lengths),
+    ]
+    if pool:
+        index.insert(0, names[np.repeat(groups // width, group_lengths)])
+    return pd.DataFrame(
+        counts,
+        index=pd.MultiIndex.from_arrays(index, names=[*keys, 'length', 'pos']),
+        columns=[chr(c) for c in alphabet]
+    )
+
+
+def position_matrix(counts, length, pool=None, ignore='.-'):
+    '''
+    Looks up the position frequency matrix for CDR3s of ``length`` (and
+    ``pool`` if ``counts`` has pools) from the output of ``position_counts``.
+    A ``ValueError`` is raised if there are no CDR3s of ``length``.
+
+    Parameters
+    ----------
+    counts : pd.DataFrame
+        Counts from ``position_counts``.
+    length : int
+        The CDR3 length.
+    pool : optional
+        The pool, required if ``counts`` were calculated by pool.
+    ignore : str
+        Characters to exclude, gaps by default.
+
+    Returns
+    -------
+    A ``pd.DataFrame`` indexed by position with one column for each
+    character occurring at ``length``, where each row sums to one.
+
+    '''
+    try:
+        m = counts.loc[(pool, length) if pool is not None else length]
+    except KeyError:
+        in_pool = f' in pool {pool}' if pool is not None else ''
+        raise ValueError(f'No CDR3s of length {length}{in_pool}') from None
+    m = m.loc[:, (m.sum() > 0) & ~m.columns.isin(list(ignore))]
+    return m.div(m.sum(axis=1), axis=0)
@@ -0,0 +1,248 @@
+import numpy as np
+import pandas as pd
+from scipy.special import gammaln
+
+from .keys import clone_keys
+from .parallel import (
+    from_arrow,
+    get_n_jobs,
+    map_jobs,
+    partition_groups,
+    to_arrow
+)
+
+
+def _clone_sizes(df, pool, clone_features, size):
+    # The total ``size`` of each distinct (pool, clone) pair, sorted by pool
+    # and then by descending size, along with the pool of each pair
+    pools, names = clone_keys(df, pool)
+    clones, uniques = clone_keys(df, clone_features, sort=False)
+    values = df[size].to_numpy()
+    valid = (pools >= 0) & (clones >= 0) & (values > 0)
+
+    pairs, pair_rows = np.unique(
+        pools[valid].astype(np.int64) * max(1, len(uniques)) + clones[valid],
+        return_inverse=True
+    )
+    sizes = np.bincount(pair_rows, weights=values[valid])
+    pair_pools = pairs // max(1, len(uniques))
+    order = np.lexsort((-sizes, pair_pools))
+    return pair_pools[order], sizes[order], names
+
+
+def _diversity(df, pool, clone_features, size, orders):
+    pools, sizes, names = _clone_sizes(df, pool, clone_features, size)
+    n = len(names)
+
+    richness = np.bincount(pools, minlength=n)
+    totals = np.bincount(pools, weights=sizes, minlength=n)
+    freqs = sizes / totals[pools]
+    log_freqs = np.log(freqs)
+    shannon = -np.bincount(pools, weights=freqs * log_freqs, minlength=n)
+    simpson = np.bincount(pools, weights=freqs ** 2, minlength=n)
+
+    # Ranks within each pool from the largest clone
+    starts = np.cumsum(richness) - richness
+    ranks = np.arange(len(pools)) - starts[pools] + 1
+    cumulative = np.cumsum(sizes)
+    cumulative -= (cumulative - sizes)[starts[pools]]
+
+    pdf = pd.DataFrame({
+        'richness': richness,
+        'shannon': shannon,
+        'simpson': simpson,
+        'gini_simpson': 1 - simpson,
+    }, index=pd.Index(names, name=pool))
+    for q in orders:
+        if q == 1:
+            hill = np.exp(shannon)
+        elif q == 0:
+            hill = richness.astype(float)
+        else:
+            hill = np.bincount(
+                pools, weights=np.exp(q * log_freqs), minlength=n
+            ) ** (1 / (1 - q))
+        pdf[f'hill_{q}'] = hill
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # Smallest clones have the largest weight when ranked in ascending
+        # order so these are counted back from the pool's richness
+        pdf['gini'] = (
+            2 * np.bincount(
+                pools, weights=(richness[pools] - ranks + 1) * sizes,
+                minlength=n
+            ) / (richness * totals)
+            - (richness + 1) / richness
+        )
+        pdf['clonality'] = 1 - shannon / np.log(richness)
+    singletons = np.bincount(pools, weights=sizes == 1, minlength=n)
+    doubletons = np.bincount(pools, weights=sizes == 2, minlength=n)
+    pdf['chao1'] = (
+        richness + singletons * (singletons - 1) / (2 * (doubletons + 1))
+    )
+    pdf['d50'] = 1 + np.bincount(
+        pools, weights=2 * cumulative < totals[pools], minlength=n
+    ).astype(np.int64)
+    # Pools without any sized clones are excluded
+    return pdf[richness > 0]
+
+
+def _diversity_buffer(buf, pool, clone_features, size, orders):
+    return to_arrow(
+        _diversity(from_arrow(buf), pool, clone_features, size, orders)
+        .reset_index()
+    )
+
+
+def _diversity_parallel(df, pool, clone_features, size, orders, n_jobs):
+    if isinstance(clone_features, str):
+        clone_features = [clone_features]
+    df = df[[pool, *clone_features, size]]
+    buffers = [
+        to_arrow(df.iloc[pos])
+        for pos in partition_groups(df, pool, 4 * get_n_jobs(n_jobs))
+    ]
+    return pd.concat(
+        [from_arrow(buf) for buf in map_jobs(
+            _diversity_buffer, buffers, n_jobs, pool, clone_features, size,
+            orders
+        )],
+        ignore_index=True
+    ).set_index(pool).sort_index()
+
+
+def diversity_table(df, pool, clone_features=('clone_id',), size='copies',
+                    orders=(0, 1, 2), n_jobs=1):
+    '''
+    Calculates diversity and clonality metrics for every pool.  The sizes of
+    all clones are summed into one array sorted by integer pool code so each
+    metric is a segment reduction (``np.bincount``) over all pools at once.
+
+    Parameters
+    ----------
+    df : pd.DataFrame
+        The DataFrame of clones.
+    pool : str
+        The pooling column to use for each row of the table.
+    clone_features : str or list(str)
+        The feature(s) defining a clone, ``clone_id`` by default.  Rows of
+        the same clone in a pool are summed.
+    size : str
+        The integer column measuring the size of each clone, ``copies`` by
+        default.  Rows with a size of zero are ignored.
+    orders : list(float)
+        The orders ``q`` of the Hill numbers to calculate.
+    n_jobs : int, optional
+        The number of processes to use.  If greater than ``1`` (or ``-1`` for
+        all cores), pools are partitioned and summarized in parallel.
+        Requires ``pyarrow``.
+
+    Returns
+    -------
+    A ``pd.DataFrame`` indexed by ``pool`` which can be joined to the output
+    of ``make_metadata_table``, with the columns:
+
+    - ``richness``: The number of distinct clones.
+    - ``shannon``: The Shannon entropy (natural log) of clone frequencies.
+    - ``simpson``: The Simpson index, the sum of squared clone frequencies.
+    - ``gini_simpson``: ``1 - simpson``.
+    - ``hill_<q>``: The Hill number of order ``q`` for each of ``orders``.
+    - ``gini``: The Gini coefficient of clone sizes.
+    - ``clonality``: ``1 -`` Pielou's evenness (Shannon entropy divided by
+      the log of richness).  Undefined for pools with a single clone.
+    - ``chao1``: The bias-corrected Chao1 richness estimate from the number
+      of clones with a size of one and two.
+    - ``d50``: The number of largest clones comprising at least half of the
+      pool's size.
+
+    '''
+    if get_n_jobs(n_jobs) > 1:
+        return _diversity_parallel(
+            df, pool, clone_features, size, orders, n_jobs
+        )
+    return _diversity(df, pool, clone_features, size, orders)
+
+
+def _log_choose(n, k):
+    return gammaln(n + 1) - gammaln(k + 1) - gammaln(n - k + 1)
+
+
+def rarefaction_curves(df, pool, depths=None, points=50,
+                       clone_features=('clone_id',), size='copies'):
+    '''
+    Calculates the expected number of clones in a random sample of each pool
+    without replacement at several depths (rarefaction curves).  At depth
+    ``n`` the expectation is ``S - sum_k f_k * C(N - k, n) / C(N, n)`` where
+    ``S`` is the pool's richness, ``N`` its size and ``f_k`` the number of its
+    clones of size ``k``, so each curve costs time proportional to the number
+    of distinct clone sizes times the number of depths rather than the number
+    of clones.
+
+    Parameters
+    ----------
+    df : pd.DataFrame
+        The DataFrame of clones.
+    pool : str
+        The pooling column.
+    depths : list(int), optional
+        The depths (e.g. copies sampled) at which to calculate every curve.
+        Depths greater than a pool's size have no expectation (``NaN``).  By
+        default each pool's curve has ``points`` evenly spaced depths from
+        zero to its size.
+    points : int
+        The number of depths per pool if ``depths`` is not specified.
+    clone_features : str or list(str)
+        The feature(s) defining a clone, ``clone_id`` by default.
+    size : str
+        The integer column measuring the size of each clone, ``copies`` by
+        default.
+
+    Returns
+    -------
+    A ``pd.DataFrame`` with the columns ``pool``, ``depth`` and ``clones``,
+    the expected number of clones at each depth.
+
+    '''
+    pools, sizes, names = _clone_sizes(df, pool, clone_features, size)
+    totals = np.bincount(pools, weights=sizes, minlength=len(names))
+    richness = np.bincount(pools, minlength=len(names))
+
+    # The number of clones of each distinct size in each pool
+    width = int(sizes.max(initial=0)) + 1
+    pairs, freqs = np.unique(
+        pools * width + sizes.astype(np.int64), return_counts=True
+    )
+    pair_pools, pair_sizes = pairs // width, pairs % width
+
+    if depths is None:
+        grid = np.round(
+            np.linspace(0, 1, points)[None, :] * totals[:, None]
+        )
+    else:
+        grid = np.tile(np.asarray(depths, dtype=float), (len(names), 1))
+    n_depths = grid.shape[1]
+
+    # Probability that a sample misses a clone of each size, for each depth
+    n = totals[pair_pools][:, None]
+    k = pair_sizes[:, None]
+    d = grid[pair_pools]
+    with np.errstate(invalid='ignore'):
+        missed = np.where(
+            n - k >= d,
+            np.exp(_log_choose(n - k, np.minimum(d, n - k))
+                   - _log_choose(n, np.minimum(d, n))),
+            0
+        )
+    expected = richness[:, None] - np.bincount(
+        (pair_pools[:, None] * n_depths + np.arange(n_depths)).ravel(),
+        weights=(freqs[:, None] * missed).ravel(),
+        minlength=len(names) * n_depths
+    ).reshape(len(names), n_depths)
+    expected[grid > totals[:, None]] = np.nan
+
+    keep = richness > 0
+    return pd.DataFrame({
+        pool: np.repeat(np.asarray(names)[keep], n_depths),
+        'depth': grid[keep].ravel().astype(np.int64),
+        'clones': expected[keep].ravel(),
+    })
@@ -1,7 +1,41 @@
 import numpy as np
+import pandas as pd
 
+from .keys import clone_keys
+from .streaming import add_sums, is_chunked
+
+
+def total_copies(df, field='clone_id'):
+    '''
+    Calculates the total copies of each clone identified by ``field`` across
+    all pools.
+
+    Parameters
+    ----------
+    df : pd.DataFrame or iterable
+        The DataFrame from which to calculate copies.  This may also be an
+        iterable of DataFrames, such as the output of ``io.iter_tsvs``, in
+        which case the totals are accumulated one chunk at a time.
+    field : str
+        The field defining a clone, ``clone_id`` by default.
+
+    Returns
+    -------
+    A ``pd.Series`` of total copies indexed by ``field``.
 
-def filter_by_overall_copies(df, copies, field='clone_id'):
+    '''
+    if not is_chunked(df):
+        return df.groupby(field).copies.sum()
+
+    totals = None
+    for chunk in df:
+        totals = add_sums(
+            totals, chunk.groupby(field, observed=True).copies.sum()
+        )
+    return totals
+
+
+def filter_by_overall_copies(df, copies, field='clone_id', totals=None):
     '''
     Removes clones identified by ``field`` (default ``clone_id``) from a
     DataFrame with *less than* ``copies`` total copies across all pools.
@@ -16,6 +50,13 @@ def filter_by_overall_copies(df, copies, field='clone_id'):
     copies : int
         The minimum copy number of each clone required to be included in the
         resulting DataFrame.
+    field : str
+        The field defining a clone, ``clone_id`` by default.
+    totals : pd.Series, optional
+        Precomputed total copies for each clone as returned by
+        ``total_copies``.  If specified, these are used rather than the copies
+        in ``df`` which allows chunks of a larger dataset to be filtered
+        independently.
 
     Returns
     -------
@@ -34,11 +75,21 @@ def filter_by_overall_copies(df, copies, field='clone_id'):
         >>> df.copies.min()
         4
 
+    Data too large for memory can be filtered one chunk at a time:
+
+    .. code-block:: python
+
+        >>> totals = total_copies(io.iter_tsvs('my_data', chunksize=10000))
+        >>> for chunk in io.iter_tsvs('my_data', chunksize=10000):
+                chunk = filter_by_overall_copies(chunk, 5, totals=totals)
+
 
     '''
-    valid_clones = df.groupby(field).copies.sum() >= copies
+    if totals is None:
+        totals = total_copies(df, field)
+    valid_clones = totals >= copies
     valid_clones = valid_clones[valid_clones == True].index  # noqa: E712
-    return df[df.clone_id.isin(valid_clones)]
+    return df[df[field].isin(valid_clones)]
 
 
 def filter_functional(df, functional=True):
@@ -64,16 +115,60 @@ def filter_functional(df, functional=True):
     return df[df.functional == ('T' if functional else 'F')]
 
 
-def _overlap_pivot(df, pool):
-    return df.pivot_table(
-        index='clone_id',
-        columns=pool,
-        values='copies',
-        aggfunc=np.sum
+def number_of_pools_mask(df, pool, n, func='greater_equal', limit_to=None,
+                         field='clone_id'):
+    '''
+    Returns a boolean mask aligned to ``df`` which is ``True`` for rows of
+    clones occurring in a number of distinct pools satisfying ``func`` and
+    ``n``.  See ``filter_number_of_pools`` for the parameters.
+
+    Only the integer clone keys of the rows of ``df`` are used so no clone by
+    pool table is created.
+
+    Returns
+    -------
+    A boolean ``pd.Series`` with the same index as ``df``.
+
+    '''
+    return pd.Series(
+        _number_of_pools(
+            clone_keys(df, field, sort=False),
+            clone_keys(df, pool, sort=False),
+            df['copies'].to_numpy(), n, func, limit_to
+        ),
+        index=df.index
+    )
+
+
+def _number_of_pools(clones, pools, copies, n, func, limit_to, rows=None):
+    # ``clones`` and ``pools`` are ``(keys, uniques)`` from ``clone_keys`` and
+    # ``rows`` optionally limits the rows considered
+    func = getattr(np, func)
+    (clones, clone_ids), (pools, pool_ids) = clones, pools
+    valid = (clones >= 0) & (pools >= 0)
+    if rows is not None:
+        valid &= rows
+
+    # Clones in at least one (non-null) pool are considered, even if they
+    # occur in none of the pools in ``limit_to``
+    pooled = np.bincount(clones[valid], minlength=len(clone_ids)) > 0
+
+    present = valid & (copies > 0)
+    if limit_to:
+        if isinstance(limit_to, str):
+            limit_to = [limit_to]
+        present &= np.isin(pools, pool_ids.get_indexer(limit_to))
+    pairs = np.unique(
+        clones[present].astype(np.int64) * len(pool_ids) + pools[present]
     )
+    counts = np.bincount(pairs // len(pool_ids), minlength=len(clone_ids))
 
+    keep = pooled & func(counts, n)
+    return (clones >= 0) & keep[clones]
 
-def filter_number_of_pools(df, pool, n, func='greater_equal', limit_to=None):
+
+def filter_number_of_pools(df, pool, n, func='greater_equal', limit_to=None,
+                           field='clone_id'):
     '''
     Filters clones based on the number of pools in which it occurs.
 
@@ -92,6 +187,9 @@ def filter_number_of_pools(df, pool, n, func='greater_equal', limit_to=None):
     limit_to : list(str), str, None
         If specified, overlap will be limited to the specified pools.  This is
         useful to filter clones based on their overlap in a subset of pools.
+    field : str or list(str)
+        The feature(s) defining a clone, ``clone_id`` by default.  For
+        example ``['cdr3_aa', 'v_gene']`` tracks clones across subjects.
 
     Returns
     -------
@@ -99,10 +197,142 @@ def filter_number_of_pools(df, pool, n, func='greater_equal', limit_to=None):
 
     '''
 
-    func = getattr(np, func)
-    counts = _overlap_pivot(df, pool)
-    if limit_to:
-        counts = counts[limit_to]
-    counts = (counts / counts).sum(axis=1)
-    counts = set(counts[func(counts, n)].index)
-    return df[df.clone_id.isin(counts)]
+    return df[number_of_pools_mask(df, pool, n, func, limit_to, field)]
+
+
+class _FilterContext:
+    # Caches the clone keys and column values of a DataFrame so they are
+    # shared by all filters in a ``FilterChain``
+    def __init__(self, df):
+        self.df = df
+        self._codes = {}
+        self._values = {}
+
+    def codes(self, field):
+        key = field if isinstance(field, str) else tuple(field)
+        if key not in self._codes:
+            self._codes[key] = clone_keys(self.df, field, sort=False)
+        return self._codes[key]
+
+    def values(self, field):
+        if field not in self._values:
+            self._values[field] = self.df[field].to_numpy()
+        return self._values[field]
+
+
+class FilterChain:
+    '''
+    A lazily evaluated sequence of filters.  Filters are recorded by chaining
+    methods and are only evaluated by ``mask`` or ``apply``, which combine
+    them into a single boolean mask without creating intermediate filtered
+    copies of the DataFrame.  Each filter is evaluated on the rows remaining
+    after the previous filters so the result is the same as calling the
+    corresponding filter functions in order.
+
+    Per-clone groupings (integer keys from ``core.keys.clone_keys``) are
+    computed once and shared by all filters in the chain.  Each method returns
+    a new ``FilterChain`` so partial chains can be reused.
+
+    Examples
+    --------
+    .. code-block:: python
+
+        >>> chain = (
+                FilterChain()
+                .functional()
+                .overall_copies(5)
+                .number_of_pools('subject', 2)
+            )
+        >>> df = chain.apply(df)
+
+    '''
+
+    def __init__(self, filters=()):
+        self.filters = tuple(filters)
+
+    def _then(self, func, *args):
+        return type(self)([*self.filters, (func, args)])
+
+    def functional(self, functional=True):
+        '''
+        Adds a filter equivalent to ``filter_functional``.
+
+        '''
+        return self._then(_chain_functional, functional)
+
+    def overall_copies(self, copies, field='clone_id', totals=None):
+        '''
+        Adds a filter removing clones identified by ``field`` with less than
+        ``copies`` total copies.  If specified, ``totals`` are used as in
+        ``filter_by_overall_copies``.
+
+        '''
+        return self._then(_chain_overall_copies, copies, field, totals)
+
+    def number_of_pools(self, pool, n, func='greater_equal', limit_to=None,
+                        field='clone_id'):
+        '''
+        Adds a filter equivalent to ``filter_number_of_pools``.
+
+        '''
+        return self._then(
+            _chain_number_of_pools, pool, n, func, limit_to, field
+        )
+
+    def where(self, func):
+        '''
+        Adds an arbitrary filter.  ``func`` is passed the *unfiltered*
+        DataFrame and must return a boolean mask aligned to it.
+
+        '''
+        return self._then(_chain_where, func)
+
+    def mask(self, df):
+        '''
+        Evaluates the filters on ``df``.
+
+        Returns
+        -------
+        A boolean ``pd.Series`` with the same index as ``df``.
+
+        '''
+        context = _FilterContext(df)
+        rows = np.ones(len(df), dtype=bool)
+        for func, args in self.filters:
+            rows &= func(context, rows, *args)
+        return pd.Series(rows, index=df.index)
+
+    def apply(self, df):
+        '''
+        Returns the rows of ``df`` passing all filters.
+
+        '''
+        return df[self.mask(df)]
+
+
+def _chain_functional(context, rows, functional):
+    return context.values('functional') == ('T' if functional else 'F')
+
+
+def _chain_overall_copies(context, rows, copies, field, totals):
+    codes, uniques = context.codes(field)
+    if totals is None:
+        totals = np.bincount(
+            codes[rows & (codes >= 0)],
+            weights=context.values('copies')[rows & (codes >= 0)],
+            minlength=len(uniques)
+        )
+    else:
+        totals = totals.reindex(uniques).fillna(0).to_numpy()
+    return (codes >= 0) & (totals >= copies)[codes]
+
+
+def _chain_number_of_pools(context, rows, pool, n, func, limit_to, field):
+    return _number_of_pools(
+        context.codes(field), context.codes(pool),
+        context.values('copies'), n, func, limit_to, rows
+    )
+
+
+def _chain_where(context, rows, func):
+    return np.asarray(func(context.df), dtype=bool)
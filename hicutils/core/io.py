@@ -1,20 +1,168 @@
 import glob
+import hashlib
+import json
 import os
 import requests
+import threading
 import time
 import zipfile
+from concurrent.futures import ThreadPoolExecutor
 
 import pandas as pd
 import matplotlib.pyplot as plt
+from matplotlib.figure import Figure
 
 from .log import logger
+from .parallel import _fill_object_nulls, map_jobs
 
 
 def _cols_without(df, s):
     return [c for c in df.columns if s not in c]
 
 
-def read_tsvs(path, features=tuple()):
+# Column types used by ``read_tsvs`` when ``typed=True``.  ``avg_v_identity``
+# stays float64 so the derived ``shm`` is identical to an untyped read and
+# falls in the same bins
+AIRR_DTYPES = {
+    'subject': 'category',
+    'v_gene': 'category',
+    'j_gene': 'category',
+    'functional': 'category',
+    'copies': 'int32',
+    'instances': 'int32',
+    'cdr3_num_nts': 'int32',
+    'avg_v_identity': 'float64',
+}
+
+
+def _parse_args(typed, usecols):
+    return {
+        'sep': '\t',
+        'dtype': AIRR_DTYPES if typed else {'subject': str},
+        'usecols': usecols,
+    }
+
+
+def _add_fields(df, fn, features, typed, total_copies):
+    if features:
+        values = os.path.basename(fn).split('.')[1].split('_AND_')
+        for i, feature in enumerate(values):
+            df[features[i]] = feature
+            if typed:
+                df[features[i]] = df[features[i]].astype('category')
+    df['copies_fraction'] = df.copies / total_copies
+    df['copies_percent'] = 100 * df['copies_fraction']
+    df['shm'] = 100 * (1 - df['avg_v_identity'])
+    df['clones'] = 1
+    return df
+
+
+def _read_tsv(fn, features, typed, usecols):
+    df = pd.read_csv(fn, **_parse_args(typed, usecols))
+    df = _add_fields(df, fn, features, typed, df.copies.sum())
+    return df.sort_values('copies', ascending=False)
+
+
+def _unify_categories(dfs):
+    # Categoricals only survive ``pd.concat`` if every frame shares the same
+    # categories, otherwise the column is silently upcast to ``object``.
+    for col in dfs[0].select_dtypes('category').columns:
+        categories = pd.Index(sorted(set().union(
+            *[df[col].cat.categories for df in dfs]
+        )))
+        for df in dfs:
+            df[col] = df[col].cat.set_categories(categories)
+    return dfs
+
+
+def _cache_name(fn):
+    # Files are identified by their resolved path so files with the same name
+    # in different directories sharing a cache never collide
+    return os.path.realpath(fn)
+
+
+def _cache_fn(cache_dir, fn):
+    digest = hashlib.blake2b(
+        _cache_name(fn).encode(), digest_size=8
+    ).hexdigest()
+    return os.path.join(
+        cache_dir, f'{os.path.basename(fn)}.{digest}.feather'
+    )
+
+
+def _cache_key(fn, features, typed, usecols):
+    stat = os.stat(fn)
+    return [stat.st_mtime_ns, stat.st_size, list(features), typed, usecols]
+
+
+def _write_cached_tsv(fn, cache_dir, features, typed, usecols):
+    from pyarrow import feather
+
+    # Uncompressed so reading it back needs no decompression
+    feather.write_feather(
+        _read_tsv(fn, features, typed, usecols),
+        _cache_fn(cache_dir, fn),
+        compression='uncompressed'
+    )
+
+
+def _read_tsvs_cached(fns, cache_dir, n_jobs, features, typed, usecols):
+    from pyarrow import feather
+
+    os.makedirs(cache_dir, exist_ok=True)
+    manifest_fn = os.path.join(cache_dir, 'manifest.json')
+    manifest = {}
+    if os.path.exists(manifest_fn):
+        with open(manifest_fn) as fh:
+            manifest = json.load(fh)
+
+    keys = {
+        _cache_name(fn): _cache_key(fn, features, typed, usecols)
+        for fn in fns
+    }
+    stale = [
+        fn for fn in fns
+        if manifest.get(_cache_name(fn)) != keys[_cache_name(fn)]
+        or not os.path.exists(_cache_fn(cache_dir, fn))
+    ]
+    if stale:
+        logger.info(f'Caching {len(stale)} of {len(fns)} files')
+    map_jobs(_write_cached_tsv, stale, n_jobs, cache_dir, features, typed,
+             usecols)
+
+    # Entries of other paths sharing the cache are kept unless their file no
+    # longer exists
+    manifest.update(keys)
+    for name in [n for n in manifest if not os.path.exists(n)]:
+        del manifest[name]
+        if os.path.exists(_cache_fn(cache_dir, name)):
+            os.remove(_cache_fn(cache_dir, name))
+    with open(manifest_fn, 'w') as fh:
+        json.dump(manifest, fh)
+
+    return [
+        _fill_object_nulls(feather.read_feather(_cache_fn(cache_dir, fn)))
+        for fn in fns
+    ]
+
+
+def _features(features):
+    if features and isinstance(features, str):
+        features = [features]
+    assert 'subject' not in features
+    return features
+
+
+def _usecols(usecols):
+    if usecols is not None:
+        usecols = list(dict.fromkeys(
+            [*usecols, 'copies', 'avg_v_identity']
+        ))
+    return usecols
+
+
+def read_tsvs(path, features=tuple(), n_jobs=1, typed=False, usecols=None,
+              cache=False):
     '''
     Reads AIRR-formatted input files into a single DataFrame and populates
     common fields.
@@ -25,34 +173,126 @@ def read_tsvs(path, features=tuple()):
         Path to directory containing ``.pooled.tsv`` files
     features : list, optional
         List of features which are encoded in the file names.
+    n_jobs : int, optional
+        The number of processes used to read files in parallel.  The default
+        of ``1`` reads files serially and ``-1`` uses all available cores.
+    typed : bool, optional
+        If ``True``, columns are read with the fixed types in ``AIRR_DTYPES``
+        (e.g. categorical genes and ``int32`` copies) rather than letting
+        pandas infer them, and features are stored as categoricals.  This
+        reduces memory and the cost of sending files between processes.
+    usecols : list, optional
+        If specified, only these columns are read from each file.  The
+        ``copies`` and ``avg_v_identity`` columns are always read since the
+        derived fields depend on them.
+    cache : bool or str, optional
+        If set, each parsed file is cached in Arrow IPC (Feather) format,
+        either in a ``.hicutils_cache`` directory within ``path`` when
+        ``True`` or in the given directory.  Later calls only re-parse files
+        whose modification time or size changed and read the rest from the
+        cache.  Files are identified by their resolved path, so one cache
+        directory may be shared by several paths.
+        Requires ``pyarrow``.
 
     Returns
     -------
     Single DataFrame containing the concatenated AIRR-formatted data.
 
-    '''
-    if features and isinstance(features, str):
-        features = [features]
-    assert 'subject' not in features
+    Examples
+    --------
+    The following reads a directory on 8 cores, keeping only the columns
+    needed for gene usage plots:
 
-    dfs = []
-    for fn in glob.glob(os.path.join(path, '*.pooled.tsv')):
-        df = pd.read_csv(fn, sep='\t', dtype={'subject': str})
-        if features:
-            values = os.path.basename(fn).split('.')[1].split('_AND_')
-            for i, feature in enumerate(values):
-                df[features[i]] = feature
-        df['copies_fraction'] = df.copies / df.copies.sum()
-        df['copies_percent'] = 100 * df['copies_fraction']
-        df['shm'] = 100 * (1 - df['avg_v_identity'])
-        df['clones'] = 1
-        df = df.sort_values('copies', ascending=False)
-
-        dfs.append(df)
+    .. code-block:: python
+
+        >>> df = read_tsvs(
+            'my_data',
+            'disease',
+            n_jobs=8,
+            usecols=['clone_id', 'subject', 'v_gene', 'j_gene']
+        )
+
+    '''
+    features = _features(features)
+    usecols = _usecols(usecols)
+
+    fns = glob.glob(os.path.join(path, '*.pooled.tsv'))
+    if cache:
+        if cache is True:
+            cache = os.path.join(path, '.hicutils_cache')
+        dfs = _read_tsvs_cached(fns, cache, n_jobs, features, typed, usecols)
+    else:
+        dfs = map_jobs(_read_tsv, fns, n_jobs, features, typed, usecols)
+    if typed and dfs:
+        dfs = _unify_categories(dfs)
 
     return pd.concat(dfs)
 
 
+def iter_tsvs(path, features=tuple(), chunksize=None, typed=False,
+              usecols=None):
+    '''
+    Lazily reads AIRR-formatted input files, yielding one DataFrame per file
+    or, if ``chunksize`` is set, per chunk of rows.  This allows data larger
+    than memory to be processed incrementally.  Functions which accept chunks
+    include ``metadata.make_metadata_table``, ``filters.total_copies``, and
+    ``plots.plot_gene_usage``.
+
+    Each chunk has the same fields as the output of ``read_tsvs`` with
+    ``copies_fraction`` and ``copies_percent`` relative to its whole file.
+    Unlike ``read_tsvs``, rows are yielded in file order rather than sorted
+    by copies.
+
+    Parameters
+    ----------
+    path : str
+        Path to directory containing ``.pooled.tsv`` files
+    features : list, optional
+        List of features which are encoded in the file names.
+    chunksize : int or None, optional
+        The maximum number of rows in each yielded DataFrame.  If ``None``
+        (the default) each file is yielded whole.
+    typed : bool, optional
+        Whether to read columns with the fixed types in ``AIRR_DTYPES``.
+    usecols : list, optional
+        If specified, only these columns are read from each file.
+
+    Returns
+    -------
+    A generator of DataFrames.
+
+    Examples
+    --------
+    The following builds a metadata table while only holding one million
+    rows in memory at a time:
+
+    .. code-block:: python
+
+        >>> make_metadata_table(
+            iter_tsvs('my_data', 'disease', chunksize=1000000),
+            'disease'
+        )
+
+    '''
+    features = _features(features)
+    usecols = _usecols(usecols)
+
+    for fn in glob.glob(os.path.join(path, '*.pooled.tsv')):
+        if not chunksize:
+            yield _read_tsv(fn, features, typed, usecols)
+            continue
+
+        # The copies of the whole file are needed for ``copies_fraction``
+        total_copies = sum(
+            df.copies.sum()
+            for df in pd.read_csv(fn, sep='\t', usecols=['copies'],
+                                  chunksize=chunksize)
+        )
+        for df in pd.read_csv(fn, chunksize=chunksize,
+                              **_parse_args(typed, usecols)):
+            yield _add_fields(df, fn, features, typed, total_copies)
+
+
 def read_metadata(path):
     '''
     Reads a metadata file into a `pd.DataFrame`, prefixing `METADATA_` to each
@@ -73,7 +313,7 @@ def read_metadata(path):
     return metadata
 
 
-def read_directory(path):
+def read_directory(path, n_jobs=1, typed=False, cache=False):
     '''
     Reads AIRR-formatted TSV files and joins it with an associated
     `metadata.tsv` file to return a unified `pd.DataFrame`.
@@ -82,13 +322,20 @@ def read_directory(path):
     ----------
     path : str
         Path to AIRR-formatted files and `metadata.tsv`
+    n_jobs : int, optional
+        The number of processes used to read files.  See ``read_tsvs``.
+    typed : bool, optional
+        Whether to read files with fixed column types.  See ``read_tsvs``.
+    cache : bool or str, optional
+        Whether to cache parsed files on disk.  See ``read_tsvs``.
 
     Returns
     -------
     `pd.DataFrame` with AIRR-seq data and metadata.
 
     '''
-    df = read_tsvs(path, ['replicate_name'])
+    df = read_tsvs(path, ['replicate_name'], n_jobs=n_jobs, typed=typed,
+                   cache=cache)
     metadata = read_metadata(os.path.join(path, 'metadata.tsv'))
     df = df.join(metadata, on='replicate_name', rsuffix='__DROP')
 
@@ -96,10 +343,64 @@ def read_directory(path):
     return df
 
 
-def save_fig_and_data(name, df, path='./', ext='pdf',
+def _figure(fig):
+    # Resolves a plot handle (a figure, axes, ``sns.FacetGrid``,
+    # ``logomaker.Logo`` or the axes dictionary of an UpSet plot) to its figure
+    if fig is None:
+        return plt.gcf()
+    if isinstance(fig, dict):
+        fig = next(iter(fig.values()))
+    if isinstance(fig, Figure):
+        return fig
+    return getattr(fig, 'figure', None) or fig.fig
+
+
+# The suffix added to compressed TSVs
+_COMPRESSION_SUFFIXES = {
+    'gzip': '.gz',
+    'bz2': '.bz2',
+    'xz': '.xz',
+    'zstd': '.zst',
+}
+
+
+def _parquet_frame(df):
+    # Parquet columns have a single type, so object columns mixing types,
+    # e.g. the integer and ``'<cutoff>+'`` bins of ``compute_clone_sizes``,
+    # are written as strings as they would be in a TSV
+    mixed = [
+        c for c in df.columns
+        if df[c].dtype == object
+        and pd.api.types.infer_dtype(df[c], skipna=True).startswith('mixed')
+    ]
+    return df.assign(**{
+        c: df[c].where(df[c].isna(), df[c].astype(str)) for c in mixed
+    })
+
+
+def _save(path, df, fig, ext, data_format, compression, kwargs):
+    assert data_format in ('tsv', 'parquet'), \
+        f'Unknown data format {data_format}'
+    if data_format == 'tsv':
+        assert compression is None or compression in _COMPRESSION_SUFFIXES, \
+            f'Unknown compression {compression}'
+        suffix = _COMPRESSION_SUFFIXES.get(compression, '')
+        df.to_csv(f'{path}.tsv{suffix}', sep='\t', compression=compression,
+                  **kwargs)
+    else:
+        _parquet_frame(df).to_parquet(
+            f'{path}.parquet', compression=compression or 'snappy', **kwargs
+        )
+    fig.savefig(f'{path}.{ext}', bbox_inches='tight')
+
+
+def save_fig_and_data(name, df, path='./', ext='pdf', fig=None,
+                      data_format='tsv', compression=None,
                       **kwargs):  # pragma: no cover
     '''
-    Saves the most recently generated figure and associated data to files.
+    Saves a figure and associated data to files.  When ``fig`` is specified
+    the pyplot state is never used so figures may be saved from multiple
+    threads.
 
     Parameters
     ----------
@@ -112,14 +413,125 @@ def save_fig_and_data(name, df, path='./', ext='pdf',
     ext : str, optional
         The extension of the figure file.  Defaults to pdf but can be any image
         format such as ``png``.
+    fig : matplotlib.figure.Figure, optional
+        The figure to save or the handle ``g`` returned by a plotting function.
+        Defaults to the most recently generated figure.
+    data_format : str, optional
+        The format of the data file, either ``tsv`` (the default) or
+        ``parquet`` which requires ``pyarrow``.  Object columns mixing types
+        are written to parquet as strings.
+    compression : str, optional
+        The compression of the data file.  For TSVs one of ``gzip``, ``bz2``,
+        ``xz`` or ``zstd`` (which requires ``zstandard``) with the matching
+        suffix added to the filename, e.g. ``.tsv.gz``.  For parquet any codec
+        supported by ``df.to_parquet``, ``snappy`` by default.
     kwargs : dict
-        Additional parameters which will be passed to ``df.to_csv``
+        Additional parameters which will be passed to ``df.to_csv`` or
+        ``df.to_parquet``
+
+    '''
+
+    _save(os.path.join(path, name), df, _figure(fig), ext, data_format,
+          compression, kwargs)
+
 
+class FigureWriter:
     '''
+    Saves figures and their data in background threads so that plotting is not
+    blocked by slow filesystems or compression.  Each call to ``save`` returns
+    as soon as the save is queued.  At most ``max_pending`` saves are queued or
+    running at once; further calls to ``save`` block until one finishes which
+    bounds the memory held by queued figures and data.
 
-    path = os.path.join(path, name)
-    df.to_csv(f'{path}.tsv', sep='\t', **kwargs)
-    plt.savefig(f'{path}.{ext}', bbox_inches='tight')
+    Figures and DataFrames passed to ``save`` must not be modified afterwards.
+    Call ``wait`` (or use the writer as a context manager) before exiting to
+    ensure all files are written.
+
+    Parameters
+    ----------
+    path : str, optional
+        Path to directory into which the files should be saved.
+    ext : str, optional
+        The extension of the figure files.
+    data_format : str, optional
+        The format of the data files, ``tsv`` or ``parquet``.
+    compression : str, optional
+        The compression of the data files as in ``save_fig_and_data``.
+    n_threads : int, optional
+        The number of threads writing files.
+    max_pending : int, optional
+        The maximum number of saves queued or in progress.
+
+    Examples
+    --------
+    .. code-block:: python
+
+        >>> with FigureWriter('report', compression='gzip') as writer:
+                for subject, sdf in df.groupby('subject'):
+                    g, pdf = plots.plot_ranges(sdf, 'replicate_name')
+                    writer.save(f'{subject}_ranges', pdf, fig=g)
+
+    '''
+
+    def __init__(self, path='./', ext='pdf', data_format='tsv',
+                 compression=None, n_threads=1, max_pending=8):
+        self.path = path
+        self.ext = ext
+        self.data_format = data_format
+        self.compression = compression
+        self._pool = ThreadPoolExecutor(max_workers=n_threads)
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._futures = []
+
+    def save(self, name, df, fig=None, **kwargs):
+        '''
+        Queues saving ``fig`` and ``df`` with the same parameters as
+        ``save_fig_and_data``.  Returns a ``concurrent.futures.Future`` for the
+        save.
+
+        '''
+        # The figure is resolved here so pyplot is only used by the caller
+        fig = _figure(fig)
+        self._slots.acquire()
+        try:
+            future = self._pool.submit(
+                _save, os.path.join(self.path, name), df, fig, self.ext,
+                self.data_format, self.compression, kwargs
+            )
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        self._futures.append(future)
+        return future
+
+    def wait(self):
+        '''
+        Blocks until all queued saves are written.  If any failed, the first
+        error is raised after all others finish.
+
+        '''
+        futures, self._futures = self._futures, []
+        errors = [f.exception() for f in futures]
+        for error in errors:
+            if error is not None:
+                raise error
+
+    def close(self):
+        '''
+        Waits for all queued saves and stops the writer threads.
+
+        '''
+        try:
+            self.wait()
+        finally:
+            self._pool.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
 
 
 def _run_job_and_get_result(prefix, route, out_name):  # pragma: no cover
@@ -156,7 +568,7 @@ def pull_immunedb_metadata(endpoint):
 
 
 def pull_immunedb_data(endpoint, db_name, out_name,
-                       skip_existing=True):  # pragma: no cover
+                       skip_existing=True, **kwargs):  # pragma: no cover
     '''
     Downloads unpooled clonal data from an ImmuneDB instance.
 
@@ -169,6 +581,9 @@ def pull_immunedb_data(endpoint, db_name, out_name,
         The database name itself.  For example ``my_db``.
     out_name : str
         The name of the directory into which the data will be saved.
+    kwargs : dict
+        Additional parameters which will be passed to ``read_directory``, such
+        as ``cache=True`` to reuse parsed data across sessions.
 
     Returns
     -------
@@ -204,4 +619,4 @@ def pull_immunedb_data(endpoint, db_name, out_name,
         if not skip_existing:
             raise e
 
-    return read_directory(out_name)
+    return read_directory(out_name, **kwargs)
@@ -0,0 +1,108 @@
+import numpy as np
+import pandas as pd
+
+
+def _dense(codes, sort=True):
+    # Renumbers non-negative codes 0..n-1, preserving their order if
+    # ``sort``, and returns them with the position of the first row having
+    # each code
+    valid = np.flatnonzero(codes >= 0)
+    dense = np.full(len(codes), -1, dtype=np.int64)
+    values, uniques = pd.factorize(codes[valid])
+    # Unsorted codes are numbered in order of appearance
+    first = valid[
+        np.flatnonzero(np.diff(np.maximum.accumulate(values), prepend=-1))
+    ]
+    if sort:
+        order = np.argsort(uniques)
+        rank = np.empty_like(order)
+        rank[order] = np.arange(len(order))
+        values, first = rank[values], first[order]
+    dense[valid] = values
+    return dense, first
+
+
+def _values(uniques):
+    # The values of factorized ``uniques`` as a plain array, as those of a
+    # categorical column would otherwise form a ``pd.CategoricalIndex``
+    return np.asarray(uniques)
+
+
+def clone_keys(df, features=('clone_id',), sort=True, dropna=True):
+    '''
+    Converts the combination of ``features`` in each row of ``df`` into a
+    compact integer key.  Each column is factorized and the codes are
+    combined column by column, renumbering after each so keys never
+    overflow.  Keys are numbered in sorted order of the feature values, as
+    in ``df.groupby(features)``, unless ``sort`` is ``False`` in which case
+    they are numbered in order of appearance, which is faster.
+
+    Parameters
+    ----------
+    df : pd.DataFrame
+        The DataFrame of clones.
+    features : str or list(str)
+        The column(s) defining a clone, e.g. ``('cdr3_aa', 'v_gene')``.
+    sort : bool
+        Whether to number keys in sorted order.
+    dropna : bool
+        If ``True`` (the default) rows where any feature is null have no key.
+        Otherwise null is treated as a value of its own, sorted last.
+
+    Returns
+    -------
+    A tuple ``(keys, clones)`` where ``keys`` is an integer array with the
+    key of each row (``-1`` if any feature is null and ``dropna``) and
+    ``clones`` is a ``pd.Index`` (or ``pd.MultiIndex`` for multiple features)
+    of the feature values of each key.  Readable labels can be created from
+    ``clones`` with ``key_labels``.
+
+    '''
+    if isinstance(features, str):
+        features = [features]
+    features = list(features)
+
+    if len(features) == 1:
+        # Factorized codes are already compact
+        codes, uniques = pd.factorize(
+            df[features[0]], sort=sort, use_na_sentinel=dropna
+        )
+        return codes.astype(np.int64), pd.Index(
+            _values(uniques), name=features[0]
+        )
+
+    keys = np.zeros(len(df), dtype=np.int64)
+    levels, level_codes = [], []
+    for feature in features:
+        codes, uniques = pd.factorize(
+            df[feature], sort=sort, use_na_sentinel=dropna
+        )
+        levels.append(_values(uniques))
+        level_codes.append(codes)
+        if keys.max(initial=0) >= np.iinfo(np.int64).max // max(
+                1, len(uniques)):
+            keys = _dense(keys, sort)[0]
+        keys = np.where(
+            (keys >= 0) & (codes >= 0), keys * len(uniques) + codes, -1
+        )
+    keys, first = _dense(keys, sort)
+    return keys, pd.MultiIndex(
+        levels=levels,
+        codes=[codes[first] for codes in level_codes],
+        names=features
+    )
+
+
+def key_labels(clones, sep=' '):
+    '''
+    Creates a readable label for each of ``clones`` from ``clone_keys`` by
+    joining its feature values with ``sep``.  This should only be used for
+    clones which are displayed.
+
+    '''
+    if not isinstance(clones, pd.MultiIndex):
+        return pd.Index(clones.astype(str))
+    labels = clones.get_level_values(0).astype(str)
+    for level in range(1, clones.nlevels):
+        labels = labels + sep + clones.get_level_values(level).astype(str)
+    return pd.Index(labels)
@@ -0,0 +1,293 @@
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+
+from .keys import clone_keys
+
+
+SIMILARITY_METRICS = ('shared', 'jaccard', 'morisita_horn', 'copies')
+
+
+def _compact(codes, index, valid):
+    # Removes the entries of ``index`` without any ``valid`` row, renumbering
+    # ``codes`` to match
+    used = np.bincount(codes[valid], minlength=len(index)) > 0
+    if used.all():
+        return codes, index
+    return np.cumsum(used)[codes] - 1, index[used]
+
+
+class CloneMatrix:
+    '''
+    A sparse clone by pool matrix of counts such as copies.  Rows are clones,
+    columns are pools and only the clone/pool pairs which occur are stored, so
+    large datasets which would not fit in memory as a dense ``pivot_table``
+    can be summarized and filtered.
+
+    Matrices are usually created with ``CloneMatrix.from_df``.  Operations
+    which select or transform values return a new ``CloneMatrix``.
+
+    Parameters
+    ----------
+    counts : scipy.sparse matrix
+        The values with one row per clone and one column per pool.
+    clones : pd.Index
+        The clone for each row.
+    pools : pd.Index
+        The pool for each column.
+
+    Examples
+    --------
+    .. code-block:: python
+
+        >>> m = CloneMatrix.from_df(df, 'subject')
+        >>> # The number of subjects in which each clone occurs
+        >>> m.pool_counts()
+        >>> # Clones in at least 2 subjects as a dense DataFrame
+        >>> m.filter_pools(2).to_frame()
+
+    '''
+
+    def __init__(self, counts, clones, pools):
+        assert counts.shape == (len(clones), len(pools))
+        self.counts = sp.csr_matrix(counts)
+        self.clones = clones
+        self.pools = pools
+
+    @classmethod
+    def from_df(cls, df, pool, features=('clone_id',), values='copies',
+                dropna=True):
+        '''
+        Creates a matrix by summing ``values`` for each clone in each pool.
+        Clones are identified by integer keys from ``core.keys.clone_keys``.
+        Rows where ``pool`` is null are excluded, as are rows where any of
+        ``features`` are null unless ``dropna`` is ``False``.
+
+        Parameters
+        ----------
+        df : pd.DataFrame
+            The DataFrame from which to build the matrix.
+        pool : str
+            The column defining pools.
+        features : str or list(str)
+            The feature(s) defining a clone.  By default ``clone_id`` is used
+            but this can be altered to any other columns such as ``cdr3_aa``
+            to track clones across subjects.
+        values : str
+            The column to sum, ``copies`` by default.
+        dropna : bool
+            Whether to exclude rows where any of ``features`` are null.
+
+        Returns
+        -------
+        A ``CloneMatrix`` with clones and pools in sorted order.
+
+        '''
+        rows, clones = clone_keys(df, features, dropna=dropna)
+        cols, pools = clone_keys(df, pool)
+        # Clones (or pools) only occurring in excluded rows are dropped
+        valid = (rows >= 0) & (cols >= 0)
+        rows, clones = _compact(rows, clones, valid)
+        cols, pools = _compact(cols, pools, valid)
+
+        counts = sp.csr_matrix(
+            (df[values].to_numpy()[valid], (rows[valid], cols[valid])),
+            shape=(len(clones), len(pools))
+        )
+        counts.sum_duplicates()
+        counts.eliminate_zeros()
+        return cls(counts, clones, pools)
+
+    def _with_counts(self, counts, clones=None, pools=None):
+        return type(self)(
+            counts,
+            self.clones if clones is None else clones,
+            self.pools if pools is None else pools
+        )
+
+    def presence(self):
+        '''
+        Returns a boolean matrix indicating which clones occur in each pool.
+
+        '''
+        return self._with_counts(self.counts > 0)
+
+    def clone_totals(self):
+        '''
+        Returns the sum of each clone across all pools.
+
+        '''
+        return pd.Series(self.counts.sum(axis=1).A1, index=self.clones)
+
+    def pool_totals(self):
+        '''
+        Returns the sum of all clones in each pool.
+
+        '''
+        return pd.Series(self.counts.sum(axis=0).A1, index=self.pools)
+
+    def pool_counts(self):
+        '''
+        Returns the number of pools in which each clone occurs.
+
+        '''
+        return pd.Series(
+            np.diff(self.presence().counts.indptr), index=self.clones
+        )
+
+    def clone_counts(self):
+        '''
+        Returns the number of clones in each pool.
+
+        '''
+        return pd.Series(
+            self.presence().counts.getnnz(axis=0), index=self.pools
+        )
+
+    def normalize(self, total=1):
+        '''
+        Scales each pool so its values sum to ``total``.
+
+        '''
+        counts = self.counts.astype(float)
+        sums = np.asarray(self.counts.sum(axis=0)).ravel()
+        counts.data = counts.data / sums[counts.indices] * total
+        return self._with_counts(counts)
+
+    def select_clones(self, mask):
+        '''
+        Returns the matrix limited to the clones (rows) where ``mask`` is
+        ``True``.
+
+        '''
+        mask = np.asarray(mask, dtype=bool)
+        return self._with_counts(
+            self.counts[mask], clones=self.clones[mask]
+        )
+
+    def select_pools(self, pools):
+        '''
+        Returns the matrix limited to ``pools`` (columns) in the given order.
+
+        '''
+        if isinstance(pools, str):
+            pools = [pools]
+        pos = self.pools.get_indexer(pools)
+        if (pos < 0).any():
+            raise KeyError(
+                f'Pools not found: {list(np.asarray(pools)[pos < 0])}'
+            )
+        return self._with_counts(
+            self.counts[:, pos], pools=self.pools[pos]
+        )
+
+    def filter_pools(self, n, func='greater_equal'):
+        '''
+        Returns the matrix limited to clones occurring in ``n`` pools as
+        compared by the numpy function ``func``.  By default, clones must
+        occur in ≥ ``n`` pools.
+
+        '''
+        func = getattr(np, func)
+        return self.select_clones(func(self.pool_counts().to_numpy(), n))
+
+    def to_frame(self, fill_value=0):
+        '''
+        Returns the matrix as a dense DataFrame, replacing absent clone/pool
+        pairs with ``fill_value``.
+
+        '''
+        values = self.counts.toarray()
+        if fill_value != 0:
+            values = np.where(
+                self.presence().counts.toarray(), values, fill_value
+            )
+        return pd.DataFrame(values, index=self.clones, columns=self.pools)
+
+    def similarity(self, metric='jaccard'):
+        '''
+        Calculates the similarity of every pair of pools from sparse matrix
+        products over all clones.
+
+        Parameters
+        ----------
+        metric : str
+            The similarity metric, one of:
+
+            - ``shared``: The number of clones occurring in both pools.  The
+              diagonal is the number of clones in each pool.
+            - ``jaccard``: The number of shared clones divided by the number
+              of clones in either pool.
+            - ``morisita_horn``: The Morisita-Horn index of the values in each
+              pool.
+            - ``copies``: The geometric mean of the fraction of each pool's
+              values in clones shared with the other pool.
+
+        Returns
+        -------
+        A symmetric ``pd.DataFrame`` indexed by pool on both axes.
+
+        '''
+        assert metric in SIMILARITY_METRICS
+        if metric == 'morisita_horn':
+            freqs = self.normalize().counts
+            products = (freqs.T @ freqs).toarray()
+            squares = np.diag(products)
+            sim = 2 * products / np.add.outer(squares, squares)
+        else:
+            presence = self.presence().counts.astype(np.int64)
+            shared = (presence.T @ presence).toarray()
+            if metric == 'shared':
+                sim = shared
+            elif metric == 'jaccard':
+                sizes = np.diag(shared)
+                sim = shared / (np.add.outer(sizes, sizes) - shared)
+            else:
+                # The fraction of the row pool's values in clones which occur
+                # in the column pool
+                fracs = (self.normalize().counts.T @ presence).toarray()
+                sim = np.sqrt(fracs * fracs.T)
+        return pd.DataFrame(sim, index=self.pools, columns=self.pools)
+
+
+def similarity_matrix(df, pool, metric='jaccard', clone_features=('clone_id',),
+                      size='copies'):
+    '''
+    Calculates the pairwise similarity of all pools in ``df``.  The result
+    can be passed directly to ``plots.heatmap.basic_clustermap`` with
+    ``normalize_by=None``.
+
+    Parameters
+    ----------
+    df : pd.DataFrame
+        The DataFrame of clones.
+    pool : str
+        The column defining pools.
+    metric : str
+        The similarity metric: ``shared``, ``jaccard``, ``morisita_horn`` or
+        ``copies``.  See ``CloneMatrix.similarity`` for details.
+    clone_features : str or list(str)
+        The feature(s) to use for clone definition.  The default ``clone_id``
+        uses the clone definitions in ``df``.  This can be altered to any other
+        columns in the DataFrame such as ``cdr3_aa`` to track clones across
+        subjects.
+    size : str
+        The values used by the ``morisita_horn`` and ``copies`` metrics,
+        ``copies`` by default.
+
+    Returns
+    -------
+    A symmetric ``pd.DataFrame`` indexed by pool on both axes.
+
+    Examples
+    --------
+    .. code-block:: python
+
+        >>> sim = similarity_matrix(df, 'replicate_name', 'morisita_horn',
+                                    clone_features=['cdr3_aa', 'v_gene'])
+        >>> basic_clustermap(sim, normalize_by=None, cluster_by='both')
+
+    '''
+    return CloneMatrix.from_df(
+        df, pool, features=clone_features, values=size
+    ).similarity(metric)
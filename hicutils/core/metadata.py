@@ -1,35 +1,237 @@
 import numpy as np
+import pandas as pd
 
+from .diversity import diversity_table
+from .parallel import (
+    from_arrow,
+    get_n_jobs,
+    map_jobs,
+    partition_groups,
+    to_arrow
+)
+from .streaming import add_keys, add_sums, is_chunked, row_keys
 
-def make_metadata_table(df, pool):
+
+def _count_unique(groups, values, n_groups, mask):
+    # The number of distinct ``values`` codes within each group code
+    mask = mask & (values >= 0)
+    width = values.max() + 1 if mask.any() else 1
+    pairs = np.unique(groups[mask].astype(np.int64) * width + values[mask])
+    return np.bincount(pairs // width, minlength=n_groups)
+
+
+def _make_metadata_table(df, pool):
+    groups = df.groupby(pool, observed=True)
+    pdf = groups.agg(
+        uniques=('instances', 'sum'),
+        copies=('copies', 'sum'),
+        cdr3_num_nts=('cdr3_num_nts', 'mean'),
+        avg_v_identity=('avg_v_identity', 'mean'),
+    )
+
+    # The remaining fields are counted from integer group and clone codes
+    # rather than with per-group Python functions or ``nunique``
+    codes = groups.ngroup().fillna(-1).to_numpy().astype(np.int64)
+    valid = codes >= 0
+    productive = (df.functional == 'T').to_numpy()
+    clones = pd.factorize(df.clone_id)[0]
+    pdf['in_frame'] = np.bincount(
+        codes[valid], weights=productive[valid], minlength=len(pdf)
+    ) / np.bincount(codes[valid], minlength=len(pdf))
+    pdf['clones'] = _count_unique(codes, clones, len(pdf), valid)
+    pdf['productive_clones'] = _count_unique(
+        codes, clones, len(pdf), valid & productive
+    )
+    return pdf
+
+
+def _make_metadata_table_buffer(buf, pool):
+    return to_arrow(_make_metadata_table(from_arrow(buf), pool).reset_index())
+
+
+def _make_metadata_table_parallel(df, pool, n_jobs):
+    df = df[[
+        pool, 'instances', 'copies', 'cdr3_num_nts', 'avg_v_identity',
+        'functional', 'clone_id'
+    ]]
+    buffers = [
+        to_arrow(df.iloc[pos])
+        for pos in partition_groups(df, pool, 4 * get_n_jobs(n_jobs))
+    ]
+    return pd.concat(
+        [from_arrow(buf) for buf in map_jobs(
+            _make_metadata_table_buffer, buffers, n_jobs, pool
+        )],
+        ignore_index=True
+    ).set_index(pool).sort_index()
+
+
+class MetadataState:
+    '''
+    An incrementally built metadata table which can be updated as new
+    replicates arrive.  Only per-pool sums and a sorted array of hashes of
+    each pool's distinct clones are kept.  Each update costs time
+    proportional to the new rows plus one linear merge of the new clones'
+    hashes into the sorted array.  The state can be saved to disk with
+    ``save`` and restored with ``MetadataState.load``.
+
+    Note that adding the same rows twice counts their copies twice.
+
+    Parameters
+    ----------
+    pool : str
+        The pooling column to use for each row of the table.
+
+    Examples
+    --------
+    .. code-block:: python
+
+        >>> state = MetadataState('replicate_name')
+        >>> state.update(io.iter_tsvs('data', chunksize=100000))
+        >>> state.save('metadata.pkl')
+
+        >>> # Later, when new replicates are available
+        >>> state = MetadataState.load('metadata.pkl').update(new_df)
+        >>> table = state.to_frame()
+
+    '''
+
+    _MEANS = ['cdr3_num_nts', 'avg_v_identity']
+
+    def __init__(self, pool):
+        self.pool = pool
+        self.sums = None
+        self.clone_keys = np.array([], dtype=np.uint64)
+        self.productive_keys = np.array([], dtype=np.uint64)
+
+    def _new_clones(self, df, pools, attr):
+        # Counts the (pool, clone) pairs in ``df`` not seen in previous
+        # updates for each of ``pools``
+        keys, rows = row_keys(df, [self.pool, 'clone_id'])
+        known, new = add_keys(getattr(self, attr), keys)
+        setattr(self, attr, known)
+        return rows[self.pool][new].value_counts().reindex(
+            pools, fill_value=0
+        ).to_numpy()
+
+    def update(self, df):
+        '''
+        Adds rows to the metadata table.
+
+        Parameters
+        ----------
+        df : pd.DataFrame or iterable
+            The new rows.  This may also be an iterable of DataFrames, such as
+            the output of ``io.iter_tsvs``.
+
+        Returns
+        -------
+        The updated ``MetadataState``.
+
+        '''
+        if is_chunked(df):
+            for chunk in df:
+                self.update(chunk)
+            return self
+
+        df = df[df[self.pool].notna()]
+        productive = df.functional == 'T'
+        groups = df.assign(
+            rows=1,
+            in_frame=productive
+        ).groupby(self.pool, observed=True)
+        sums = groups.agg({
+            'instances': 'sum',
+            'copies': 'sum',
+            'cdr3_num_nts': 'sum',
+            'avg_v_identity': 'sum',
+            'rows': 'sum',
+            'in_frame': 'sum',
+        })
+        # Means skip nulls as in ``make_metadata_table``
+        for field in self._MEANS:
+            sums[f'{field}_rows'] = groups[field].count()
+
+        sums['clones'] = self._new_clones(df, sums.index, 'clone_keys')
+        sums['productive_clones'] = self._new_clones(
+            df[productive.to_numpy()], sums.index, 'productive_keys'
+        )
+        self.sums = add_sums(self.sums, sums)
+        return self
+
+    def to_frame(self):
+        '''
+        Returns the metadata table, indexed by ``pool``.
+
+        '''
+        pdf = self.sums.rename({'instances': 'uniques'}, axis=1)
+        pdf.index.name = self.pool
+        for field in self._MEANS:
+            pdf[field] /= pdf.pop(f'{field}_rows')
+        pdf['in_frame'] /= pdf['rows']
+        return pdf.drop('rows', axis=1)
+
+    def save(self, path):
+        '''
+        Saves the state to ``path``.  Compression is inferred from the
+        extension, e.g. ``.pkl.gz``.
+
+        '''
+        pd.to_pickle(
+            {'pool': self.pool, 'sums': self.sums,
+             'clone_keys': self.clone_keys,
+             'productive_keys': self.productive_keys},
+            path
+        )
+
+    @classmethod
+    def load(cls, path):
+        '''
+        Loads a state previously saved with ``save``.
+
+        '''
+        data = pd.read_pickle(path)
+        state = cls(data['pool'])
+        state.sums = data['sums']
+        state.clone_keys = data['clone_keys']
+        state.productive_keys = data['productive_keys']
+        return state
+
+
+def make_metadata_table(df, pool, n_jobs=1, diversity=False):
     '''
     Generates a metadata table from a pooled DataFrame.
 
     Parameters
     ----------
-    df : pd.DataFrame
-        The DataFrame to use for the metadata table.
+    df : pd.DataFrame or iterable
+        The DataFrame to use for the metadata table.  This may also be an
+        iterable of DataFrames, such as the output of ``io.iter_tsvs``, in
+        which case the table is built incrementally one chunk at a time with
+        a ``MetadataState``.
     pool : str
         The pooling column to use for each row of the table.
+    n_jobs : int, optional
+        The number of processes to use.  If greater than ``1`` (or ``-1`` for
+        all cores), pools are partitioned and summarized in parallel.
+        Requires ``pyarrow``.
+    diversity : bool, optional
+        If ``True``, the diversity and clonality metrics from
+        ``core.diversity.diversity_table`` are joined to the table.  Not
+        supported for iterables of DataFrames.
 
     Returns
     -------
     A metadata table, indexed by ``pool``.
 
     '''
-    pdf = df.groupby(pool).agg({
-        'instances': np.sum,
-        'copies': np.sum,
-        'cdr3_num_nts': np.mean,
-        'avg_v_identity': np.mean,
-    }).rename({
-        'instances': 'uniques'
-    }, axis=1)
-    pdf['in_frame'] = df.groupby(pool).apply(
-        lambda d: len(d[d.functional == 'T']) / len(d)
-    )
-    pdf['clones'] = df.groupby(pool).clone_id.nunique()
-    pdf['productive_clones'] = df[
-        df.functional == 'T'
-    ].groupby(pool).clone_id.nunique()
+    if is_chunked(df):
+        assert not diversity, 'diversity requires a single DataFrame'
+        return MetadataState(pool).update(df).to_frame()
+    if get_n_jobs(n_jobs) > 1:
+        pdf = _make_metadata_table_parallel(df, pool, n_jobs)
+    else:
+        pdf = _make_metadata_table(df, pool)
+    if diversity:
+        pdf = pdf.join(diversity_table(df, pool, n_jobs=n_jobs))
     return pdf
@@ -0,0 +1,88 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+
+def get_n_jobs(n_jobs):
+    '''
+    Resolves a ``n_jobs`` value to a concrete number of worker processes.
+    ``None`` and ``1`` mean serial execution and negative values count back
+    from the number of available cores (``-1`` uses all of them).
+
+    '''
+    if not n_jobs:
+        return 1
+    if n_jobs < 0:
+        return max(1, (os.cpu_count() or 1) + 1 + n_jobs)
+    return n_jobs
+
+
+def map_jobs(func, items, n_jobs=1, *args):
+    '''
+    Applies ``func(item, *args)`` to each of ``items`` and returns the results
+    as a list in the same order as ``items``.  When ``n_jobs`` resolves to more
+    than one worker the calls are spread over a process pool, so ``func`` and
+    its arguments must be picklable.
+
+    '''
+    items = list(items)
+    n_jobs = min(get_n_jobs(n_jobs), len(items))
+    if n_jobs <= 1:
+        return [func(item, *args) for item in items]
+
+    with ProcessPoolExecutor(max_workers=n_jobs) as pool:
+        return list(pool.map(func, items, *[[a] * len(items) for a in args]))
+
+
+def partition_groups(df, by, n_parts):
+    '''
+    Splits the rows of ``df`` into at most ``n_parts`` partitions of whole
+    groups of ``by`` with roughly equal numbers of rows.  Groups are kept in
+    sorted order and rows within each partition in their original order, so
+    each partition can be aggregated exactly as it would be serially.
+
+    Returns
+    -------
+    A list of arrays of row positions, one per partition.
+
+    '''
+    codes = df.groupby(by, dropna=False, observed=True).ngroup().to_numpy()
+    sizes = np.bincount(codes)
+    parts = ((np.cumsum(sizes) - sizes) * n_parts // max(1, len(df)))[codes]
+    by_part = np.argsort(parts, kind='stable')
+    return np.split(by_part, np.flatnonzero(np.diff(parts[by_part])) + 1)
+
+
+def to_arrow(df):
+    '''
+    Serializes ``df`` (without its index) to an Arrow IPC buffer which can be
+    sent to worker processes far more cheaply than a pickled DataFrame.
+    Requires ``pyarrow``.
+
+    '''
+    import pyarrow as pa
+
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue()
+
+
+def from_arrow(buf):
+    '''
+    Reads a DataFrame from an Arrow IPC buffer created by ``to_arrow``.
+
+    '''
+    import pyarrow as pa
+
+    return _fill_object_nulls(pa.ipc.open_stream(buf).read_all().to_pandas())
+
+
+def _fill_object_nulls(df):
+    # Arrow reads missing values in object columns as ``None`` rather than the
+    # ``NaN`` pandas uses when reading files
+    for col in df.select_dtypes(object).columns:
+        df[col] = df[col].fillna(np.nan)
+    return df
@@ -1,52 +1,401 @@
 import numpy as np
+import pandas as pd
 
 from .io import _cols_without
+from .parallel import (
+    from_arrow,
+    get_n_jobs,
+    map_jobs,
+    partition_groups,
+    to_arrow
+)
+from .streaming import is_chunked
 
 
-def _aggregate_pool(pool_df, pool_by):
-    def _norm(df):
-        df['avg_v_identity'] /= df['copies'].sum()
-        return df
+def _pool_columns(pool_by):
+    if isinstance(pool_by, str):
+        pool_by = [pool_by]
 
-    name = pool_df.name
-    pool_df = pool_df.sort_values('copies', ascending=False)
-    pool_df['avg_v_identity'] = (
-        pool_df['avg_v_identity'] * pool_df['copies']
-    )
-    funcs = {c: 'first' for c in pool_df.columns if 'METADATA_' not in c}
+    return [
+        f'METADATA_{p}'
+        if p not in ('subject', 'replicate_name') else p
+        for p in pool_by
+    ]
+
+
+def _sort_pools(df, pool_by):
+    '''
+    Returns the integer code of each row's pool and the row positions of
+    ``df`` ordered by pool and then by descending copies in a single stable
+    sort, so rows with equal copies keep their order in ``df``.
+
+    '''
+    codes = df.groupby(pool_by, dropna=False).ngroup().to_numpy()
+    copies = df['copies'].to_numpy().astype(np.int64)
+    return codes, np.lexsort((-copies, codes))
+
+
+def _aggregate_pools(df, pool_by):
+    codes, order = _sort_pools(df, pool_by)
+    columns = [c for c in df.columns if 'METADATA_' not in c]
+    df = df.iloc[order]
+    pool = pd.Series(codes[order], index=df.index, name='pool')
+
+    keep = df['clone_id'].notna().to_numpy()
+    df, pool = df[keep], pool[keep]
+    df = df.assign(avg_v_identity=df['avg_v_identity'] * df['copies'])
+
+    funcs = {c: 'first' for c in [*columns, *pool_by] if c != 'clone_id'}
     funcs.update({
-        'instances': np.sum,
-        'copies': np.sum,
-        'top_copy_seq': lambda s: s.iloc[0],
-        'avg_v_identity': np.sum
+        'instances': 'sum',
+        'copies': 'sum',
+        'avg_v_identity': 'sum'
     })
-    pool_df = pool_df.groupby('clone_id', as_index=False).agg(funcs)
-    total_copies_by_clone = pool_df.groupby('clone_id').copies.sum()
-    pool_df['total_copies'] = pool_df['clone_id'].apply(
-        lambda c: total_copies_by_clone.loc[c]
-    )
-    pool_df['avg_v_identity'] /= pool_df['total_copies']
-    pool_df = pool_df.drop('total_copies', axis=1)
+    pool_df = df.groupby([pool, df['clone_id']]).agg(funcs)
 
+    if 'top_copy_seq' in df.columns:
+        # The sequence from the clone's top copy row, even if it is null
+        first = ~pd.MultiIndex.from_arrays(
+            [pool, df['clone_id']]
+        ).duplicated()
+        pool_df['top_copy_seq'] = pd.Series(
+            df['top_copy_seq'].to_numpy()[first],
+            index=pd.MultiIndex.from_arrays(
+                [pool[first], df['clone_id'][first]]
+            )
+        ).sort_index().to_numpy()
+
+    pool_df['avg_v_identity'] /= pool_df['copies']
     pool_df['shm'] = (100 * (1 - pool_df['avg_v_identity'])).round(4)
-    pool_df['copies_fraction'] = pool_df['copies'] / pool_df['copies'].sum()
+    pool_df['copies_fraction'] = pool_df['copies'] / pool_df.groupby(
+        level='pool'
+    ).copies.transform('sum')
     pool_df['copies_percent'] = 100 * pool_df['copies_fraction']
-    pool_df[[p.replace('METADATA_', '') for p in pool_by]] = name
-    return pool_df.reset_index(drop=True)
+    pool_df = pool_df.reset_index(level='clone_id')
 
+    names = []
+    for p in pool_by:
+        names.append(p.replace('METADATA_', ''))
+        # ``first`` returns None for null keys of object columns
+        pool_df[names[-1]] = pool_df[p].fillna(np.nan)
+    return pool_df[list(dict.fromkeys([
+        *columns, 'shm', 'copies_fraction', 'copies_percent', *names
+    ]))]
 
-def pool_by(df, pool_by):
-    if isinstance(pool_by, str):
-        pool_by = [pool_by]
 
-    pool_by = [
-        f'METADATA_{p}'
-        if p not in ('subject', 'replicate_name') else p
-        for p in pool_by
+def _aggregate_buffer(buf, pool_by):
+    return to_arrow(_aggregate_pools(from_arrow(buf), pool_by))
+
+
+def _aggregate_pools_parallel(df, pool_by, n_jobs):
+    df = df[[c for c in df.columns if 'METADATA_' not in c or c in pool_by]]
+    buffers = [
+        to_arrow(df.iloc[pos])
+        for pos in partition_groups(df, pool_by, 4 * get_n_jobs(n_jobs))
     ]
-    df = df.groupby(pool_by, dropna=False).apply(_aggregate_pool, pool_by)
+    return pd.concat(
+        [from_arrow(buf) for buf in map_jobs(
+            _aggregate_buffer, buffers, n_jobs, pool_by
+        )],
+        ignore_index=True
+    )
+
+
+def pool_by(df, pool_by, n_jobs=1):
+    '''
+    Pools clones across replicates, aggregating each clone within the pools
+    given by ``pool_by``.  Within each pool, copies and instances are summed,
+    ``avg_v_identity`` is the copy-weighted mean, ``top_copy_seq`` is taken
+    from the replicate with the most copies, and other fields are taken from
+    the first non-null value in order of descending copies.
+
+    Parameters
+    ----------
+    df : pd.DataFrame
+        The DataFrame to pool, such as the output of ``io.read_directory``.
+    pool_by : str or list(str)
+        The metadata field(s) on which to pool.  ``subject`` and
+        ``replicate_name`` refer to those columns directly while other values
+        refer to their ``METADATA_`` fields.
+    n_jobs : int, optional
+        The number of processes to use.  If greater than ``1`` (or ``-1`` for
+        all cores), pools are partitioned and aggregated in parallel, with the
+        partitions passed to workers as Arrow buffers.  The output is the same
+        as the serial default.  Requires ``pyarrow``.
+
+    Returns
+    -------
+    A DataFrame with one row per clone in each pool.
+
+    '''
+    pool_by = _pool_columns(pool_by)
+    if get_n_jobs(n_jobs) > 1:
+        df = _aggregate_pools_parallel(df, pool_by, n_jobs)
+    else:
+        df = _aggregate_pools(df, pool_by)
     return (
         df[_cols_without(df, 'METADATA_')]
         .reset_index(drop=True)
-        .drop('replicate_name', axis=1)
+        .drop('replicate_name', axis=1, errors='ignore')
     )
+
+
+class PoolState:
+    '''
+    Incrementally pooled clones which can be updated as new replicates arrive
+    without re-pooling the entire dataset.  For each clone in each pool, only
+    sufficient statistics are kept: summed copies and instances, the
+    copy-weighted identity sum, ``top_copy_seq`` of the row with the most
+    copies and, as in ``pool_by``, the first non-null value of every other
+    field in order of descending copies along with the copies of the row it
+    came from.  Rows with equal copies are ordered by when they were added.
+
+    The statistics are held in arrays which grow as clones are added and are
+    updated in place through a dictionary from each clone's pool and
+    ``clone_id`` to its row, so each update costs amortized time proportional
+    to the number of new rows rather than the size of the state.  The state
+    can be saved to disk with ``save`` and restored with ``PoolState.load``.
+
+    Note that adding the same replicate twice counts its copies twice.
+
+    Parameters
+    ----------
+    pool_by : str or list(str)
+        The metadata field(s) on which to pool, as in ``pool_by``.
+
+    Examples
+    --------
+    .. code-block:: python
+
+        >>> state = PoolState('subject').update(io.read_directory('data'))
+        >>> state.save('pooled.pkl')
+
+        >>> # Later, when new replicates are available
+        >>> state = PoolState.load('pooled.pkl')
+        >>> state.update(new_df)
+        >>> pooled = state.to_frame()
+
+    '''
+
+    _SUMS = ['copies', 'instances', 'identity']
+    # Fields taken from the top copy row even if null
+    _TOP = ['top_copies', 'top_copy_seq']
+    # Fields every update must have
+    _REQUIRED = ['clone_id', 'copies', 'instances', 'avg_v_identity']
+
+    def __init__(self, pool_by):
+        self.pool_by = _pool_columns(pool_by)
+        self.columns = None
+        self._rows = {}
+        self._arrays = {}
+        self._size = 0
+
+    @property
+    def _keys(self):
+        return [*self.pool_by, 'clone_id']
+
+    @property
+    def stats(self):
+        '''
+        The statistics of each clone as a DataFrame indexed by pool and
+        ``clone_id``.
+
+        '''
+        return pd.DataFrame({
+            col: values[:self._size] for col, values in self._arrays.items()
+        }).set_index(self._keys)
+
+    def _key_tuples(self, df):
+        # Nulls are mapped to ``None`` so null keys of any type compare equal
+        return list(zip(*(
+            df[k].astype(object).where(df[k].notna(), None)
+            for k in self._keys
+        )))
+
+    def _write(self, col, pos, values):
+        # Writes ``values`` to the rows ``pos`` of ``col``, promoting the
+        # column's dtype if needed, e.g. when a field which was entirely null
+        # receives strings
+        arr = self._arrays[col]
+        dtype = np.promote_types(arr.dtype, values.dtype)
+        if dtype != arr.dtype:
+            arr = self._arrays[col] = arr.astype(dtype)
+        arr[pos] = values
+
+    def _append(self, new):
+        n = len(new)
+        capacity = len(next(iter(self._arrays.values()), ()))
+        if self._size + n > capacity:
+            capacity = max(2 * capacity, self._size + n)
+            for col in new.columns:
+                arr = self._arrays.get(col)
+                grown = np.empty(capacity, dtype=(
+                    new[col].to_numpy().dtype if arr is None else arr.dtype
+                ))
+                if arr is not None:
+                    grown[:self._size] = arr[:self._size]
+                self._arrays[col] = grown
+
+        pos = np.arange(self._size, self._size + n)
+        for col in new.columns:
+            self._write(col, pos, new[col].to_numpy())
+        self._rows.update(zip(self._key_tuples(new), pos.tolist()))
+        self._size += n
+
+    def _summarize(self, df):
+        df = df[df['clone_id'].notna()]
+        keys = self._keys
+        fields = [
+            c for c in self.columns
+            if c not in (
+                *keys, 'avg_v_identity', 'instances', 'copies', 'shm',
+                'copies_fraction', 'copies_percent'
+            )
+        ]
+
+        df = df.sort_values('copies', ascending=False, kind='stable')
+        group = df.groupby(keys, dropna=False).ngroup().to_numpy()
+        # The first row of each group is the one with the most copies
+        _, top = np.unique(group, return_index=True)
+
+        stats = df.iloc[top][[*keys, 'copies', *fields]].rename(
+            {'copies': 'top_copies'}, axis=1
+        ).reset_index(drop=True)
+        copies = df['copies'].to_numpy()
+        for field in fields:
+            if field in self._TOP:
+                continue
+            # The first non-null value of each group and the copies of its
+            # row, or -1 if the group has no value
+            present = np.flatnonzero(df[field].notna().to_numpy())
+            found, first = np.unique(group[present], return_index=True)
+            values = stats[field].to_numpy().copy()
+            values[found] = df[field].to_numpy()[present[first]]
+            stats[field] = values
+            source = np.full(len(top), -1, dtype=np.int64)
+            source[found] = copies[present[first]]
+            stats[f'{field}__copies'] = source
+        sums = pd.DataFrame({
+            'copies': df['copies'].to_numpy(),
+            'instances': df['instances'].to_numpy(),
+            'identity': (df['avg_v_identity'] * df['copies']).to_numpy(),
+        }).groupby(group).sum()
+        for col in self._SUMS:
+            stats[col] = sums[col].to_numpy()
+        return stats
+
+    def update(self, df):
+        '''
+        Adds replicates to the pooled state.
+
+        Parameters
+        ----------
+        df : pd.DataFrame or iterable
+            The new replicates with the same fields as the output of
+            ``io.read_directory``.  This may also be an iterable of
+            DataFrames such as the output of ``io.iter_tsvs``.  Fields seen
+            in earlier updates but missing from ``df`` are treated as null.
+
+        Returns
+        -------
+        The updated ``PoolState``.
+
+        '''
+        if is_chunked(df):
+            for chunk in df:
+                self.update(chunk)
+            return self
+
+        missing = [
+            c for c in [*self.pool_by, *self._REQUIRED] if c not in df.columns
+        ]
+        assert not missing, f'DataFrame is missing fields {missing}'
+        if self.columns is None:
+            self.columns = [
+                c for c in df.columns
+                if 'METADATA_' not in c and c != 'replicate_name'
+            ]
+        else:
+            df = df.assign(**{
+                c: None for c in self.columns if c not in df.columns
+            })
+        new = self._summarize(df)
+        if not self._arrays:
+            self._append(new)
+            return self
+
+        pos = np.fromiter(
+            (self._rows.get(k, -1) for k in self._key_tuples(new)),
+            dtype=np.int64, count=len(new)
+        )
+        existing = pos >= 0
+        old, upd = pos[existing], new[existing]
+        for col in self._SUMS:
+            self._write(
+                col, old, self._arrays[col][old] + upd[col].to_numpy()
+            )
+
+        # Replace the top row fields of clones which have a new top row and
+        # other fields where the new value came from a row with more copies.
+        # Existing values win ties as their rows were added first.  All
+        # masks are found before any field is written
+        replace = {}
+        for col in new.columns:
+            if col in (*self._keys, *self._SUMS) or col.endswith('__copies'):
+                continue
+            source = 'top_copies' if col in self._TOP else f'{col}__copies'
+            replace[col] = (
+                upd[source].to_numpy() > self._arrays[source][old]
+            )
+            if source != 'top_copies':
+                replace[source] = replace[col]
+        for col, rows in replace.items():
+            self._write(col, old[rows], upd[col].to_numpy()[rows])
+
+        self._append(new[~existing])
+        return self
+
+    def to_frame(self):
+        '''
+        Returns the pooled clones with the same fields as ``pool_by``.
+
+        '''
+        df = self.stats.sort_index()
+        df = df.assign(avg_v_identity=df['identity'] / df['copies'])
+        df['shm'] = (100 * (1 - df['avg_v_identity'])).round(4)
+        df['copies_fraction'] = df['copies'] / df.groupby(
+            level=self.pool_by, dropna=False
+        ).copies.transform('sum')
+        df['copies_percent'] = 100 * df['copies_fraction']
+        df = df.reset_index()
+
+        names = [p.replace('METADATA_', '') for p in self.pool_by]
+        df[names] = df[self.pool_by]
+        return df[list(dict.fromkeys([
+            *self.columns, 'shm', 'copies_fraction', 'copies_percent', *names
+        ]))]
+
+    def save(self, path):
+        '''
+        Saves the state to ``path``.  Compression is inferred from the
+        extension, e.g. ``.pkl.gz``.
+
+        '''
+        pd.to_pickle(
+            {'pool_by': self.pool_by, 'columns': self.columns,
+             'stats': self.stats},
+            path
+        )
+
+    @classmethod
+    def load(cls, path):
+        '''
+        Loads a state previously saved with ``save``.
+
+        '''
+        data = pd.read_pickle(path)
+        state = cls([])
+        state.pool_by = data['pool_by']
+        state.columns = data['columns']
+        state._append(data['stats'].reset_index())
+        return state
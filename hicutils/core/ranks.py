@@ -0,0 +1,164 @@
+import numpy as np
+import pandas as pd
+
+from .keys import clone_keys
+
+
+def _sort_order(codes, copies):
+    # The stable order of rows by code and then descending copies, sorting a
+    # single integer key when one fits as that is much faster than lexsort
+    if copies.dtype.kind in 'iu' and len(copies):
+        low, high = int(copies.min()), int(copies.max())
+        width = high - low + 1
+        if (int(codes.max()) + 2) * width < np.iinfo(np.int64).max:
+            return np.argsort(
+                (codes + 1) * width + (high - copies.astype(np.int64)),
+                kind='stable'
+            )
+    return np.lexsort((-copies, codes))
+
+
+def clone_ranks(df, pool=None):
+    '''
+    Ranks the clones (rows) of ``df`` by copies within each pool and
+    calculates the cumulative copies of each pool down to each rank.  The
+    ranks are built from one stable sort of all rows by (pool, copies) so
+    range buckets, Dx values and top clones are then lookups into the result
+    rather than per-pool sorts.
+
+    The result is aligned to the rows of ``df`` and only depends on its
+    ``copies`` and ``pool`` columns, so it can be computed once and passed to
+    ``top_clones``, ``top_fraction``, ``dx`` and plots accepting ``ranks``,
+    or stored alongside ``df`` (e.g. with ``df.join(ranks)`` or
+    ``ranks.to_pickle``).
+
+    Parameters
+    ----------
+    df : pd.DataFrame
+        The DataFrame of clones.
+    pool : str, optional
+        The pooling column.  If not specified, all rows are ranked together.
+
+    Returns
+    -------
+    A ``pd.DataFrame`` with the same index as ``df`` and the columns:
+
+    - ``pool``: The pool of each row (if specified).
+    - ``rank``: The 1-based rank of each row within its pool, with ties in
+      the order of ``df``.  Rows with a null pool have a rank of ``0``.
+    - ``cumulative_copies``: The copies of all rows in the pool up to and
+      including the row's rank.
+    - ``cumulative_fraction``: ``cumulative_copies`` as a fraction of the
+      pool's total copies.
+
+    '''
+    copies = df['copies'].to_numpy()
+    if pool is None:
+        codes = np.zeros(len(df), dtype=np.int64)
+    else:
+        codes = clone_keys(df, pool)[0]
+    order = _sort_order(codes, copies)
+
+    # Positions in the sorted order at which each pool starts and ends
+    sorted_codes = codes[order]
+    starts = np.flatnonzero(np.diff(sorted_codes, prepend=-2))
+    sizes = np.diff(starts, append=len(order))
+    start = np.repeat(starts, sizes)
+
+    cumulative = np.cumsum(copies[order])
+    cumulative -= np.repeat(cumulative[starts] - copies[order][starts], sizes)
+    totals = np.repeat(cumulative[starts + sizes - 1], sizes)
+
+    ranks = np.empty(len(order), dtype=np.int64)
+    ranks[order] = np.where(
+        sorted_codes >= 0, np.arange(len(order)) - start + 1, 0
+    )
+    cumulative_copies = np.empty_like(cumulative)
+    cumulative_copies[order] = cumulative
+    fractions = np.empty(len(order))
+    fractions[order] = cumulative / np.where(
+        sorted_codes >= 0, totals, np.nan
+    )
+
+    columns = {} if pool is None else {pool: df[pool].to_numpy()}
+    return pd.DataFrame({
+        **columns,
+        'rank': ranks,
+        'cumulative_copies': cumulative_copies,
+        'cumulative_fraction': fractions,
+    }, index=df.index)
+
+
+def _check_ranks(df, pool, ranks):
+    if ranks is None:
+        return clone_ranks(df, pool)
+    assert len(ranks) == len(df), 'ranks must be computed from df'
+    return ranks
+
+
+def top_clones(df, n, pool=None, ranks=None):
+    '''
+    Returns the top ``n`` clones by copies (in each pool) ordered by pool and
+    rank.
+
+    Parameters
+    ----------
+    df : pd.DataFrame
+        The DataFrame of clones.
+    n : int
+        The number of clones to return (per pool).
+    pool : str, optional
+        The pooling column.
+    ranks : pd.DataFrame, optional
+        Precomputed ranks of ``df`` from ``clone_ranks``.
+
+    Returns
+    -------
+    The rows of ``df`` with a rank of at most ``n``.
+
+    '''
+    ranks = _check_ranks(df, pool, ranks)
+    rank = ranks['rank'].to_numpy()
+    rows = np.flatnonzero((rank >= 1) & (rank <= n))
+    if pool is not None:
+        rows = rows[np.lexsort((
+            rank[rows], clone_keys(ranks.iloc[rows], pool)[0]
+        ))]
+    else:
+        rows = rows[np.argsort(rank[rows], kind='stable')]
+    return df.iloc[rows]
+
+
+def top_fraction(ranks, n, pool=None):
+    '''
+    Looks up the fraction of copies in the top ``n`` clones of each pool from
+    ``clone_ranks``.
+
+    Returns
+    -------
+    A ``pd.Series`` indexed by pool, or a float if ``ranks`` has no pools.
+
+    '''
+    top = ranks[ranks['rank'].between(1, n)]
+    if pool is None:
+        return top['cumulative_fraction'].max()
+    return top.groupby(pool, observed=True).cumulative_fraction.max()
+
+
+def dx(ranks, x, pool=None):
+    '''
+    Looks up the Dx of each pool from ``clone_ranks``: the number of top
+    clones comprising at least ``x`` percent of the pool's copies.  For
+    example, ``x=50`` gives the D50.
+
+    Returns
+    -------
+    A ``pd.Series`` indexed by pool, or an int if ``ranks`` has no pools.
+
+    '''
+    reached = ranks[
+        (ranks['rank'] >= 1) & (ranks['cumulative_fraction'] >= x / 100)
+    ]
+    if pool is None:
+        return reached['rank'].min()
+    return reached.groupby(pool, observed=True)['rank'].min()
@@ -0,0 +1,111 @@
+import numpy as np
+import pandas as pd
+
+from .keys import clone_keys
+from .parallel import get_n_jobs, map_jobs
+
+
+def _draw(pools, depth):
+    # ``pools`` are ``(copies, seed)`` pairs each drawn independently so the
+    # results do not depend on how pools are split between processes
+    return [
+        np.random.default_rng(seed).multivariate_hypergeometric(
+            copies, depth, method='marginals'
+        )
+        for copies, seed in pools
+    ]
+
+
+def subsample(df, pool, depth=None, replicates=1, seed=None, n_jobs=1):
+    '''
+    Randomly subsamples (rarefies) each pool to ``depth`` copies without
+    replacement.  The sampled copies of each clone are drawn directly from
+    each pool's ``copies`` with a multivariate hypergeometric distribution
+    so copies are never expanded into individual rows.
+
+    Each pool (and replicate) is drawn from its own random stream spawned
+    from ``seed`` so results are reproducible and identical for any
+    ``n_jobs``.
+
+    Parameters
+    ----------
+    df : pd.DataFrame
+        The DataFrame of clones.
+    pool : str
+        The pooling column defining the repertoires to subsample, e.g.
+        ``replicate_name``.
+    depth : int, optional
+        The number of copies to sample from each pool.  Defaults to the
+        copies of the smallest pool.  Pools with fewer copies are excluded.
+    replicates : int
+        The number of independent subsamples to draw.
+    seed : int or np.random.SeedSequence, optional
+        The random seed.
+    n_jobs : int, optional
+        The number of processes to use.  If greater than ``1`` (or ``-1`` for
+        all cores), pools are sampled in parallel.
+
+    Returns
+    -------
+    The rows of ``df`` with at least one sampled copy, in their original
+    order, with ``copies`` replaced by the sampled copies.  If present,
+    ``copies_fraction`` and ``copies_percent`` are recalculated relative to
+    ``depth``.  When ``replicates`` is greater than one, the subsamples are
+    concatenated with a ``subsample`` column numbering them from ``0``.
+
+    Examples
+    --------
+    .. code-block:: python
+
+        >>> sampled = subsample(df, 'replicate_name', depth=10000, seed=1)
+        >>> sampled.groupby('replicate_name').copies.sum().unique()
+        array([10000])
+
+    '''
+    assert replicates >= 1
+    codes, names = clone_keys(df, pool)
+    copies = df['copies'].to_numpy().astype(np.int64)
+    totals = np.bincount(
+        codes[codes >= 0], weights=copies[codes >= 0], minlength=len(names)
+    )
+    if depth is None:
+        depth = int(totals.min()) if len(totals) else 0
+    depth = int(depth)
+
+    # The row positions of each pool deep enough to sample
+    rows = np.flatnonzero(codes >= 0)
+    rows = rows[np.argsort(codes[rows], kind='stable')]
+    rows = np.split(rows, np.cumsum(np.bincount(codes[rows]))[:-1])
+    sampled = [p for p in range(len(names)) if totals[p] >= depth]
+
+    if not isinstance(seed, np.random.SeedSequence):
+        seed = np.random.SeedSequence(seed)
+    seeds = seed.spawn(replicates)
+    n_jobs = get_n_jobs(n_jobs)
+    frames = []
+    for i, replicate_seed in enumerate(seeds):
+        pool_seeds = replicate_seed.spawn(len(names))
+        items = [(copies[rows[p]], pool_seeds[p]) for p in sampled]
+        step = max(1, -(-len(items) // (4 * n_jobs)))
+        chunks = [items[j:j + step] for j in range(0, len(items), step)]
+
+        draws = np.zeros(len(df), dtype=np.int64)
+        pool_draws = [
+            draw
+            for chunk in map_jobs(_draw, chunks, n_jobs, depth)
+            for draw in chunk
+        ]
+        for p, draw in zip(sampled, pool_draws):
+            draws[rows[p]] = draw
+
+        keep = draws > 0
+        frame = df[keep].copy()
+        frame['copies'] = draws[keep].astype(df['copies'].dtype)
+        if 'copies_fraction' in frame.columns:
+            frame['copies_fraction'] = frame['copies'] / depth
+        if 'copies_percent' in frame.columns:
+            frame['copies_percent'] = 100 * frame['copies'] / depth
+        if replicates > 1:
+            frame['subsample'] = i
+        frames.append(frame)
+    return frames[0] if replicates == 1 else pd.concat(frames)
@@ -0,0 +1,70 @@
+import numpy as np
+import pandas as pd
+
+
+def is_chunked(df):
+    '''
+    Returns ``True`` if ``df`` is an iterable of DataFrames, such as the
+    output of ``io.iter_tsvs``, rather than a single DataFrame.
+
+    '''
+    return not isinstance(df, pd.DataFrame)
+
+
+def add_sums(total, partial):
+    '''
+    Adds ``partial``, a grouped sum over one chunk, to the running ``total``
+    from previous chunks.  ``total`` may be ``None`` for the first chunk.
+
+    '''
+    # Sums over categorical groups keep narrow types like ``int32`` which
+    # would overflow when accumulated over many chunks
+    if partial.ndim == 1 and partial.dtype.kind in 'iu':
+        partial = partial.astype('int64')
+    elif partial.ndim == 2:
+        partial = partial.astype({
+            c: 'int64' for c, t in partial.dtypes.items() if t.kind in 'iu'
+        })
+    if total is None:
+        return partial
+    levels = list(range(partial.index.nlevels))
+    return pd.concat([total, partial]).groupby(level=levels,
+                                               observed=True).sum()
+
+
+def row_keys(df, columns):
+    '''
+    Returns the sorted, distinct 64-bit hashes of the rows of ``df[columns]``
+    without nulls, along with the first of those rows for each hash.  Float
+    columns of whole numbers are hashed as integers so keys match across
+    chunks where nulls made a column float.
+
+    '''
+    df = df[columns][df[columns].notna().all(axis=1).to_numpy()]
+    for col in columns:
+        values = df[col]
+        if values.dtype.kind == 'f' and (values == values.round()).all():
+            df = df.assign(**{col: values.astype(np.int64)})
+    keys, first = np.unique(
+        pd.util.hash_pandas_object(df, index=False).to_numpy(),
+        return_index=True
+    )
+    return keys, df.iloc[first]
+
+
+def add_keys(known, keys):
+    '''
+    Merges ``keys``, a sorted array of distinct hashes from one chunk, into
+    the sorted array ``known`` from previous chunks.  Returns the merged array
+    and a mask of the ``keys`` which were not already known.  Only the new
+    keys are merged, in a single linear pass over ``known``.
+
+    '''
+    pos = np.searchsorted(known, keys)
+    found = pos < len(known)
+    new = np.ones(len(keys), dtype=bool)
+    new[found] = known[pos[found]] != keys[found]
+    # A stable sort merges the two sorted runs in linear time
+    merged = np.concatenate([known, keys[new]])
+    merged.sort(kind='stable')
+    return merged, new
@@ -1,20 +1,35 @@
 from .clone_size import (  # noqa: F401
+    compute_clone_sizes,
+    compute_top_clones,
+    compute_ranges,
+    compute_rarefaction,
     plot_clone_sizes,
     plot_top_clones,
-    plot_ranges
+    plot_ranges,
+    plot_rarefaction
 )
 from .overlap import (  # noqa: F401
+    compute_similarity,
+    compute_strings,
+    compute_upset,
+    plot_similarity,
     plot_strings,
     plot_upset
 )
-from .gene_usage import plot_gene_usage  # noqa: F401
+from .gene_usage import compute_gene_usage, plot_gene_usage  # noqa: F401
 from .cdr3_analysis import (  # noqa: F401
+    compute_cdr3_aa_usage,
+    compute_cdr3_logo,
+    compute_cdr3_spectratype,
     plot_cdr3_aa_usage,
     plot_cdr3_logo,
     plot_cdr3_spectratype
 )
 from .shm import (  # noqa: F401
+    compute_shm_distribution,
+    compute_shm_range,
     plot_shm_distribution,
     plot_shm_aggregate,
     plot_shm_range
 )
+from .batch import render_batch  # noqa: F401
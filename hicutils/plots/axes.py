@@ -0,0 +1,44 @@
+import seaborn as sns
+
+
+def _axes_level(func, ax, kwargs):
+    # Figure-level sizing does not apply when drawing onto existing axes
+    kwargs.pop('height', None)
+    kwargs.pop('aspect', None)
+    func(ax=ax, **kwargs)
+    return ax
+
+
+def catplot(ax=None, **kwargs):
+    '''
+    Draws a categorical plot.  If ``ax`` is specified the axes-level seaborn
+    function for ``kind`` (e.g. ``sns.barplot``) draws onto it and ``ax`` is
+    returned, otherwise a ``sns.catplot`` is created in a new figure.
+
+    '''
+    if ax is None:
+        return sns.catplot(**kwargs)
+    kind = kwargs.pop('kind', 'strip')
+    return _axes_level(getattr(sns, f'{kind}plot'), ax, kwargs)
+
+
+def relplot(ax=None, **kwargs):
+    '''
+    Draws a relational plot.  If ``ax`` is specified ``sns.lineplot`` or
+    ``sns.scatterplot`` draws onto it and ``ax`` is returned, otherwise a
+    ``sns.relplot`` is created in a new figure.
+
+    '''
+    if ax is None:
+        return sns.relplot(**kwargs)
+    kind = kwargs.pop('kind', 'scatter')
+    return _axes_level(getattr(sns, f'{kind}plot'), ax, kwargs)
+
+
+def plot_ax(g):
+    '''
+    Returns the axes of a plot handle ``g`` which is either a single-facet
+    ``sns.FacetGrid`` or an axes.
+
+    '''
+    return g.ax if isinstance(g, sns.FacetGrid) else g
@@ -0,0 +1,122 @@
+import os
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pandas as pd
+import matplotlib.pyplot as plt
+
+from hicutils.core.io import _figure, save_fig_and_data
+from hicutils.core.log import logger
+from hicutils.core.parallel import get_n_jobs
+
+
+def _init_worker():
+    # Workers never display figures so they render with the headless backend
+    plt.switch_backend('Agg')
+
+
+def _render(job, path, ext, save_kwargs):
+    func, df, kwargs, name = job
+    start = time.time()
+    before = set(plt.get_fignums())
+    g = None
+    try:
+        os.makedirs(os.path.dirname(os.path.join(path, name)), exist_ok=True)
+        g, pdf = func(df, **(kwargs or {}))
+        save_fig_and_data(name, pdf, path, ext, fig=g, **save_kwargs)
+        error = None
+    except Exception:
+        error = traceback.format_exc()
+    finally:
+        # Only the figures created by this job are closed so memory does not
+        # grow, leaving any figures the caller has open when run serially
+        if g is not None:
+            plt.close(_figure(g))
+        for num in set(plt.get_fignums()) - before:
+            plt.close(num)
+    return name, error, time.time() - start
+
+
+def render_batch(jobs, path='./', ext='pdf', n_jobs=1, **kwargs):
+    '''
+    Renders many plots and saves each with ``io.save_fig_and_data``.  When
+    ``n_jobs`` resolves to more than one worker, plots are rendered in
+    separate processes with the headless ``Agg`` backend.  The figures
+    created by each plot are closed once it is saved.
+
+    A failing plot does not stop the batch.  Progress and failures are logged
+    as each plot completes.
+
+    Parameters
+    ----------
+    jobs : list
+        The plots to render as ``(func, df, kwargs, name)`` tuples where
+        ``func`` is a plotting function such as ``plots.plot_ranges`` which is
+        called as ``func(df, **kwargs)`` and ``name`` is the filename, which
+        may include subdirectories, passed to ``save_fig_and_data``.  When
+        using multiple processes, ``func``, ``df`` and ``kwargs`` must be
+        picklable.
+    path : str, optional
+        Path to the directory into which the files should be saved.
+    ext : str, optional
+        The extension of the figure files, ``pdf`` by default.
+    n_jobs : int, optional
+        The number of processes to use, ``-1`` for all cores.
+    kwargs : dict
+        Additional parameters passed to ``save_fig_and_data``.
+
+    Returns
+    -------
+    A ``pd.DataFrame`` with one row per job, in the order of ``jobs``, with
+    the columns ``name``, ``error`` (the traceback of a failed job or
+    ``None``) and ``seconds``.
+
+    Examples
+    --------
+    .. code-block:: python
+
+        >>> jobs = [
+                (plots.plot_ranges, sdf, {'pool': 'replicate_name'},
+                 f'{subject}/ranges')
+                for subject, sdf in df.groupby('subject')
+            ]
+        >>> status = render_batch(jobs, 'report', ext='png', n_jobs=-1)
+        >>> status[status.error.notna()]
+
+    '''
+    jobs = list(jobs)
+    n_jobs = min(get_n_jobs(n_jobs), len(jobs))
+    results = [None] * len(jobs)
+
+    def _report(i, result):
+        results[i] = result
+        name, error, seconds = result
+        done = sum(r is not None for r in results)
+        if error is None:
+            logger.info(f'[{done}/{len(jobs)}] Rendered {name} '
+                        f'({seconds:.1f}s)')
+        else:
+            logger.error(f'[{done}/{len(jobs)}] Failed to render {name}\n'
+                         f'{error}')
+
+    if n_jobs <= 1:
+        for i, job in enumerate(jobs):
+            _report(i, _render(job, path, ext, kwargs))
+    else:
+        with ProcessPoolExecutor(max_workers=n_jobs,
+                                 initializer=_init_worker) as pool:
+            futures = {
+                pool.submit(_render, job, path, ext, kwargs): i
+                for i, job in enumerate(jobs)
+            }
+            for future in as_completed(futures):
+                i = futures[future]
+                try:
+                    result = future.result()
+                except Exception:
+                    # e.g. the job could not be sent to the worker
+                    result = (jobs[i][3], traceback.format_exc(), 0)
+                _report(i, result)
+
+    return pd.DataFrame(results, columns=['name', 'error', 'seconds'])
@@ -1,18 +1,22 @@
-from collections import Counter
 import seaborn as sns
 import pandas as pd
-import matplotlib.pyplot as plt
-
 import logomaker
 
+from hicutils.core.cache import memoize
+from hicutils.core.cdr3 import aa_composition, position_counts, position_matrix
+from .axes import catplot, plot_ax
 from .heatmap import basic_clustermap
 
 
-def _get_counts(pdf, size_metric):
-    # TODO: Fix this to count clones only once if size_metric = clones
-    return pd.DataFrame(pdf.cdr3_aa.apply(
-        lambda r: pd.Series(Counter(r))
-    ).fillna(0).mul(pdf[size_metric], axis=0).sum()).T
+@memoize
+def compute_cdr3_aa_usage(df, pool, size_metric='clones'):
+    '''
+    Calculates the CDR3 amino-acid usage of each pool plotted by
+    ``plot_cdr3_aa_usage``.
+
+    '''
+    assert size_metric in ('clones', 'copies', 'uniques')
+    return aa_composition(df, pool, size_metric)
 
 
 def plot_cdr3_aa_usage(df, pool, size_metric='clones', normalize_by='rows',
@@ -29,7 +33,8 @@ def plot_cdr3_aa_usage(df, pool, size_metric='clones', normalize_by='rows',
         The pooling column to use for each row of the heatmap.
     size_metric : str
         The size metric which is plotted as the intensity of each cell.  Must
-        be one of ``clones``, ``copies``, or ``uniques``.
+        be one of ``clones``, ``copies``, or ``uniques``.  When ``clones``,
+        each clone is counted once per pool.
     normalize_by : str
         Sets how to normalize the plot.  If set to ``rows`` (the default) each
         row is normalized to sum to one.  Setting it to ``cols`` causes each
@@ -45,20 +50,35 @@ def plot_cdr3_aa_usage(df, pool, size_metric='clones', normalize_by='rows',
 
     '''
 
-    assert size_metric in ('clones', 'copies', 'uniques')
-    df = df.copy()
-
-    pdf = pd.concat(
-        {k: _get_counts(d, size_metric) for k, d in df.groupby(pool)},
-        sort=True
-    ).fillna(0)
-    pdf.index = pdf.index.droplevel(1)
+    pdf = compute_cdr3_aa_usage(df, pool, size_metric)
 
     g = basic_clustermap(pdf, normalize_by, cluster_by, figsize=figsize)
     return g, pdf
 
 
-def plot_cdr3_logo(df, by, length, hide_ambig=True, **kwargs):
+@memoize
+def compute_cdr3_logo(df, by, length, hide_ambig=True, size_metric=None):
+    '''
+    Calculates the position matrix of CDR3s of ``length`` plotted by
+    ``plot_cdr3_logo``.
+
+    '''
+    assert by in ('cdr3_aa', 'cdr3_nt')
+    if 'pos' not in df.index.names:
+        df = position_counts(
+            df[df[by].str.len() == length], by, size_metric=size_metric
+        )
+    m = position_matrix(df, length)
+    if hide_ambig:
+        if by == 'cdr3_nt' and 'N' in m.columns:
+            m = m.drop('N', axis=1)
+        if by == 'cdr3_aa' and 'X' in m.columns:
+            m = m.drop('X', axis=1)
+    return m
+
+
+def plot_cdr3_logo(df, by, length, hide_ambig=True, size_metric=None,
+                   ax=None, **kwargs):
     '''
     Creates a logo plot for CDR3 strings of a given length either by amino-acid
     or nucleotide.
@@ -66,12 +86,22 @@ def plot_cdr3_logo(df, by, length, hide_ambig=True, **kwargs):
     Parameters
     ----------
     df : pd.DataFrame
-        The DataFrame to use as the source of CDR3 information.
+        The DataFrame to use as the source of CDR3 information.  This may also
+        be position counts from ``core.cdr3.position_counts`` for ``by``
+        (e.g. ``counts.loc[pool]`` for one pool) so that logos for many
+        lengths and pools are lookups into counts computed once.
     by : str
         Either ``cdr3_aa`` to plot amino-acids or ``cdr3_nt`` to plot
         nucleotides.
     length : int
         The length of CDR3s to plot.  Interpreted as the length of ``by``.
+    size_metric : str, optional
+        If specified, weights each CDR3 by ``clones``, ``copies``, or
+        ``uniques``.  By default each row has a weight of one.  Ignored if
+        ``df`` are position counts.
+    ax : matplotlib.axes.Axes, optional
+        The axes on which to draw the plot.  By default a new figure is
+        created.
 
     Returns
     -------
@@ -80,17 +110,7 @@ def plot_cdr3_logo(df, by, length, hide_ambig=True, **kwargs):
 
     '''
 
-    assert by in ('cdr3_aa', 'cdr3_nt')
-    cdrs = df[df[by].str.len() == length][by]
-    m = (
-        logomaker.alignment_to_matrix(cdrs)
-        .pipe(logomaker.transform_matrix, normalize_values=True)
-    )
-    if hide_ambig:
-        if by == 'cdr3_nt' and 'N' in m.columns:
-            m = m.drop('N', axis=1)
-        if by == 'cdr3_aa' and 'X' in m.columns:
-            m = m.drop('X', axis=1)
+    m = compute_cdr3_logo(df, by, length, hide_ambig, size_metric)
     color_scheme = kwargs.pop(
         'color_scheme',
         'skylign_protein' if by == 'cdr3_aa' else 'classic'
@@ -98,13 +118,35 @@ def plot_cdr3_logo(df, by, length, hide_ambig=True, **kwargs):
     g = logomaker.Logo(
         m,
         color_scheme=color_scheme,
-        show_spines=False
+        show_spines=False,
+        ax=ax
     )
     g.ax.set(xlabel='Position', ylabel='Fraction of Total')
     return g, m
 
 
-def plot_cdr3_spectratype(df, color_top=10, **kwargs):
+@memoize
+def compute_cdr3_spectratype(df, color_top=10):
+    '''
+    Calculates the CDR3 length distribution and top ``color_top`` clones
+    plotted by ``plot_cdr3_spectratype``.
+
+    '''
+    columns = ['cdr3_num_nts', 'copies_percent', 'cdr3_aa']
+    all_df = df.groupby('cdr3_num_nts').copies_percent.sum().reset_index()
+    top_df = df.sort_values('copies_percent', ascending=False)[:color_top]
+    # Only the plotted columns are filled as categorical columns of typed
+    # reads, e.g. ``subject``, cannot be filled with ``''``
+    top_df = top_df[columns]
+    return (
+        pd
+        .concat([top_df, all_df], sort=False)
+        .fillna('')
+        .sort_values('copies_percent', ascending=False)
+    )[columns]
+
+
+def plot_cdr3_spectratype(df, color_top=10, ax=None, **kwargs):
     '''
     Plots CDR3 length while annotating and highlighting the top ``color_top``
     clones.
@@ -115,6 +157,9 @@ def plot_cdr3_spectratype(df, color_top=10, **kwargs):
         The DataFrame to use for plotting CDR3 length.
     color_top : int
         The number of clones to highlight (default 10).
+    ax : matplotlib.axes.Axes, optional
+        The axes on which to draw the plot.  By default a new figure is
+        created.
 
     Returns
     -------
@@ -123,17 +168,11 @@ def plot_cdr3_spectratype(df, color_top=10, **kwargs):
 
     '''
 
-    all_df = df.groupby('cdr3_num_nts').copies_percent.sum().reset_index()
-    top_df = df.sort_values('copies_percent', ascending=False)[:color_top]
-    cdf = (
-        pd
-        .concat([top_df, all_df], sort=False)
-        .fillna('')
-        .sort_values('copies_percent', ascending=False)
-    )[['cdr3_num_nts', 'copies_percent', 'cdr3_aa']]
+    cdf = compute_cdr3_spectratype(df, color_top)
 
     colors = ['#dddddd'] + sns.color_palette()
-    g = sns.catplot(
+    g = catplot(
+        ax,
         data=cdf,
         x='cdr3_num_nts',
         y='copies_percent',
@@ -147,12 +186,13 @@ def plot_cdr3_spectratype(df, color_top=10, **kwargs):
         palette=colors
     )
 
-    g.set(xticklabels=[
+    ax = plot_ax(g)
+    ax.set(xticklabels=[
         l if i % 3 == 0 else ''
-        for i, l in enumerate(g.ax.get_xticklabels())
+        for i, l in enumerate(ax.get_xticklabels())
     ])
-    g.set(xlabel='CDR3 Length (NT)', ylabel='% Total Copies')
-    g.despine(left=True)
-    plt.legend(loc='upper right')
+    ax.set(xlabel='CDR3 Length (NT)', ylabel='% Total Copies')
+    sns.despine(ax=ax, left=True)
+    ax.legend(loc='upper right')
 
     return g, cdf
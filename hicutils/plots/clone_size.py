@@ -1,29 +1,20 @@
-from collections import Counter
-import re
-
 import seaborn as sns
 import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
 
+from hicutils.core.binning import bucketize
+from hicutils.core.cache import memoize
+from hicutils.core.diversity import rarefaction_curves
+from hicutils.core.ranks import clone_ranks, top_clones, top_fraction
+from .axes import catplot, relplot
 
-def plot_clone_sizes(df, cutoff=None, **kwargs):
-    '''
-    Plots the distribution of clone sizes in ``df``.
-
-    Parameters
-    ----------
-    df : pd.DataFrame
-        The DataFrame used to plot the clone size distribution.
-    cutoff : int or None
-        Aggregate all clones with ``cutoff`` or more copies into one bin on the
-        right side of the graph.  This is useful to condense the tail of the
-        plotted distribution.
 
-    Returns
-    -------
-    A tuple ``(g, df)`` where ``g`` is a handle to the plot and ``df`` is the
-    underlying DataFrame.
+@memoize
+def compute_clone_sizes(df, cutoff=None):
+    '''
+    Calculates the distribution of clone sizes plotted by
+    ``plot_clone_sizes``.
 
     '''
     df = (
@@ -50,8 +41,35 @@ def plot_clone_sizes(df, cutoff=None, **kwargs):
                 'clones': clones
             }])
         ])
+    return df
+
+
+def plot_clone_sizes(df, cutoff=None, ax=None, **kwargs):
+    '''
+    Plots the distribution of clone sizes in ``df``.
+
+    Parameters
+    ----------
+    df : pd.DataFrame
+        The DataFrame used to plot the clone size distribution.
+    cutoff : int or None
+        Aggregate all clones with ``cutoff`` or more copies into one bin on the
+        right side of the graph.  This is useful to condense the tail of the
+        plotted distribution.
+    ax : matplotlib.axes.Axes, optional
+        The axes on which to draw the plot.  By default a new figure is
+        created.
+
+    Returns
+    -------
+    A tuple ``(g, df)`` where ``g`` is a handle to the plot and ``df`` is the
+    underlying DataFrame.
+
+    '''
+    df = compute_clone_sizes(df, cutoff)
 
-    g = sns.catplot(
+    g = catplot(
+        ax,
         data=df,
         x='copies',
         y='clones',
@@ -66,12 +84,29 @@ def plot_clone_sizes(df, cutoff=None, **kwargs):
     return g, df
 
 
+@memoize
+def compute_top_clones(df, cutoff=20, ranks=None):
+    '''
+    Calculates the top ``cutoff`` clones plotted by ``plot_top_clones`` with
+    their ``rank`` and ``copies_percent`` of all copies in ``df``.
+
+    '''
+    if ranks is None:
+        ranks = clone_ranks(df)
+    cdf = top_clones(df, cutoff, ranks=ranks).copy()
+    cdf['copies_percent'] = 100 * cdf['copies'] / df['copies'].sum()
+    cdf['rank'] = np.arange(1, len(cdf) + 1)
+    return cdf
+
+
 def plot_top_clones(
         df,
         cutoff=20,
         annotate=False,
         color=sns.color_palette()[3],
-        figsize=(12, 8)):
+        figsize=(12, 8),
+        ranks=None,
+        ax=None):
     '''
     Plots the copy-number frequency of the top ``cutoff`` clones (default 20).
     Optionally, the ``annotate`` keyword can be set to one or more clone
@@ -90,6 +125,12 @@ def plot_top_clones(
         The color to use for bars.
     figsize : tuple
         The ``(width, height)`` of the plot.
+    ranks : pd.DataFrame, optional
+        Precomputed ranks of ``df`` from ``core.ranks.clone_ranks`` without a
+        pool.
+    ax : matplotlib.axes.Axes, optional
+        The axes on which to draw the plot.  By default a new figure of size
+        ``figsize`` is created.
 
     Returns
     -------
@@ -100,13 +141,11 @@ def plot_top_clones(
 
     if isinstance(annotate, str):
         annotate = [annotate]
-    df = df.copy()
-    df = df.sort_values('copies', ascending=False)
-    df['copies_percent'] = 100 * df['copies'] / df['copies'].sum()
-    df['rank'] = np.arange(1, len(df) + 1)
+    total = df['copies'].sum()
+    cdf = compute_top_clones(df, cutoff, ranks)
 
-    fig, ax = plt.subplots(figsize=(12, 8))
-    cdf = df[:cutoff]
+    if ax is None:
+        _, ax = plt.subplots(figsize=figsize)
     g = sns.barplot(
         x='rank',
         y='copies_percent',
@@ -120,131 +159,211 @@ def plot_top_clones(
     if annotate:
         for i, p in enumerate(g.patches):
             ax.annotate(
-                ' '.join([str(s) for s in df.iloc[i][annotate]]),
+                ' '.join([str(s) for s in cdf.iloc[i][annotate]]),
                 (p.get_x() + p.get_width() / 2., p.get_height()),
                 ha='center', va='center', fontsize=10, color='black',
                 rotation=90, xytext=(0, 30),
                 textcoords='offset points'
             )
-    a = plt.axes([0.69, 0.58, .2, .2], facecolor='y')
+    # Inset relative to ``ax`` rather than the figure so it stays in place
+    # when ``ax`` is one of several axes
+    a = ax.inset_axes([0.73, 0.61, 0.26, 0.26], facecolor='y')
     colors = [
         sns.color_palette()[3],
         sns.color_palette('Reds', n_colors=5)[1]
     ]
-    frac = df[:cutoff]['copies_percent'].sum()
+    frac = cdf['copies_percent'].sum()
 
     top_df = pd.DataFrame({
         'percent': [frac, max(0, 100 - frac)]
     }, index=['top', 'rest'])
 
-    ax = top_df.plot.pie(
+    pie = top_df.plot.pie(
         y='percent',
         colors=colors,
         legend=False,
         labels=[f'{round(frac, 1)}%', ''],
         ax=a
     )
-    ax.set_title(f'% of Total Copies\n({df.copies.sum()})')
-    ax.set_ylabel('')
+    pie.set_title(f'% of Total Copies\n({total})')
+    pie.set_ylabel('')
 
     return g, cdf
 
 
-def _range_for_pool(df, portions, total_clones, intervals):
-    pool = df.name
-    total_clones[pool] += len(df)
+def _range_label(start, end):
+    if end is None:
+        return f'{start + 1}+'
+    return f'{start + 1}-{end}'
 
-    for start, end in zip(intervals[:-1], intervals[1:]):
-        portions.append({
-            'pool': pool,
-            'start': start,
-            'end': end,
-            'copies': df[start:end].copies.sum()
-        })
-    portions.append({
-        'pool': pool,
-        'start': end,
-        'end': '+',
-        'copies': df[end:].copies.sum()
-    })
-    return portions
 
+@memoize
+def compute_ranges(df, pool, intervals=(10, 100, 1000), ranks=None):
+    '''
+    Calculates the negated fraction of each pool's copies in clones ranked
+    within each of ``intervals`` as plotted by ``plot_ranges``.  Pools are
+    ordered by the fraction of copies in their top 20 clones.
 
-def _get_d(df, d):
-    return (
-               df.sort_values('copies', ascending=False)
-               .head(d)
-               .copies.sum()
-           ) / df.copies.sum()
+    Clones are ranked by descending copies over the whole pool.
 
+    '''
+    intervals = [0, *intervals]
+    pools = df.groupby(pool)
+    if ranks is None:
+        ranks = clone_ranks(df, pool)
 
-def _label(r):
-    if r['end'] != '+':
-        return f'{r["start"] + 1}-{r["end"]}'
-    return f'{r["start"] + 1}+'
+    # Bucket each clone by its rank within its pool
+    ranges = bucketize(ranks['rank'] - 1, intervals, _range_label)
+    pdf = (
+        df
+        .groupby([pool, pd.Series(ranges, index=df.index, name='range')],
+                 observed=True)
+        .copies.sum()
+        .unstack()
+        .reindex(columns=ranges.categories)
+        .fillna(0)
+    )
+    pdf = pdf.div(-pdf.sum(axis=1), axis=0)
+
+    # Order pools by the fraction of copies in their top 20 clones
+    d20s = top_fraction(ranks, 20, pool).sort_values(ascending=False)
+    pdf = pdf.loc[d20s.index]
+    pdf.index = pd.Index(
+        [f'{p} ({n})' for p, n in pools.size()[pdf.index].items()],
+        name='pool'
+    )
+    pdf.columns = pd.Index(pdf.columns.astype(str), name='range')
+    return pdf
 
 
 def plot_ranges(
         df,
         pool,
         intervals=(10, 100, 1000),
+        ranks=None,
+        ax=None,
         **kwargs):
-    intervals = [0, *intervals]
-    portions = []
-    total_clones = Counter()
-
-    df.groupby(pool).apply(_range_for_pool, portions, total_clones, intervals)
-
-    portions = pd.DataFrame(portions)
-    portions['pool'] = portions['pool'].apply(
-        lambda p: f'{p} ({total_clones[p]})'
-    )
-    portions['range'] = portions.apply(_label, axis=1)
-    pdf = (
-        portions
-        .pivot_table(index='pool', columns='range', values='copies',
-                     aggfunc=np.sum)
-    )
-    pdf = pdf.div(-pdf.sum(axis=1), axis=0)
+    '''
+    Plots the fraction of each pool's copies in its clones ranked within each
+    of ``intervals``, e.g. the top 10 clones, the 11th to 100th and so on.
+    Clones are ranked by descending copies across all rows of the pool, even
+    when the pool spans several files.
 
-    order = pd.Series(
-        int(re.search(r'\d+', c).group(0)) for c in pdf.columns
-    ).argsort()
+    Parameters
+    ----------
+    df : pd.DataFrame
+        The DataFrame used to plot the ranges.
+    pool : str
+        The pooling column, with one bar per pool.
+    intervals : list(int)
+        The ranks at which ranges end.  The final range includes all clones
+        ranked after the last interval.
+    ranks : pd.DataFrame, optional
+        Precomputed ranks of ``df`` from ``core.ranks.clone_ranks`` with
+        ``pool``.
+    ax : matplotlib.axes.Axes, optional
+        The axes on which to draw the plot.  By default a new figure is
+        created.
 
-    pdf = (
-        pdf[pdf.columns[order]]
-        .reindex(
-            pdf[pdf.columns[:-1]].sum(axis=1).sort_values().index
-        )
-    )
+    Returns
+    -------
+    A tuple ``(g, df)`` where ``g`` is a handle to the plot and ``df`` is the
+    underlying DataFrame.
 
-    d20s = list(
-        df
-        .groupby(pool).apply(_get_d, 20)
-        .sort_values(ascending=False)
-        .index
-    )
-    pdf['order'] = [
-        d20s.index(label.rsplit(' (')[0]) for label in pdf.index
-    ]
-    pdf = pdf.sort_values('order').drop('order', axis=1)
+    '''
+    pdf = compute_ranges(df, pool, intervals, ranks)
 
     colors = [
-        *kwargs.pop('color', sns.color_palette()[:len(intervals) - 1]),
+        *kwargs.pop('color', sns.color_palette()[:len(intervals)]),
         (0.86, 0.86, 0.86)  # gray
     ]
 
-    ax = pdf.plot.bar(stacked=True, figsize=kwargs.get('figsize', (10, 5)),
-                      color=colors)
+    ax = pdf.plot.bar(
+        stacked=True,
+        figsize=kwargs.get('figsize', (10, 5)) if ax is None else None,
+        color=colors,
+        ax=ax
+    )
     ax.set_yticklabels([round(abs(tick), 2) for tick in ax.get_yticks()])
     ax.set_xlabel('')
     ax.set_ylabel('Fraction of Copies')
-    plt.legend(loc='upper right', bbox_to_anchor=(1.2, 1))
+    ax.legend(loc='upper right', bbox_to_anchor=(1.2, 1))
 
     return ax, pdf
 
 
-def plot_clonecount(df, pool, hue, palette, **kwargs):
+@memoize
+def compute_rarefaction(df, pool, depths=None, points=50,
+                        clone_features=('clone_id',)):
+    '''
+    Calculates the rarefaction curves plotted by ``plot_rarefaction``.
+
+    '''
+    return rarefaction_curves(
+        df, pool, depths, points, clone_features
+    ).dropna()
+
+
+def plot_rarefaction(df, pool, depths=None, points=50,
+                     clone_features=('clone_id',), ax=None, **kwargs):
+    '''
+    Plots the rarefaction curve of each pool: the expected number of clones
+    when sampling increasing numbers of copies.  Curves which level off
+    indicate the pool was sequenced deeply enough to capture most clones.
+
+    Parameters
+    ----------
+    df : pd.DataFrame
+        The DataFrame used to plot the rarefaction curves.
+    pool : str
+        The pooling column, with one curve per pool.
+    depths : list(int), optional
+        The depths at which to calculate every curve.  By default each curve
+        has ``points`` evenly spaced depths up to the size of its pool.
+    points : int
+        The number of depths per curve if ``depths`` is not specified.
+    clone_features : str or list(str)
+        The feature(s) defining a clone, ``clone_id`` by default.
+    ax : matplotlib.axes.Axes, optional
+        The axes on which to draw the plot.  By default a new figure is
+        created.
+
+    Returns
+    -------
+    A tuple ``(g, df)`` where ``g`` is a handle to the plot and ``df`` is the
+    underlying DataFrame.
+
+    '''
+    pdf = compute_rarefaction(df, pool, depths, points, clone_features)
+
+    g = relplot(
+        ax,
+        data=pdf,
+        x='depth',
+        y='clones',
+        hue=pool,
+        kind='line',
+        height=kwargs.pop('height', 6),
+        aspect=kwargs.pop('aspect', 1.5),
+        **kwargs
+    )
+    g.set(xlabel='Copies Sampled', ylabel='Expected Clones')
+
+    return g, pdf
+
+
+@memoize
+def compute_clonecount(df, pool, hue):
+    '''
+    Calculates the clone count of each pool and hue plotted by
+    ``plot_clonecount``.
+
+    '''
+    pdf = df.groupby([pool, hue]).clone_id.nunique().to_frame().reset_index()
+    return pdf.sort_values('clone_id', ascending=False)
+
+
+def plot_clonecount(df, pool, hue, palette, ax=None, **kwargs):
     '''
     Plots the clone count of each subject, colored by disease
 
@@ -258,6 +377,9 @@ def plot_clonecount(df, pool, hue, palette, **kwargs):
         The dataframe column to use as hue values
     palette: dict
         Dictionary of color palette values for each hue value
+    ax : matplotlib.axes.Axes, optional
+        The axes on which to draw the plot.  By default a new figure is
+        created.
 
     Returns
     -------
@@ -266,9 +388,9 @@ def plot_clonecount(df, pool, hue, palette, **kwargs):
 
     '''
 
-    pdf = df.groupby([pool, hue]).clone_id.nunique().to_frame().reset_index()
-    pdf = pdf.sort_values('clone_id', ascending=False)
-    g = sns.catplot(
+    pdf = compute_clonecount(df, pool, hue)
+    g = catplot(
+        ax,
         data=pdf,
         hue=hue,
         y='clone_id',
@@ -277,6 +399,6 @@ def plot_clonecount(df, pool, hue, palette, **kwargs):
         palette=palette,
         aspect=2
     )
-    g.set_xticklabels(rotation=90)
+    g.tick_params(axis='x', labelrotation=90)
     g.set(xlabel='Subject', ylabel='Number of clones')
     return g, pdf
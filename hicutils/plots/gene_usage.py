@@ -1,8 +1,58 @@
 import numpy as np
+import pandas as pd
 
+from hicutils.core.cache import memoize
+from hicutils.core.streaming import add_keys, add_sums, is_chunked, row_keys
 from .heatmap import basic_clustermap
 
 
+def _usage_pivot_chunked(chunks, pool, gene, size_metric):
+    # Distinct clones are counted by merging the hashes of each chunk's new
+    # (pool, clone) pairs into a sorted array of those already seen
+    sums = clones = None
+    known = np.array([], dtype=np.uint64)
+    for df in chunks:
+        sums = add_sums(
+            sums,
+            df.groupby([pool, gene], observed=True)[size_metric].sum()
+        )
+        keys, rows = row_keys(df, [pool, 'clone_id'])
+        known, new = add_keys(known, keys)
+        clones = add_sums(
+            clones, rows[pool][new].astype(object).value_counts()
+        )
+    return sums.unstack().fillna(0), clones
+
+
+@memoize
+def compute_gene_usage(df, pool, gene, size_metric='clones'):
+    '''
+    Calculates the gene usage of each pool plotted by ``plot_gene_usage``.
+    Results for iterators of DataFrames, such as ``io.iter_tsvs``, are never
+    cached.
+
+    '''
+    assert gene in ('v_gene', 'j_gene')
+    assert size_metric in ('clones', 'copies', 'uniques')
+
+    if is_chunked(df):
+        pdf, total_clones = _usage_pivot_chunked(df, pool, gene, size_metric)
+    else:
+        df = df.copy()
+        pdf = df.pivot_table(
+            index=pool, columns=gene, values=size_metric, aggfunc=np.sum,
+            observed=True
+        ).fillna(0)
+        total_clones = df.groupby(pool, observed=True).clone_id.nunique()
+    # Genes of typed reads are categorical
+    pdf.columns = pd.Index(np.asarray(pdf.columns), name=gene)
+    pdf.index = [
+        f'{c} ({int(total_clones.loc[c])})'
+        for c in pdf.index
+    ]
+    return pdf
+
+
 def plot_gene_usage(df, pool, gene, size_metric='clones', normalize_by='rows',
                     cluster_by='both', figsize=(30, 10)):
     '''
@@ -11,8 +61,11 @@ def plot_gene_usage(df, pool, gene, size_metric='clones', normalize_by='rows',
 
     Parameters
     -----------
-    df : pd.DataFrame
-        The DataFrame to use as the source of gene usage information.
+    df : pd.DataFrame or iterable
+        The DataFrame to use as the source of gene usage information.  This may
+        also be an iterable of DataFrames, such as the output of
+        ``io.iter_tsvs``, in which case usage is accumulated one chunk at a
+        time.
     gene : str (``v_gene`` or ``j_gene``)
         The gene to plot. Must be either ``v_gene`` or ``j_gene``.
     size_metric : str
@@ -33,19 +86,6 @@ def plot_gene_usage(df, pool, gene, size_metric='clones', normalize_by='rows',
 
     '''
 
-    assert gene in ('v_gene', 'j_gene')
-    assert size_metric in ('clones', 'copies', 'uniques')
-
-    df = df.copy()
-    pdf = df.pivot_table(
-        index=pool, columns=gene, values=size_metric, aggfunc=np.sum
-    ).fillna(0)
-
-    total_clones = df.groupby(pool).clone_id.nunique()
-    pdf.index = [
-        f'{c} ({int(total_clones.loc[c])})'
-        for c in pdf.index
-    ]
-
+    pdf = compute_gene_usage(df, pool, gene, size_metric)
     g = basic_clustermap(pdf, normalize_by, cluster_by, figsize)
     return g, pdf
@@ -1,9 +1,15 @@
 import numpy as np
+import pandas as pd
 import seaborn as sns
 import upsetplot as usp
 
 from matplotlib.colors import LinearSegmentedColormap
 
+from hicutils.core.cache import memoize
+from hicutils.core.keys import clone_keys, key_labels
+from hicutils.core.matrix import CloneMatrix, similarity_matrix
+from .heatmap import basic_clustermap
+
 
 def _sort_presence(df):
     return df.reindex(
@@ -11,6 +17,63 @@ def _sort_presence(df):
     )
 
 
+@memoize
+def _overlap_strings(df, pool, only_overlapping, overlapping_features,
+                     pivot_hook):
+    # The overlap table and the number of clones in each pool before
+    # filtering, which labels the plot's columns
+    matrix = CloneMatrix.from_df(
+        df, pool, features=overlapping_features, dropna=False
+    )
+
+    if len(matrix.pools) < 2:
+        raise IndexError('Overlap plots must have at least two columns')
+
+    col_clone_counts = matrix.clone_counts()
+
+    if only_overlapping:
+        matrix = matrix.filter_pools(2)
+        if len(matrix.clones) == 0:
+            raise IndexError('No overlapping clones')
+
+    # Labels are only created for the remaining clones, which are ordered by
+    # label as ties in the sort below keep this order
+    labels = key_labels(matrix.clones).rename('label')
+    rows = np.argsort(labels, kind='stable')
+    matrix = CloneMatrix(matrix.counts[rows], labels[rows], matrix.pools)
+
+    if pivot_hook:
+        pdf = pivot_hook(matrix.to_frame())
+        pdf = pdf.div(pdf.sum(axis=0), axis=1) * 100
+    else:
+        pdf = matrix.normalize(100).to_frame()
+
+    pdf['total'] = pdf.sum(axis=1)
+    pdf = (
+        pdf
+        .sort_values('total', ascending=False)
+        .drop('total', axis=1)
+    )
+    return pdf, col_clone_counts
+
+
+def compute_strings(
+        df,
+        pool,
+        only_overlapping=True,
+        overlapping_features=('clone_id', 'cdr3_aa', 'v_gene', 'j_gene'),
+        pivot_hook=None):
+    '''
+    Calculates the percent of each pool's copies in each clone plotted by
+    ``plot_strings``, with clones sorted by their total.  Results are not
+    cached when ``pivot_hook`` is specified.
+
+    '''
+    return _overlap_strings(
+        df, pool, only_overlapping, overlapping_features, pivot_hook
+    )[0]
+
+
 def plot_strings(
         df,
         pool,
@@ -74,39 +137,8 @@ def plot_strings(
     assert ylabels in ('counts', 'full')
     assert scale in (False, True, 'log')
 
-    df = df.copy()
-    df['label'] = df[list(overlapping_features)].apply(
-        lambda c: ' '.join([str(s) for s in c]),
-        axis=1
-    )
-
-    pdf = df.pivot_table(
-        index='label',
-        columns=pool,
-        values='copies',
-        aggfunc=np.sum
-    ).fillna(0)
-
-    if len(pdf.columns) < 2:
-        raise IndexError('Overlap plots must have at least two columns')
-
-    col_clone_counts = (pdf / pdf).sum()
-
-    if only_overlapping:
-        pdf = pdf[(pdf / pdf).sum(axis=1) >= 2]
-        if len(pdf) == 0:
-            raise IndexError('No overlapping clones')
-
-    if pivot_hook:
-        pdf = pivot_hook(pdf)
-
-    pdf = pdf.div(pdf.sum(axis=0), axis=1) * 100
-
-    pdf['total'] = pdf.sum(axis=1)
-    pdf = (
-        pdf
-        .sort_values('total', ascending=False)
-        .drop('total', axis=1)
+    pdf, col_clone_counts = _overlap_strings(
+        df, pool, only_overlapping, overlapping_features, pivot_hook
     )
     ret_df = pdf.copy()
 
@@ -176,8 +208,53 @@ def plot_strings(
     return g, ret_df
 
 
+def _clone_summary(df, features):
+    # The copies and mean SHM and CDR3 length of each clone, summed over its
+    # integer key rather than grouping on the feature values
+    keys, clones = clone_keys(df, features)
+    valid = keys >= 0
+    keys = keys[valid]
+
+    def _sum(field):
+        values = df[field].to_numpy(dtype=float)[valid]
+        present = ~np.isnan(values)
+        return (
+            np.bincount(keys, np.where(present, values, 0), len(clones)),
+            np.bincount(keys, present, len(clones))
+        )
+
+    summary = pd.DataFrame({
+        'clones': 1,
+        'copies': _sum('copies')[0].astype(df['copies'].dtype)
+    }, index=clones)
+    for field in ('shm', 'cdr3_num_nts'):
+        total, count = _sum(field)
+        summary[field] = total / np.where(count > 0, count, np.nan)
+    return summary
+
+
+@memoize
+def compute_upset(df, pool, size='clones', clone_features=['clone_id']):
+    '''
+    Calculates the presence of each clone in each pool, indexing its copies
+    and mean SHM and CDR3 length, as plotted by ``plot_upset``.
+
+    '''
+    assert size in ('clones', 'copies')
+    if df.groupby(pool).ngroups < 2:
+        raise IndexError(f'Pool "{pool}" must have 2+ values')
+
+    index = CloneMatrix.from_df(
+        df, pool, features=clone_features, values=size
+    ).presence().to_frame()
+
+    return index.join(_clone_summary(df, clone_features)).set_index(
+        list(index.columns)
+    )
+
+
 def plot_upset(df, pool, size='clones', clone_features=['clone_id'],
-               subplots=tuple(), subplot_kind='violin', **kwargs):
+               subplots=tuple(), subplot_kind='violin', fig=None, **kwargs):
     '''
     Generates an UpSet plot of clonal data.  The UpSet plot may be scaled by
     clones or copies with ``size`` and the definition of a clone can be varied
@@ -205,6 +282,9 @@ def plot_upset(df, pool, size='clones', clone_features=['clone_id'],
     subplot_kind : str
         The kind of plot to use for ``subplots``.  Any valid ``sns.catplot``
         type is allowed (e.g. ``box``, ``violin``)
+    fig : matplotlib.figure.Figure, optional
+        The figure on which to draw the plot.  By default a new figure is
+        created.
     kwargs : dict
         Other parameters to pass to ``usp.UpSet``
 
@@ -214,25 +294,7 @@ def plot_upset(df, pool, size='clones', clone_features=['clone_id'],
     underlying overlap DataFrame.
 
     '''
-    assert size in ('clones', 'copies')
-    if df.groupby(pool).ngroups < 2:
-        raise IndexError(f'Pool "{pool}" must have 2+ values')
-
-    pdf = df.pivot_table(
-        index=clone_features,
-        columns=pool,
-        values=size,
-        aggfunc=np.sum
-    )
-    index = pdf.apply(lambda r: r > 0, axis=1).fillna(False)
-
-    counts_df = df.groupby(clone_features).agg({
-        'clones': lambda v: 1,
-        'copies': np.sum,
-        'shm': np.mean,
-        'cdr3_num_nts': np.mean
-    })
-    cdf = index.join(counts_df).set_index(list(index.columns))
+    cdf = compute_upset(df, pool, size, clone_features)
 
     with sns.plotting_context('notebook'):
         figure = usp.UpSet(
@@ -245,9 +307,53 @@ def plot_upset(df, pool, size='clones', clone_features=['clone_id'],
                 value=field, kind=subplot_kind, color=sns.color_palette()[i],
                 elements=3
             )
-        ax = figure.plot()
+        ax = figure.plot(fig=fig)
 
         for extra in [k for k in ax.keys() if k.startswith('extra')]:
             ax[extra].set_ylabel(ax[extra].get_ylabel(), fontsize=15)
             ax[extra].yaxis.tick_right()
         return ax, cdf
+
+
+@memoize
+def compute_similarity(df, pool, metric='jaccard',
+                       clone_features=['clone_id']):
+    '''
+    Calculates the pairwise similarity of all pools plotted by
+    ``plot_similarity``.
+
+    '''
+    return similarity_matrix(df, pool, metric, clone_features=clone_features)
+
+
+def plot_similarity(df, pool, metric='jaccard', clone_features=['clone_id'],
+                    cluster_by='both', figsize=None):
+    '''
+    Plots the pairwise similarity of all pools as a clustered heatmap.
+
+    Parameters
+    ----------
+    df : pd.DataFrame
+        The DataFrame to use as the source of clonal overlap information.
+    pool : str
+        How to pool the clones to calculate overlap.
+    metric : str
+        The similarity metric: ``shared``, ``jaccard``, ``morisita_horn`` or
+        ``copies``.  See ``core.matrix.CloneMatrix.similarity`` for details.
+    clone_features : list(str)
+        The feature(s) to use for clone definition.
+    cluster_by : str
+        How to cluster the heatmap, one of ``rows``, ``cols``, ``both`` or
+        ``None``.
+    figsize : tuple(int, int)
+        The size of the figure.
+
+    Returns
+    -------
+    A tuple ``(g, df)`` where ``g`` is a handle to the plot and ``df`` is the
+    underlying similarity matrix.
+
+    '''
+    sim = compute_similarity(df, pool, metric, clone_features)
+    g = basic_clustermap(sim, None, cluster_by, figsize=figsize)
+    return g, sim
@@ -1,24 +1,66 @@
-import re
-
 import numpy as np
 import pandas as pd
 import seaborn as sns
 
+from hicutils.core.binning import bucketize
+from hicutils.core.cache import memoize
+from .axes import catplot, relplot
 
-def _add_counts(df, field):
-    sizes = df.groupby(field).size()
-    df[field] = df[field].apply(lambda f: f'{f} ({sizes[f]})')
-    return df
 
+def _pool_labels(df, pool):
+    # Returns integer pool codes for each row (-1 if null) numbered in order
+    # of the pools' labels, and the labels, ``"<pool> (<rows>)"``, which are
+    # built once per pool
+    codes, pools = pd.factorize(df[pool])
+    sizes = np.bincount(codes[codes >= 0], minlength=len(pools))
+    labels = np.array(
+        [f'{p} ({n})' for p, n in zip(pools, sizes)], dtype=object
+    )
+    order = np.argsort(labels)
+    rank = np.empty_like(order)
+    rank[order] = np.arange(len(order))
+    return np.where(codes >= 0, rank[codes], -1), labels[order]
+
+
+def _shm_distribution(df, pool, size_metric, decimals):
+    # The percent of each pool's ``size_metric`` at each SHM value (rounded
+    # to ``decimals``) computed as one weighted histogram over all pools
+    codes, labels = _pool_labels(df, pool)
+    shm = df['shm'].round(decimals).to_numpy()
+    valid = (codes >= 0) & ~np.isnan(shm)
+    bins, values = pd.factorize(shm[valid], sort=True)
+    codes = codes[valid]
+    weights = df[size_metric].to_numpy()[valid].astype(float)
+
+    keys = bins.astype(np.int64) * len(labels) + codes
+    n_keys = len(values) * len(labels)
+    sizes = np.bincount(keys, weights=weights, minlength=n_keys)
+    totals = np.bincount(codes, weights=weights, minlength=len(labels))
+    keys = np.flatnonzero(np.bincount(keys, minlength=n_keys))
+    return pd.DataFrame({
+        'shm': values[keys // len(labels)],
+        pool: labels[keys % len(labels)],
+        'size': 100 * sizes[keys] / totals[keys % len(labels)],
+    })
+
+
+@memoize
+def compute_shm_distribution(df, pool, size_metric, order=None):
+    '''
+    Calculates the percent of each pool's ``size_metric`` at each SHM value
+    plotted by ``plot_shm_distribution``.
 
-def _get_shm(pdf, df, pool, size_metric):
-    total = df[df[pool] == pdf.name[1]][size_metric].sum()
-    ret = pd.Series({'size': 100 * pdf[size_metric].sum() / total})
-    return ret
+    '''
+    assert size_metric in ('clones', 'copies', 'uniques')
+    df = df.copy()
+    if order:
+        df['order'] = df[pool].apply(order.index)
+        df = df.sort_values('order').drop('order', axis=1)
+    return _shm_distribution(df, pool, size_metric, 0)
 
 
 def plot_shm_distribution(df, pool, size_metric, palette=None, order=None,
-                          **kwargs):
+                          ax=None, **kwargs):
     '''
     Plots the SHM distribution of a pooled DataFrame using either clones,
     copies, or uniques as a size metric.
@@ -32,6 +74,9 @@ def plot_shm_distribution(df, pool, size_metric, palette=None, order=None,
     size_metric : str
         The metric to determine each clones' size.  Must be ``clones``,
         ``copies``, or ``uniques``.
+    ax : matplotlib.axes.Axes, optional
+        The axes on which to draw the plot.  By default a new figure is
+        created.
 
     Returns
     -------
@@ -40,18 +85,7 @@ def plot_shm_distribution(df, pool, size_metric, palette=None, order=None,
 
     '''
 
-    assert size_metric in ('clones', 'copies', 'uniques')
-    df = df.copy()
-    if order:
-        df['order'] = df[pool].apply(order.index)
-        df = df.sort_values('order').drop('order', axis=1)
-    df = _add_counts(df, pool)
-    df['shm'] = df['shm'].round()
-    df = (
-        df
-        .groupby(['shm', pool])
-        .apply(_get_shm, df, pool, size_metric).reset_index()
-    )
+    df = compute_shm_distribution(df, pool, size_metric, order)
 
     final_colors = None
     if palette:
@@ -62,7 +96,8 @@ def plot_shm_distribution(df, pool, size_metric, palette=None, order=None,
                     final_colors[label] = color
 
     with sns.plotting_context('poster'):
-        g = sns.relplot(
+        g = relplot(
+            ax,
             data=df,
             x='shm',
             y='size',
@@ -80,7 +115,7 @@ def plot_shm_distribution(df, pool, size_metric, palette=None, order=None,
     return g, df
 
 
-def plot_shm_aggregate(df, pool, **kwargs):
+def plot_shm_aggregate(df, pool, ax=None, **kwargs):
     '''
     Categorically plots the SHM of each pool.
 
@@ -90,6 +125,9 @@ def plot_shm_aggregate(df, pool, **kwargs):
         The DataFrame used to plot the SHM.
     pool : str
         The pool to use for plotting.
+    ax : matplotlib.axes.Axes, optional
+        The axes on which to draw the plot.  By default a new figure is
+        created.
 
     Returns
     -------
@@ -98,7 +136,8 @@ def plot_shm_aggregate(df, pool, **kwargs):
 
     '''
 
-    g = sns.catplot(
+    g = catplot(
+        ax,
         data=df,
         x=pool,
         y='shm',
@@ -109,35 +148,38 @@ def plot_shm_aggregate(df, pool, **kwargs):
     return g, df
 
 
-def _clone_frac_norm(df):
-    df = df.groupby('shm_bucket').clone_id.nunique()
-    df = 100 * df / df.sum()
-    return df.to_frame()
-
+def _shm_bucket_label(start, end):
+    if end is None:
+        return f'{start}+'
+    return f'[{start}-{end})'
 
-def _get_bucket(shm, buckets=(1, 2, 5, 10, 20)):
-    buckets = [0, *buckets]
-    for i, b in enumerate(buckets[:-1]):
-        if b <= shm < buckets[i + 1]:
-            return f'[{b}-{buckets[i + 1]})'
-    return f'{buckets[-1]}+'
 
+@memoize
+def compute_shm_range(df, pool, buckets=(1, 10, 25)):
+    '''
+    Calculates the percent of each pool's clones in each SHM bucket plotted
+    by ``plot_shm_range``.
 
-def _sort_buckets(buckets):
-    bucket_info = [
-        (
-            int(re.search(r'\d+', b).group()) if '-' in b
-            else int(re.search(r'\d+', b).group()) + 1,
-            b
-        )
-        for b in buckets
-    ]
-    return [
-        buckets.index(b[1]) for b in sorted(bucket_info, key=lambda b: b[0])
-    ]
+    '''
+    buckets = [b for b in buckets if b < df.shm.max()]
+    shm_bucket = pd.Series(
+        bucketize(df['shm'], [0, *buckets], _shm_bucket_label),
+        index=df.index,
+        name='shm_bucket'
+    )
+    df = (
+        df
+        .groupby([pool, shm_bucket], observed=True)
+        .clone_id.nunique()
+        .unstack()
+    )
+    df = 100 * df.div(df.sum(axis=1), axis=0)
+    df.index = pd.Index(np.asarray(df.index), name=df.index.name)
+    df.columns = pd.Index(df.columns.astype(str), name='shm_bucket')
+    return df
 
 
-def plot_shm_range(df, pool, buckets=(1, 10, 25), **kwargs):
+def plot_shm_range(df, pool, buckets=(1, 10, 25), ax=None, **kwargs):
     '''
     Plot the range of clonal SHM for each pool.
 
@@ -153,6 +195,9 @@ def plot_shm_range(df, pool, buckets=(1, 10, 25), **kwargs):
         ``[10, 25)``, and ``25+``.  All intervals are left-closed; that is the
         lesser value in each interval is inclusive and the greater value is
         exclusive.
+    ax : matplotlib.axes.Axes, optional
+        The axes on which to draw the plot.  By default a new figure of size
+        ``figsize`` is created.
 
     Returns
     -------
@@ -161,25 +206,17 @@ def plot_shm_range(df, pool, buckets=(1, 10, 25), **kwargs):
 
     '''
 
-    buckets = [b for b in buckets if b < df.shm.max()]
-    df = df.copy()
-    df['shm_bucket'] = df['shm'].apply(_get_bucket, buckets=buckets)
-    df = (
-        df
-        .groupby(pool)
-        .apply(_clone_frac_norm)
-        .unstack()['clone_id']
-    )
-    df = df[[df.columns[i] for i in _sort_buckets(list(df.columns))]]
+    df = compute_shm_range(df, pool, buckets)
     with sns.plotting_context('poster'):
         g = (
             df
             .plot
             .bar(
                 stacked=True,
-                figsize=kwargs.pop('figsize', (12, 8)),
+                figsize=kwargs.pop('figsize', (12, 8)) if ax is None else None,
                 color=kwargs.pop('color', sns.color_palette()[1:]),
-                legend='reverse'
+                legend='reverse',
+                ax=ax
             )
         )
         g.set(xlabel='', ylabel='% of Mutated Clones')
@@ -195,8 +232,24 @@ def plot_shm_range(df, pool, buckets=(1, 10, 25), **kwargs):
     return g, df
 
 
+@memoize
+def compute_shm_distribution_bar(df, pool, size_metric,
+                                 evaluation_bins=np.arange(0, 10, .25)):
+    '''
+    Calculates the percent of each pool's ``size_metric`` in each of
+    ``evaluation_bins`` plotted by ``plot_shm_distribution_bar``.
+
+    '''
+    assert size_metric in ('clones', 'copies', 'uniques')
+    df = _shm_distribution(df, pool, size_metric, 1)
+    evaluation_bins = np.append(evaluation_bins, float('inf'))
+    df['shm'] = pd.cut(df['shm'], bins=evaluation_bins, include_lowest=True)
+    return df
+
+
 def plot_shm_distribution_bar(df, pool, size_metric, palette,
-                              evaluation_bins=np.arange(0, 10, .25), **kwargs):
+                              evaluation_bins=np.arange(0, 10, .25), ax=None,
+                              **kwargs):
     '''
     Plots the SHM distribution of a pooled DataFrame using either clones,
     copies, or uniques as a size metric.
@@ -212,6 +265,9 @@ def plot_shm_distribution_bar(df, pool, size_metric, palette,
         ``copies``, or ``uniques``.
     palette: list
         Dictionary of color palette values for each hue value.
+    ax : matplotlib.axes.Axes, optional
+        The axes on which to draw the plot.  By default a new figure is
+        created.
 
     Returns
     -------
@@ -220,19 +276,10 @@ def plot_shm_distribution_bar(df, pool, size_metric, palette,
 
     '''
 
-    assert size_metric in ('clones', 'copies', 'uniques')
-    df = df.copy()
-    df = _add_counts(df, pool)
-    df['shm'] = df['shm'].round(1)
-    df = (
-        df
-        .groupby(['shm', pool])
-        .apply(_get_shm, df, pool, size_metric).reset_index()
-    )
-    evaluation_bins = np.append(evaluation_bins, float('inf'))
-    df['shm'] = pd.cut(df['shm'], bins=evaluation_bins, include_lowest=True)
+    df = compute_shm_distribution_bar(df, pool, size_metric, evaluation_bins)
     with sns.plotting_context('poster'):
-        g = sns.catplot(
+        g = catplot(
+            ax,
             data=df,
             x='shm',
             y='size',
@@ -248,5 +295,5 @@ def plot_shm_distribution_bar(df, pool, size_metric, palette,
             xlabel='SHM',
             ylabel=f'% of {size_metric}',
         )
-        g.set_xticklabels(rotation=90)
+        g.tick_params(axis='x', labelrotation=90)
     return g, df
@@ -0,0 +1,38 @@
+import pytest
+
+import matplotlib.pyplot as plt
+
+from hicutils.core import io
+import hicutils.plots as plots
+
+
+@pytest.mark.parametrize('n_jobs', [1, 2])
+def test_render_batch(n_jobs, tmp_path):
+    df = io.read_tsvs('tests/input', 'disease')
+    jobs = [
+        (plots.plot_cdr3_spectratype, sdf, {'color_top': 5},
+         f'{subject}/spectratype')
+        for subject, sdf in df.groupby('subject')
+    ]
+    jobs.append((plots.plot_ranges, df, {'pool': 'missing'}, 'failed'))
+
+    status = plots.render_batch(jobs, tmp_path, ext='png', n_jobs=n_jobs)
+    assert list(status.name) == [job[3] for job in jobs]
+    assert status.error.iloc[:-1].isna().all()
+    assert 'KeyError' in status.error.iloc[-1]
+    for subject in df.subject.unique():
+        assert (tmp_path / subject / 'spectratype.png').exists()
+        assert (tmp_path / subject / 'spectratype.tsv').exists()
+    assert not (tmp_path / 'failed.png').exists()
+
+
+def test_render_batch_keeps_open_figures(tmp_path):
+    df = io.read_tsvs('tests/input', 'disease')
+    fig = plt.figure()
+    jobs = [
+        (plots.plot_cdr3_spectratype, df, {'color_top': 5}, 'spectratype'),
+        (plots.plot_ranges, df, {'pool': 'missing'}, 'failed'),
+    ]
+    plots.render_batch(jobs, tmp_path, ext='png')
+    assert plt.get_fignums() == [fig.number]
+    plt.close(fig)
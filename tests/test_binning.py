@@ -0,0 +1,12 @@
+import numpy as np
+from hicutils.core.binning import bucketize
+
+
+def test_bucketize():
+    buckets = bucketize(
+        [0, 0.5, 1, 9.99, 10, 250, np.nan, -1], [0, 1, 10],
+        lambda s, e: f'[{s}-{e})' if e is not None else f'{s}+'
+    )
+    assert list(buckets.categories) == ['[0-1)', '[1-10)', '10+']
+    assert list(buckets.codes) == [0, 0, 1, 1, 2, 2, -1, -1]
+    assert buckets.ordered
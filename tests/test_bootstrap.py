@@ -0,0 +1,61 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from hicutils.core import io
+from hicutils.core.bootstrap import bootstrap_metrics
+from hicutils.core.diversity import diversity_table
+
+METRICS = ('richness', 'shannon', 'clonality', 'top_10', 'top_1000', 'shm')
+
+
+@pytest.mark.parametrize('pool', ['subject', 'disease'])
+def test_bootstrap_metrics(pool):
+    df = io.read_tsvs('tests/input', 'disease')
+    pdf = bootstrap_metrics(df, pool, METRICS, replicates=200, seed=1)
+
+    expected = diversity_table(df, pool)
+    np.testing.assert_allclose(pdf['clonality'], expected['clonality'])
+    np.testing.assert_allclose(pdf['top_1000'], 1)
+    np.testing.assert_allclose(
+        pdf['shm'],
+        df.groupby(pool).apply(lambda g: np.average(g.shm, weights=g.copies))
+    )
+    for metric in METRICS:
+        assert (pdf[f'{metric}_low'] <= pdf[f'{metric}_high']).all()
+
+    pd.testing.assert_frame_equal(
+        bootstrap_metrics(
+            df, pool, METRICS, replicates=200, seed=1, n_jobs=2
+        ),
+        pdf
+    )
+
+
+def test_bootstrap_replicates():
+    df = pd.DataFrame({
+        'subject': ['A', 'A', 'B'],
+        'clone_id': [1, 2, 1],
+        'copies': [3, 1, 4],
+    })
+    replicates = bootstrap_metrics(
+        df, 'subject', ['richness', 'top_1'], replicates=50, seed=2,
+        return_replicates=True
+    )
+    assert replicates.shape == (100, 2)
+    assert set(replicates.loc['A', 'richness']) <= {1, 2}
+    assert (replicates.loc['B'] == 1).all().all()
+
+
+def test_bootstrap_seed_sequence():
+    df = pd.DataFrame({
+        'subject': ['A', 'A', 'A', 'B'],
+        'clone_id': [1, 2, 3, 1],
+        'copies': [3, 1, 2, 4],
+    })
+    pd.testing.assert_frame_equal(
+        bootstrap_metrics(df, 'subject', ['richness', 'shannon'],
+                          replicates=50, seed=np.random.SeedSequence(4)),
+        bootstrap_metrics(df, 'subject', ['richness', 'shannon'],
+                          replicates=50, seed=4)
+    )
@@ -0,0 +1,81 @@
+import pytest
+
+import numpy as np
+import pandas as pd
+from hicutils.core import cache, io
+import hicutils.plots as plots
+
+DF = pd.DataFrame({
+    'a': [1, 2, 3],
+    'b': ['x', 'y', None],
+    'c': pd.Categorical(['u', 'v', 'u']),
+})
+
+
+@pytest.mark.parametrize(
+    'other',
+    [
+        DF.assign(a=[1, 2, 4]),
+        DF.assign(b=['x', 'y', 'z']),
+        DF.rename(columns={'a': 'd'}),
+        DF.astype({'a': float}),
+        DF.set_index(pd.Index([0, 1, 3])),
+        DF.assign(c=pd.Categorical(['u', 'v', 'u'], categories=['v', 'u'])),
+        DF['a'],
+        DF.to_numpy(),
+    ]
+)
+def test_fingerprint(other):
+    assert cache.fingerprint(DF) == cache.fingerprint(DF.copy())
+    assert cache.fingerprint(DF) != cache.fingerprint(other)
+
+
+def test_fingerprint_values():
+    assert cache.fingerprint({'a': 1, 'b': 2}) == cache.fingerprint(
+        {'b': 2, 'a': 1}
+    )
+    assert cache.fingerprint((1, 'a')) != cache.fingerprint(('1', 'a'))
+    assert cache.fingerprint(np.arange(3)) != cache.fingerprint(
+        np.arange(3.0)
+    )
+
+
+@pytest.mark.parametrize('path', [None, 'cache'])
+def test_memoize(path, tmp_path):
+    calls = []
+
+    @cache.memoize
+    def compute(df, n=1, func=None):
+        calls.append(n)
+        return df * n
+
+    compute(DF[['a']], 2)
+    compute(DF[['a']], 2)
+    assert calls == [2, 2]
+    calls.clear()
+
+    cache.configure_cache(path=path and tmp_path / path)
+    try:
+        result = compute(DF[['a']], 2)
+        result['a'] = 0
+        pd.testing.assert_frame_equal(compute(DF[['a']], n=2), DF[['a']] * 2)
+        assert calls == [2]
+
+        compute(DF[['a']], 3)
+        compute(DF[['a']], 3, func=len)
+        compute(DF[['a']], 3, func=len)
+        assert calls == [2, 3, 3, 3]
+
+        cache.clear_cache()
+        compute(DF[['a']], 2)
+        assert calls == [2, 3, 3, 3] + ([] if path else [2])
+    finally:
+        cache.configure_cache(enabled=False)
+        cache.clear_cache()
+
+
+def test_compute_plot_data():
+    df = io.read_tsvs('tests/input', 'disease')
+    expected = plots.compute_ranges(df, 'subject')
+    _, pdf = plots.plot_ranges(df, 'subject', color=['r', 'g', 'b'])
+    pd.testing.assert_frame_equal(pdf, expected)
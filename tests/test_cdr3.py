@@ -0,0 +1,56 @@
+from collections import Counter
+
+import pytest
+
+import pandas as pd
+from hicutils.core import cdr3, io
+
+
+DF = io.read_tsvs('tests/input', 'disease')
+
+
+@pytest.mark.parametrize('size_metric', ['clones', 'copies'])
+def test_aa_composition(size_metric):
+    # Duplicated clones are only counted once when sizing by clones
+    df = pd.concat([DF, DF.iloc[:50]])
+    counts = cdr3.aa_composition(df, 'subject', size_metric)
+
+    if size_metric == 'clones':
+        df = DF
+    for subject, sdf in df.groupby('subject'):
+        expected = Counter()
+        for seq, size in zip(sdf.cdr3_aa, sdf[size_metric]):
+            for aa, n in Counter(seq).items():
+                expected[aa] += n * size
+        assert counts.loc[subject][counts.loc[subject] > 0].to_dict() == (
+            expected
+        )
+
+
+@pytest.mark.parametrize(
+    'by,size_metric',
+    [
+        ('cdr3_aa', None),
+        ('cdr3_nt', 'copies'),
+    ]
+)
+def test_position_counts(by, size_metric):
+    counts = cdr3.position_counts(DF, by, 'subject', size_metric)
+    for (subject, length), sdf in DF.groupby(
+            ['subject', DF[by].str.len()]):
+        weights = sdf[size_metric] if size_metric else pd.Series(1, sdf.index)
+        m = counts.loc[(subject, length)]
+        assert m.shape[0] == length
+        for pos in range(length):
+            expected = weights.groupby(sdf[by].str[pos]).sum()
+            assert (m.loc[pos, expected.index] == expected).all()
+            assert m.loc[pos].sum() == expected.sum()
+
+
+@pytest.mark.parametrize('pool', [None, 'subject'])
+def test_position_counts_empty(pool):
+    counts = cdr3.position_counts(DF.iloc[:0], 'cdr3_aa', pool)
+    assert counts.empty
+    assert counts.index.names == [*([pool] if pool else []), 'length', 'pos']
+    with pytest.raises(ValueError, match='length 10'):
+        cdr3.position_matrix(counts, 10, 'HPAP010' if pool else None)
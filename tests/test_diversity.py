@@ -0,0 +1,67 @@
+import numpy as np
+import pandas as pd
+
+from hicutils.core import io, metadata
+from hicutils.core.diversity import diversity_table, rarefaction_curves
+
+DF = pd.DataFrame({
+    'subject': ['A', 'A', 'A', 'A', 'B', 'B', 'C'],
+    'clone_id': [1, 2, 2, 3, 1, 2, 1],
+    'copies': [6, 1, 1, 2, 5, 5, 3],
+})
+
+
+def test_diversity_table():
+    pdf = diversity_table(DF, 'subject', orders=(0, 1, 2, 3))
+
+    freqs = np.array([.6, .2, .2])
+    shannon = -(freqs * np.log(freqs)).sum()
+    a = pdf.loc['A']
+    assert a['richness'] == 3
+    np.testing.assert_allclose(a['shannon'], shannon)
+    np.testing.assert_allclose(a['simpson'], (freqs ** 2).sum())
+    np.testing.assert_allclose(a['hill_0'], 3)
+    np.testing.assert_allclose(a['hill_1'], np.exp(shannon))
+    np.testing.assert_allclose(a['hill_2'], 1 / (freqs ** 2).sum())
+    np.testing.assert_allclose(
+        a['hill_3'], ((freqs ** 3).sum()) ** (1 / (1 - 3))
+    )
+    np.testing.assert_allclose(a['gini'], 4 / 15)
+    np.testing.assert_allclose(a['clonality'], 1 - shannon / np.log(3))
+    # No singletons, three clones of size two
+    assert a['chao1'] == 3
+    assert a['d50'] == 1
+
+    b = pdf.loc['B']
+    np.testing.assert_allclose(b[['gini', 'clonality']], [0, 0], atol=1e-12)
+    assert b['d50'] == 1
+    assert np.isnan(pdf.loc['C', 'clonality'])
+
+
+def test_diversity_table_parallel():
+    df = io.read_tsvs('tests/input', 'disease')
+    expected = diversity_table(df, 'subject', ['cdr3_aa', 'v_gene'])
+    pd.testing.assert_frame_equal(
+        diversity_table(df, 'subject', ['cdr3_aa', 'v_gene'], n_jobs=2),
+        expected
+    )
+
+    table = metadata.make_metadata_table(df, 'subject', diversity=True)
+    pd.testing.assert_frame_equal(
+        table[diversity_table(df, 'subject').columns],
+        diversity_table(df, 'subject')
+    )
+
+
+def test_rarefaction_curves():
+    curves = rarefaction_curves(DF, 'subject', depths=[0, 1, 2, 5, 10, 11])
+    a = curves[curves.subject == 'A'].set_index('depth').clones
+    # Sampling without replacement from clones of sizes 6, 2 and 2
+    np.testing.assert_allclose(
+        a[[0, 1, 2, 10]], [0, 1, 1 + 1 - (6 * 5 + 2 * 1 * 2) / 90, 3]
+    )
+    assert np.isnan(a[11])
+
+    curves = rarefaction_curves(DF, 'subject', points=3)
+    assert list(curves.depth) == [0, 5, 10, 0, 5, 10, 0, 2, 3]
+    assert list(curves.clones.iloc[[2, 5, 8]]) == [3, 2, 1]
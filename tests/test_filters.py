@@ -0,0 +1,58 @@
+import pytest
+
+from hicutils.core import filters, io
+
+
+DF = io.read_tsvs('tests/input', 'disease')
+
+
+@pytest.mark.parametrize(
+    'n,func,limit_to',
+    [
+        (2, 'greater_equal', None),
+        (1, 'equal', None),
+        (0, 'equal', ['HPAP010', 'HPAP015']),
+        (1, 'less_equal', ['HPAP010', 'HPAP017']),
+    ]
+)
+def test_filter_number_of_pools(n, func, limit_to):
+    pdf = DF.pivot_table(
+        index='cdr3_aa', columns='subject', values='copies', aggfunc='sum'
+    )
+    if limit_to:
+        pdf = pdf[limit_to]
+    counts = pdf.notna().sum(axis=1)
+    expected = DF[DF.cdr3_aa.isin(counts[getattr(counts, {
+        'greater_equal': 'ge', 'equal': 'eq', 'less_equal': 'le'
+    }[func])(n)].index)]
+
+    df = DF.assign(clone_id=DF.cdr3_aa)
+    mask = filters.number_of_pools_mask(df, 'subject', n, func, limit_to)
+    assert mask.index.equals(df.index)
+    assert df[mask].index.equals(expected.index)
+
+
+def test_filter_chain():
+    df = DF.assign(clone_id=DF.cdr3_aa)
+    chain = filters.FilterChain().functional().overall_copies(3)
+    chain = chain.number_of_pools('subject', 2).where(lambda d: d.copies > 1)
+
+    expected = filters.filter_number_of_pools(
+        filters.filter_by_overall_copies(filters.filter_functional(df), 3),
+        'subject', 2
+    )
+    expected = expected[expected.copies > 1]
+    assert len(expected) > 0
+    assert chain.mask(df).index.equals(df.index)
+    assert chain.apply(df).index.equals(expected.index)
+
+
+@pytest.mark.parametrize('field', ['clone_id', 'cdr3_aa'])
+def test_filter_chain_overall_copies_field(field):
+    expected = filters.filter_by_overall_copies(DF, 20, field=field)
+    assert 0 < len(expected) < len(DF)
+    assert expected[field].isin(
+        filters.total_copies(DF, field).loc[lambda t: t >= 20].index
+    ).all()
+    chain = filters.FilterChain().overall_copies(20, field=field)
+    assert chain.apply(DF).index.equals(expected.index)
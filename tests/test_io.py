@@ -1,5 +1,9 @@
 import pytest
+import warnings
 
+import numpy as np
+import pandas as pd
+from matplotlib.figure import Figure
 from hicutils.core import io, metadata
 from .expected import is_expected
 
@@ -15,3 +19,169 @@ def test_read_tsvs(path, features):
     is_expected(df, 'tests/expected/io_test.tsv')
     mdf = metadata.make_metadata_table(df, 'disease').reset_index()
     is_expected(mdf, 'tests/expected/metadata.tsv')
+
+
+@pytest.mark.parametrize(
+    'path,features',
+    [
+        ('tests/input', 'disease'),
+    ]
+)
+def test_read_tsvs_parallel(path, features):
+    serial = io.read_tsvs(path, features, typed=True)
+    df = io.read_tsvs(path, features, n_jobs=2, typed=True)
+    pd.testing.assert_frame_equal(df, serial)
+    for col, dtype in io.AIRR_DTYPES.items():
+        assert df[col].dtype == dtype
+
+    # Parallel reads are only typed when requested and typing does not change
+    # the derived SHM
+    untyped = io.read_tsvs(path, features)
+    pd.testing.assert_frame_equal(
+        io.read_tsvs(path, features, n_jobs=2), untyped
+    )
+    pd.testing.assert_series_equal(df['shm'], untyped['shm'])
+
+    df = io.read_tsvs(path, features, n_jobs=2, usecols=['clone_id'])
+    assert set(df.columns) == {
+        'clone_id', 'copies', 'avg_v_identity', features, 'copies_fraction',
+        'copies_percent', 'shm', 'clones'
+    }
+
+
+@pytest.mark.parametrize(
+    'path,features,n_jobs',
+    [
+        ('tests/input', 'disease', 1),
+        ('tests/input', 'disease', 2),
+    ]
+)
+def test_read_tsvs_cache(path, features, n_jobs, tmp_path):
+    df = io.read_tsvs(path, features, n_jobs=n_jobs)
+    for _ in range(2):
+        cached = io.read_tsvs(path, features, n_jobs=n_jobs, cache=tmp_path)
+        # pandas only warns about None and NaN mismatches
+        with warnings.catch_warnings():
+            warnings.simplefilter('error')
+            pd.testing.assert_frame_equal(cached, df)
+    assert (tmp_path / 'manifest.json').exists()
+
+
+@pytest.mark.parametrize(
+    'path,features,chunksize',
+    [
+        ('tests/input', 'disease', None),
+        ('tests/input', 'disease', 100),
+    ]
+)
+def test_iter_tsvs(path, features, chunksize):
+    df = io.read_tsvs(path, features)
+    chunked = pd.concat(io.iter_tsvs(path, features, chunksize=chunksize))
+    pd.testing.assert_frame_equal(
+        chunked.sort_values(['clone_id', 'subject']).reset_index(drop=True),
+        df.sort_values(['clone_id', 'subject']).reset_index(drop=True)
+    )
+
+    pd.testing.assert_frame_equal(
+        metadata.make_metadata_table(
+            io.iter_tsvs(path, features, chunksize=chunksize), 'disease'
+        ),
+        metadata.make_metadata_table(df, 'disease'),
+        check_dtype=False
+    )
+
+
+def test_metadata_table_parallel_and_incremental(tmp_path):
+    df = io.read_tsvs('tests/input', 'disease')
+    expected = metadata.make_metadata_table(df, 'subject')
+    pd.testing.assert_frame_equal(
+        metadata.make_metadata_table(df, 'subject', n_jobs=2), expected
+    )
+
+    state = metadata.MetadataState('subject').update(df.iloc[::2])
+    state.save(tmp_path / 'metadata.pkl')
+    state = metadata.MetadataState.load(tmp_path / 'metadata.pkl')
+    pd.testing.assert_frame_equal(
+        state.update(df.iloc[1::2]).to_frame(), expected
+    )
+
+
+def test_metadata_state_nulls():
+    df = io.read_tsvs('tests/input', 'disease')
+    df.loc[df.copies == 1, 'cdr3_num_nts'] = np.nan
+    df.loc[df.copies == 2, 'avg_v_identity'] = np.nan
+    df.loc[df.copies == 3, 'clone_id'] = np.nan
+    state = metadata.MetadataState('subject')
+    for chunk in np.array_split(np.arange(len(df)), 3):
+        state.update(df.iloc[chunk])
+    pd.testing.assert_frame_equal(
+        state.to_frame(), metadata.make_metadata_table(df, 'subject')
+    )
+
+
+@pytest.mark.parametrize(
+    'data_format,compression,suffix',
+    [
+        ('tsv', None, 'tsv'),
+        ('tsv', 'gzip', 'tsv.gz'),
+        ('parquet', None, 'parquet'),
+    ]
+)
+def test_figure_writer(data_format, compression, suffix, tmp_path):
+    df = pd.DataFrame({'a': range(10), 'b': list('abcdefghij')})
+    with io.FigureWriter(tmp_path, ext='png', data_format=data_format,
+                         compression=compression, n_threads=2,
+                         max_pending=2) as writer:
+        for i in range(5):
+            fig = Figure()
+            fig.subplots().plot(df['a'])
+            writer.save(str(i), df, fig=fig, index=False)
+
+    for i in range(5):
+        assert (tmp_path / f'{i}.png').exists()
+        if data_format == 'tsv':
+            saved = pd.read_csv(tmp_path / f'{i}.{suffix}', sep='\t')
+        else:
+            saved = pd.read_parquet(tmp_path / f'{i}.{suffix}')
+        pd.testing.assert_frame_equal(saved, df)
+
+
+def test_figure_writer_error(tmp_path):
+    writer = io.FigureWriter(tmp_path / 'missing')
+    writer.save('a', pd.DataFrame({'a': [1]}), fig=Figure())
+    with pytest.raises(OSError):
+        writer.close()
+
+
+def test_read_tsvs_cache_nulls(tmp_path):
+    pd.DataFrame({
+        'clone_id': [1, 2],
+        'subject': ['S1', 'S1'],
+        'v_gene': ['IGHV1-2', None],
+        'copies': [3, 1],
+        'avg_v_identity': [.9, .95],
+    }).to_csv(tmp_path / 'S1.D1.pooled.tsv', sep='\t', index=False)
+    df = io.read_tsvs(tmp_path, 'disease')
+    cached = io.read_tsvs(tmp_path, 'disease', cache=True)
+    with warnings.catch_warnings():
+        warnings.simplefilter('error')
+        pd.testing.assert_frame_equal(cached, df)
+
+
+def test_read_tsvs_cache_shared(tmp_path):
+    # Files with the same name in two paths sharing a cache stay separate
+    for name, copies in (('a', [3, 1]), ('b', [7, 5])):
+        (tmp_path / name).mkdir()
+        pd.DataFrame({
+            'clone_id': [1, 2],
+            'subject': ['S1', 'S1'],
+            'copies': copies,
+            'avg_v_identity': [.9, .95],
+        }).to_csv(tmp_path / name / 'S1.D1.pooled.tsv', sep='\t', index=False)
+
+    cache = tmp_path / 'cache'
+    for _ in range(2):
+        for name, copies in (('a', [3, 1]), ('b', [7, 5])):
+            df = io.read_tsvs(tmp_path / name, 'disease', cache=cache)
+            assert list(df['copies']) == copies
+    assert len(list(cache.glob('*.feather'))) == 2
@@ -0,0 +1,46 @@
+import pandas as pd
+import pytest
+
+from hicutils.core.keys import clone_keys, key_labels
+
+DF = pd.DataFrame({
+    'cdr3_aa': ['CAR', 'CAS', 'CAR', None, 'CAS', 'CAR'],
+    'v_gene': ['V2', 'V1', 'V2', 'V1', 'V1', 'V1'],
+})
+
+
+@pytest.mark.parametrize('features', [
+    'cdr3_aa',
+    ['v_gene'],
+    ['cdr3_aa', 'v_gene'],
+    ['v_gene', 'cdr3_aa'],
+])
+def test_clone_keys(features):
+    keys, clones = clone_keys(DF, features)
+    groups = DF.groupby(features)
+    assert list(keys) == list(groups.ngroup().fillna(-1).astype(int))
+    assert clones.equals(groups.size().index)
+
+    unsorted, unsorted_clones = clone_keys(DF, features, sort=False)
+    valid = keys >= 0
+    assert unsorted_clones[unsorted[valid]].equals(clones[keys[valid]])
+
+
+def test_clone_keys_dropna():
+    keys, clones = clone_keys(DF, ['cdr3_aa', 'v_gene'], dropna=False)
+    assert (keys >= 0).all()
+    assert list(key_labels(clones)) == [
+        'CAR V1', 'CAR V2', 'CAS V1', 'nan V1'
+    ]
+    assert list(key_labels(clones, sep='|')[keys]) == [
+        'CAR|V2', 'CAS|V1', 'CAR|V2', 'nan|V1', 'CAS|V1', 'CAR|V1'
+    ]
+
+
+@pytest.mark.parametrize('features', ['v_gene', ['cdr3_aa', 'v_gene']])
+def test_clone_keys_categorical(features):
+    # Categorical columns, e.g. from typed reads, give plain clone values
+    keys, clones = clone_keys(DF.astype('category'), features)
+    expected_keys, expected = clone_keys(DF, features)
+    assert list(keys) == list(expected_keys)
+    pd.testing.assert_index_equal(clones, expected, exact=True)
@@ -0,0 +1,59 @@
+import itertools
+import pytest
+
+import numpy as np
+import pandas as pd
+from hicutils.core import io, matrix
+from hicutils.core.matrix import CloneMatrix
+
+
+DF = io.read_tsvs('tests/input', 'disease')
+
+
+@pytest.mark.parametrize(
+    'pool,features,values',
+    [
+        ('subject', ['clone_id'], 'copies'),
+        ('disease', ['cdr3_aa', 'v_gene'], 'clones'),
+    ]
+)
+def test_clone_matrix(pool, features, values):
+    m = CloneMatrix.from_df(DF, pool, features, values)
+    pdf = DF.pivot_table(
+        index=features, columns=pool, values=values, aggfunc='sum'
+    )
+
+    pd.testing.assert_frame_equal(
+        m.to_frame(np.nan), pdf, check_dtype=False, check_names=False
+    )
+    presence = (pdf / pdf)
+    assert (m.pool_counts() == presence.sum(axis=1)).all()
+    assert (m.clone_counts() == presence.sum()).all()
+    assert (m.pool_totals() == pdf.sum()).all()
+    assert np.allclose(m.normalize().pool_totals(), 1)
+    assert len(m.filter_pools(2).clones) == (presence.sum(axis=1) >= 2).sum()
+
+
+@pytest.mark.parametrize('metric', matrix.SIMILARITY_METRICS)
+def test_similarity_matrix(metric):
+    sim = matrix.similarity_matrix(DF, 'subject', metric,
+                                   clone_features='cdr3_aa')
+    pdf = DF.pivot_table(
+        index='cdr3_aa', columns='subject', values='copies', aggfunc='sum'
+    ).fillna(0)
+    freqs = pdf / pdf.sum()
+
+    assert np.allclose(sim, sim.T)
+    for a, b in itertools.combinations(pdf.columns, 2):
+        shared = (pdf[a] > 0) & (pdf[b] > 0)
+        expected = {
+            'shared': shared.sum(),
+            'jaccard': shared.sum() / ((pdf[a] > 0) | (pdf[b] > 0)).sum(),
+            'morisita_horn': 2 * (freqs[a] * freqs[b]).sum() / (
+                (freqs[a] ** 2).sum() + (freqs[b] ** 2).sum()
+            ),
+            'copies': np.sqrt(
+                freqs[a][shared].sum() * freqs[b][shared].sum()
+            ),
+        }[metric]
+        assert np.isclose(sim.loc[a, b], expected)
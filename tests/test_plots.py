@@ -1,10 +1,13 @@
 import itertools
 import pytest
+from concurrent.futures import ThreadPoolExecutor
 
 import numpy as np
+import pandas as pd
 from hicutils.core import io
 import hicutils.plots as plots
 import matplotlib.pyplot as plt
+from matplotlib.figure import Figure
 
 from .expected import is_expected
 
@@ -38,6 +41,11 @@ def test_cdr3_logo(by, length):
     plt.savefig(f'{path}.pdf', bbox_inches='tight')
 
 
+def test_cdr3_logo_no_cdr3s():
+    with pytest.raises(ValueError, match='No CDR3s of length 1000'):
+        plots.plot_cdr3_logo(DF, 'cdr3_aa', 1000)
+
+
 @pytest.mark.parametrize(
     'color_top',
     [5, 10, 20]
@@ -79,6 +87,21 @@ def test_plot_ranges(intervals):
     plt.savefig(path + '.pdf', bbox_inches='tight')
 
 
+def test_plot_ranges_multi_file_pool():
+    # Each disease spans several files, each sorted by copies on its own, so
+    # ranking by position within the pool would differ from ranking by copies
+    _, pdf = plots.plot_ranges(DF, 'disease', (10, 100))
+    plt.close('all')
+    for label, row in pdf.iterrows():
+        copies = np.sort(
+            DF[DF.disease == label.rsplit(' (', 1)[0]].copies.to_numpy()
+        )[::-1]
+        expected = np.array([
+            copies[:10].sum(), copies[10:100].sum(), copies[100:].sum()
+        ]) / -copies.sum()
+        np.testing.assert_allclose(row.to_numpy(), expected)
+
+
 @pytest.mark.parametrize(
     'size_metric',
     ['clones', 'copies']
@@ -164,3 +187,94 @@ def test_upset(pool_by, size, clone_features):
                               clone_features=clone_features)
     is_expected(pdf, path + '.tsv')
     plt.savefig(path + '.pdf', bbox_inches='tight')
+
+
+@pytest.mark.parametrize(
+    'func,kwargs',
+    [
+        (plots.plot_cdr3_logo, {'by': 'cdr3_aa', 'length': 10}),
+        (plots.plot_cdr3_spectratype, {'color_top': 5}),
+        (plots.plot_ranges, {'pool': POOL}),
+        (plots.plot_rarefaction, {'pool': POOL}),
+        (plots.plot_shm_distribution, {'pool': POOL, 'size_metric': 'copies'}),
+        (plots.plot_shm_aggregate, {'pool': POOL}),
+        (plots.plot_shm_range, {'pool': POOL}),
+        (plots.plot_top_clones, {'cutoff': 10}),
+    ]
+)
+def test_explicit_axes(func, kwargs, tmp_path):
+    _, expected = func(DF, **kwargs)
+    plt.close('all')
+
+    def render(i):
+        fig = Figure()
+        g, pdf = func(DF, ax=fig.subplots(), **kwargs)
+        io.save_fig_and_data(str(i), pdf, tmp_path, 'png', fig=g)
+        return pdf
+
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        results = list(pool.map(render, range(4)))
+    assert plt.get_fignums() == []
+    for i, pdf in enumerate(results):
+        assert pdf.equals(expected)
+        assert (tmp_path / f'{i}.png').exists()
+
+
+@pytest.mark.parametrize(
+    'size_metric,chunksize',
+    [('clones', 100), ('copies', 1000)]
+)
+def test_gene_usage_chunked(size_metric, chunksize):
+    expected = plots.compute_gene_usage(DF, POOL, 'v_gene', size_metric)
+    pdf = plots.compute_gene_usage(
+        io.iter_tsvs('tests/input', 'disease', chunksize=chunksize),
+        POOL, 'v_gene', size_metric
+    )
+    pd.testing.assert_frame_equal(pdf, expected, check_dtype=False)
+
+
+# A typed read restricted to some subjects so categorical columns have
+# unobserved categories
+TYPED = io.read_tsvs('tests/input', 'disease', typed=True)
+TYPED = TYPED[TYPED.subject != 'HPAP041']
+
+# Every plot function with arguments which produce a plot of the test data
+PLOTS = [
+    (plots.plot_cdr3_aa_usage, {'pool': POOL}),
+    (plots.plot_cdr3_logo, {'by': 'cdr3_aa', 'length': 10}),
+    (plots.plot_cdr3_spectratype, {'color_top': 5}),
+    (plots.plot_gene_usage, {'pool': POOL, 'gene': 'v_gene'}),
+    (plots.plot_gene_usage, {'pool': 'disease', 'gene': 'j_gene',
+                             'size_metric': 'copies'}),
+    (plots.plot_clone_sizes, {'cutoff': 3}),
+    (plots.plot_top_clones, {'cutoff': 10}),
+    (plots.plot_ranges, {'pool': POOL}),
+    (plots.plot_rarefaction, {'pool': POOL}),
+    (plots.plot_strings, {'pool': POOL, 'only_overlapping': False}),
+    (plots.plot_upset, {'pool': 'disease'}),
+    (plots.plot_similarity, {'pool': POOL}),
+    (plots.plot_shm_distribution, {'pool': POOL, 'size_metric': 'copies'}),
+    (plots.plot_shm_aggregate, {'pool': POOL}),
+    (plots.plot_shm_range, {'pool': POOL}),
+]
+
+
+@pytest.mark.parametrize('func,kwargs', PLOTS)
+def test_typed_input(func, kwargs):
+    _, pdf = func(TYPED, **kwargs)
+    _, expected = func(DF[DF.subject != 'HPAP041'], **kwargs)
+    plt.close('all')
+    # Fields passed through from the input keep their types
+    pd.testing.assert_frame_equal(
+        pdf, expected, check_dtype=False, check_categorical=False
+    )
+
+
+@pytest.mark.parametrize('func,kwargs', PLOTS)
+def test_save_parquet(func, kwargs, tmp_path):
+    g, pdf = func(DF, **kwargs)
+    io.save_fig_and_data('plot', pdf, tmp_path, 'png', fig=g,
+                         data_format='parquet')
+    plt.close('all')
+    saved = pd.read_parquet(tmp_path / 'plot.parquet')
+    assert saved.shape == pdf.shape
@@ -0,0 +1,115 @@
+import pytest
+
+import numpy as np
+import pandas as pd
+from hicutils.core import io, pooling
+
+
+DF = io.read_tsvs('tests/input', 'disease')
+
+
+@pytest.mark.parametrize(
+    'pool',
+    ['subject', ['subject', 'disease']]
+)
+def test_pool_by(pool):
+    df = DF.rename({'disease': 'METADATA_disease'}, axis=1)
+    pdf = pooling.pool_by(df, pool)
+
+    assert not pdf.duplicated(['subject', 'clone_id']).any()
+    assert pdf.copies.sum() == df.copies.sum()
+    assert np.allclose(pdf.groupby('subject').copies_fraction.sum(), 1)
+
+    weighted = (
+        (df.avg_v_identity * df.copies).groupby(df.clone_id).sum()
+        / df.groupby('clone_id').copies.sum()
+    )
+    assert np.allclose(
+        pdf.set_index('clone_id').avg_v_identity,
+        weighted.loc[pdf.clone_id]
+    )
+
+    top = df[df.copies == df.groupby('clone_id').copies.transform('max')]
+    top = set(zip(top.clone_id, top.top_copy_seq))
+    assert all(
+        (c, s) in top for c, s in zip(pdf.clone_id, pdf.top_copy_seq)
+    )
+
+
+@pytest.mark.parametrize(
+    'pool,n_jobs',
+    [
+        ('subject', 2),
+        (['subject', 'disease'], 3),
+    ]
+)
+def test_pool_by_parallel(pool, n_jobs):
+    df = DF.rename({'disease': 'METADATA_disease'}, axis=1)
+    pd.testing.assert_frame_equal(
+        pooling.pool_by(df, pool, n_jobs=n_jobs),
+        pooling.pool_by(df, pool)
+    )
+
+
+@pytest.mark.parametrize('n_jobs', [1, 2])
+def test_pool_by_null_key(n_jobs):
+    df = DF.assign(
+        METADATA_tissue=np.where(np.arange(len(DF)) % 2, 'SPL', None)
+    )
+    pdf = pooling.pool_by(df, ['subject', 'tissue'], n_jobs=n_jobs)
+    nulls = pdf.tissue[pdf.tissue.isna()]
+    assert len(nulls) and all(isinstance(v, float) for v in nulls)
+
+
+def test_pool_state(tmp_path):
+    df = DF.rename({'disease': 'METADATA_disease'}, axis=1)
+    state = pooling.PoolState('disease')
+    state.update(df.iloc[::2]).update(df.iloc[1::2])
+    state.save(tmp_path / 'state.pkl')
+
+    pdf = pooling.PoolState.load(tmp_path / 'state.pkl').to_frame()
+    expected = pooling.pool_by(df, 'disease')
+    assert list(pdf.columns) == list(expected.columns)
+    for col in ('clone_id', 'disease', 'copies', 'instances'):
+        pd.testing.assert_series_equal(pdf[col], expected[col])
+    for col in ('avg_v_identity', 'copies_fraction'):
+        pd.testing.assert_series_equal(pdf[col], expected[col],
+                                       check_exact=False)
+
+
+def _replicates():
+    # Two replicates of every clone with different top copy rows and null
+    # fields so pooled fields come from several rows
+    df = DF.rename({'disease': 'METADATA_disease'}, axis=1)
+    rep = df.assign(copies=df['copies'].to_numpy()[::-1])
+    df = pd.concat([df, rep], ignore_index=True)
+    df.loc[df.index % 3 == 0, 'v_gene'] = None
+    df.loc[df.index % 4 == 0, 'cdr3_aa'] = None
+    return df
+
+
+@pytest.mark.parametrize('splits', [1, 2, 5])
+def test_pool_state_fields(splits):
+    df = _replicates()
+    state = pooling.PoolState('disease')
+    for chunk in np.array_split(np.arange(len(df)), splits):
+        state.update(df.iloc[chunk])
+    pd.testing.assert_frame_equal(
+        state.to_frame(), pooling.pool_by(df, 'disease'), check_exact=False
+    )
+
+
+def test_pool_state_missing_fields():
+    df = _replicates()
+    half = len(df) // 2
+    later = df.iloc[half:].drop('v_gene', axis=1)
+    state = pooling.PoolState('disease').update(df.iloc[:half]).update(later)
+
+    expected = df.copy()
+    expected.loc[expected.index >= half, 'v_gene'] = None
+    pd.testing.assert_frame_equal(
+        state.to_frame(), pooling.pool_by(expected, 'disease'),
+        check_exact=False
+    )
+    with pytest.raises(AssertionError, match='copies'):
+        state.update(later.drop('copies', axis=1))
@@ -0,0 +1,64 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from hicutils.core.ranks import clone_ranks, dx, top_clones, top_fraction
+import hicutils.plots as plots
+
+DF = pd.DataFrame({
+    'subject': ['A', 'B', 'A', 'A', None, 'B', 'A'],
+    'copies': [5, 10, 20, 5, 7, 30, 70],
+})
+
+
+def test_clone_ranks():
+    ranks = clone_ranks(DF, 'subject')
+    assert list(ranks['rank']) == [3, 2, 2, 4, 0, 1, 1]
+    assert list(ranks['cumulative_copies']) == [95, 40, 90, 100, 7, 30, 70]
+    np.testing.assert_allclose(
+        ranks['cumulative_fraction'],
+        [.95, 1, .9, 1, np.nan, .75, .7]
+    )
+
+    ranks = clone_ranks(DF)
+    assert list(ranks['rank']) == [6, 4, 3, 7, 5, 2, 1]
+
+
+@pytest.mark.parametrize('pool', [None, 'subject'])
+@pytest.mark.parametrize('n', [1, 2, 10])
+def test_top_clones(pool, n):
+    expected = (
+        DF.dropna(subset=[pool] if pool else [])
+        .sort_values('copies', ascending=False, kind='stable')
+        .groupby(pool or (lambda _: 0)).head(n)
+    )
+    if pool:
+        expected = expected.sort_values(pool, kind='stable')
+    pd.testing.assert_frame_equal(top_clones(DF, n, pool), expected)
+
+
+def test_lookups():
+    ranks = clone_ranks(DF, 'subject')
+    assert top_fraction(ranks, 2, 'subject').to_dict() == {
+        'A': .9, 'B': 1.0
+    }
+    assert dx(ranks, 50, 'subject').to_dict() == {'A': 1, 'B': 1}
+    assert dx(ranks, 80, 'subject').to_dict() == {'A': 2, 'B': 2}
+    assert dx(clone_ranks(DF), 50) == 2
+
+
+def test_ranges_span_replicates():
+    # The second replicate's clones are larger than the first's so ranks
+    # interleave the replicates' rows
+    df = pd.DataFrame({
+        'subject': 'S',
+        'clone_id': [1, 2, 3, 4],
+        'copies': [5, 1, 9, 2],
+    })
+    pdf = plots.compute_ranges(df, 'subject', (1, 2))
+    expected = pd.DataFrame(
+        [[-9 / 17, -5 / 17, -3 / 17]],
+        index=pd.Index(['S (4)'], name='pool'),
+        columns=pd.Index(['1-1', '2-2', '3+'], name='range')
+    )
+    pd.testing.assert_frame_equal(pdf, expected)
@@ -0,0 +1,51 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from hicutils.core import io
+from hicutils.core.sampling import subsample
+
+
+@pytest.mark.parametrize('depth', [None, 1000])
+def test_subsample(depth):
+    df = io.read_tsvs('tests/input', 'disease')
+    totals = df.groupby('subject').copies.sum()
+    sampled = subsample(df, 'subject', depth, seed=1)
+
+    depth = depth or totals.min()
+    assert (sampled.groupby('subject').copies.sum() == depth).all()
+    np.testing.assert_allclose(
+        sampled.groupby('subject').copies_percent.sum(), 100
+    )
+
+    pd.testing.assert_frame_equal(
+        subsample(df, 'subject', depth, seed=1, n_jobs=2), sampled
+    )
+
+
+def test_subsample_replicates():
+    df = pd.DataFrame({
+        'subject': ['A'] * 3 + ['B'] * 2,
+        'copies': [100, 50, 10, 5, 1],
+    })
+    sampled = subsample(df, 'subject', 20, replicates=4, seed=2)
+    # B is too shallow to be sampled
+    assert set(sampled['subject']) == {'A'}
+    assert (sampled.groupby('subsample').copies.sum() == 20).all()
+    assert (sampled['copies'] <= df.loc[sampled.index, 'copies']).all()
+    pd.testing.assert_frame_equal(
+        sampled[sampled.subsample == 0].drop('subsample', axis=1),
+        subsample(df, 'subject', 20, seed=2)
+    )
+
+
+def test_subsample_seed_sequence():
+    df = pd.DataFrame({
+        'subject': ['A'] * 3 + ['B'] * 2,
+        'copies': [100, 50, 10, 5, 1],
+    })
+    pd.testing.assert_frame_equal(
+        subsample(df, 'subject', 5, replicates=2,
+                  seed=np.random.SeedSequence(3)),
+        subsample(df, 'subject', 5, replicates=2, seed=3)
+    )